@@ -0,0 +1,64 @@
+'''Acting user and activity helpers shared by the action functions.
+
+The acting user is looked up once per action context and remembered in it,
+together with the ``context['user']`` it was looked up for, so the creator
+id, the activities and nested actions called with a copy of the context all
+reuse the same ``User`` object.
+'''
+
+import six
+
+NOT_LOGGED_IN = 'not logged in'
+
+_CACHE_KEY = '_sdbi_acting_user'
+
+
+def acting_user(context):
+    """The ``User`` of ``context['user']``, or None if there is none"""
+    user = context.get('user')
+    cached = context.get(_CACHE_KEY)
+    # A copied context may be reused with another user
+    if cached is not None and cached[0] == user:
+        return cached[1]
+
+    user_obj = None
+    if user:
+        # Set by CKAN for the logged in user, saves a query
+        auth_user_obj = context.get('auth_user_obj')
+        if auth_user_obj is not None and \
+                user in (auth_user_obj.name, auth_user_obj.id):
+            user_obj = auth_user_obj
+        else:
+            user_obj = context['model'].User.by_name(six.ensure_text(user))
+    context[_CACHE_KEY] = (user, user_obj)
+    return user_obj
+
+
+def acting_user_id(context):
+    """Id of the acting user as recorded in activities"""
+    user_obj = acting_user(context)
+    return user_obj.id if user_obj else NOT_LOGGED_IN
+
+
+def add_package_activity(context, pkg, activity_type):
+    """Add a ``new`` or ``changed`` activity for a package to the session
+
+    Returns the activity, or None when there is nothing to record.
+    """
+    activity = pkg.activity_stream_item(activity_type, acting_user_id(context))
+    if activity is not None:
+        context['model'].Session.add(activity)
+    return activity
+
+
+def new_package_activity(context, pkg, pkg_dict):
+    """A ``new package`` activity for an already dictized dataset
+
+    Same as ``pkg.activity_stream_item('new', ...)``, but stores the given
+    dict instead of running a package_show for it. Not added to the session.
+    """
+    user_obj = acting_user(context)
+    return context['model'].Activity(
+        acting_user_id(context), pkg.id, 'new package',
+        {'package': pkg_dict,
+         'actor': user_obj.name if user_obj else None})
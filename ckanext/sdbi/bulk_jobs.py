@@ -0,0 +1,176 @@
+'''Organization bulk updates as background jobs.
+
+``bulk_update_private``, ``bulk_update_public`` and ``bulk_update_delete``
+normally update the database and reindex every dataset inside the request.
+With ``background: true`` in the data dict, or
+``ckanext.sdbi.bulk.background = true``, they only check access, queue a job
+and return its id. The job works through the datasets in chunks of
+``ckanext.sdbi.bulk.chunk_size`` and records after each chunk how far it
+got in a Redis hash, which ``bulk_update_status`` reads to report the
+progress, rate and ETA. A job that is queued again with the same id (see
+:py:func:`resume` and the ``bulk_update_resume`` action) carries on after
+the last finished chunk.
+'''
+
+import json
+import logging
+import time
+import uuid
+
+import ckan.model as model
+from ckan.common import asbool, config
+
+from ckanext.sdbi import bulk
+
+log = logging.getLogger(__name__)
+
+PROGRESS_TTL = 7 * 24 * 3600
+# Fields of the progress hash returned by status()
+STATUS_FIELDS = ('action', 'org_id', 'state', 'total', 'done', 'error',
+                 'created', 'finished')
+
+
+def in_background(data_dict):
+    background = data_dict.get('background')
+    if background is None:
+        background = config.get('ckanext.sdbi.bulk.background', False)
+    return asbool(background)
+
+
+def _key(job_id):
+    return '%s:sdbi:bulk-job:%s' % (config.get('ckan.site_id'), job_id)
+
+
+def _redis():
+    from ckan.lib.redis import connect_to_redis
+    return connect_to_redis()
+
+
+def _decode(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def _save(redis, job_id, **fields):
+    key = _key(job_id)
+    pipe = redis.pipeline()
+    for name, value in fields.items():
+        pipe.hset(key, name, value)
+    pipe.expire(key, PROGRESS_TTL)
+    pipe.execute()
+
+
+def _load(redis, job_id):
+    return dict((_decode(name), _decode(value))
+                for name, value in redis.hgetall(_key(job_id)).items())
+
+
+def enqueue(context, data_dict, action, update_dict):
+    """Queue a bulk update of the datasets of an organization
+
+    Access must have been checked by the caller. Returns the job id and
+    the number of datasets to update.
+    """
+    datasets = list(data_dict.get('datasets') or [])
+    job_id = str(uuid.uuid4())
+    redis = _redis()
+    _save(redis, job_id,
+          action=action,
+          org_id=data_dict.get('org_id') or '',
+          user=context.get('user') or '',
+          datasets=json.dumps(datasets),
+          update=json.dumps(update_dict),
+          chunk_size=bulk.chunk_size(data_dict),
+          state='queued',
+          total=len(datasets),
+          done=0,
+          created=time.time())
+    _enqueue_job(job_id, action, data_dict.get('org_id'))
+    return {'job_id': job_id, 'state': 'queued', 'total': len(datasets)}
+
+
+def _enqueue_job(job_id, action, org_id):
+    import ckan.lib.jobs as jobs
+    jobs.enqueue(bulk_update_job, [job_id],
+                 title='Bulk %s of datasets of %s' % (action, org_id))
+
+
+def resume(job_id):
+    """Queue an interrupted or failed job again, keeping its progress"""
+    redis = _redis()
+    progress = _load(redis, job_id)
+    if not progress or progress.get('state') == 'done':
+        return False
+    _save(redis, job_id, state='queued', error='', finished='')
+    _enqueue_job(job_id, progress['action'], progress['org_id'])
+    return True
+
+
+def status(job_id):
+    """Progress of a job, or None if there is no such job
+
+    ``rate`` is in datasets per second since the job (last) started and
+    ``eta`` in seconds; both are None until the first chunk is done.
+    """
+    progress = _load(_redis(), job_id)
+    if not progress:
+        return None
+
+    result = dict((name, progress.get(name)) for name in STATUS_FIELDS)
+    result['id'] = job_id
+    result['total'] = int(result['total'] or 0)
+    result['done'] = int(result['done'] or 0)
+    for name in ('created', 'finished'):
+        result[name] = float(result[name]) if result[name] else None
+
+    rate = eta = None
+    if progress.get('started'):
+        processed = result['done'] - int(progress.get('started_done') or 0)
+        end = result['finished'] or time.time()
+        elapsed = end - float(progress['started'])
+        if processed > 0 and elapsed > 0:
+            rate = processed / elapsed
+            eta = (result['total'] - result['done']) / rate
+    result['rate'] = round(rate, 2) if rate is not None else None
+    result['eta'] = round(eta, 1) if eta is not None else None
+    return result
+
+
+def bulk_update_job(job_id):
+    """Background job running a queued bulk update chunk by chunk"""
+    from ckanext.sdbi import update
+
+    redis = _redis()
+    progress = _load(redis, job_id)
+    if not progress:
+        log.warning(f"Bulk update job {job_id} has no progress record, "
+                    f"nothing to do")
+        return
+
+    datasets = json.loads(progress['datasets'])
+    update_dict = json.loads(progress['update'])
+    size = int(progress.get('chunk_size') or bulk.DEFAULT_CHUNK_SIZE)
+    done = int(progress.get('done') or 0)
+    # Access was checked when the job was queued
+    context = {'model': model, 'session': model.Session,
+               'user': progress.get('user'), 'ignore_auth': True}
+
+    _save(redis, job_id, state='running', started=time.time(),
+          started_done=done)
+    try:
+        for start in range(done, len(datasets), size):
+            chunk = datasets[start:start + size]
+            update._bulk_update_dataset(
+                dict(context),
+                {'datasets': chunk, 'org_id': progress['org_id']},
+                update_dict)
+            _save(redis, job_id, done=start + len(chunk))
+    except Exception as e:
+        model.Session.rollback()
+        log.error(f"Bulk update job {job_id} failed: {str(e)}")
+        _save(redis, job_id, state='error', error=str(e),
+              finished=time.time())
+        raise
+    finally:
+        model.Session.remove()
+
+    _save(redis, job_id, state='done', finished=time.time())
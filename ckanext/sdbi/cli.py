@@ -0,0 +1,30 @@
+'''``ckan sdbi`` commands.'''
+
+import click
+
+import ckan.model as model
+
+
+@click.group(short_help='SDBI commands')
+def sdbi():
+    """SDBI commands"""
+    pass
+
+
+@sdbi.command('init-db', short_help='Add the columns SDBI needs')
+def init_db():
+    """Add the columns SDBI needs to the google_forms table
+
+    Safe to run more than once; run it after installing or upgrading the
+    extension.
+    """
+    from sqlalchemy import text
+    model.Session.execute(text("""
+        ALTER TABLE google_forms ADD COLUMN IF NOT EXISTS targeting TEXT
+    """))
+    model.Session.commit()
+    click.secho('google_forms table is up to date', fg='green')
+
+
+def get_commands():
+    return [sdbi]
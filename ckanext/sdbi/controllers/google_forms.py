@@ -1,8 +1,10 @@
 from flask import Blueprint, render_template, request, abort
+from werkzeug.exceptions import HTTPException
 import ckan.model as model
 import logging
 import ckan.authz as authz
 import ckan.lib.base as base
+from ckanext.sdbi import targeting
 
 # Create Flask Blueprint
 google_forms_blueprint = Blueprint('google_forms', __name__)
@@ -84,18 +86,40 @@ def delete(id):
 
 @google_forms_blueprint.route('/api/google-forms/exit-intent')
 def get_exit_intent_forms():
-    """Get Google Forms with exit intent enabled"""
+    """Get Google Forms with exit intent enabled
+
+    When the client passes the current ``path`` (and optionally the query
+    string as ``search``), only the forms whose targeting rules match that
+    page are returned.
+    """
     try:
         from sqlalchemy import text
         result = model.Session.execute(text("""
-            SELECT id, title, description, form_url, category, status, exit_intent, created_at
+            SELECT id, title, description, form_url, category, status, exit_intent, created_at,
+                   targeting
             FROM google_forms 
             WHERE exit_intent = true AND status = 'active'
             ORDER BY created_at DESC
         """))
-        
+
+        path = request.args.get('path')
+        page = None
+        if path is not None:
+            from urllib.parse import parse_qsl
+            from werkzeug.datastructures import MultiDict
+            query_args = MultiDict(
+                parse_qsl(request.args.get('search', '').lstrip('?')))
+            visitor = request.remote_addr or ''
+            visitor += request.headers.get('User-Agent', '')
+            page = targeting.page_context(
+                path, query_args, visitor, _lookup_page_facets)
+
         forms = []
         for row in result:
+            if page is not None:
+                matcher = targeting.get_matcher(str(row[0]), row[8])
+                if not matcher(page):
+                    continue
             forms.append({
                 'id': str(row[0]),
                 'title': row[1],
@@ -113,6 +137,33 @@ def get_exit_intent_forms():
         log.error(f"Get exit intent forms error: {str(e)}")
         return {'success': False, 'error': str(e)}, 500
 
+def _lookup_page_facets(path):
+    """Get the organization, jenis and fase values of the page's dataset"""
+    parts = [p for p in path.split('/') if p]
+    if len(parts) >= 2 and parts[0] == 'organization':
+        return {'organization': [parts[1]]}
+    if len(parts) < 2 or parts[0] != 'dataset':
+        return {}
+
+    from sqlalchemy import text
+    result = model.Session.execute(text("""
+        SELECT g.name, pe.key, pe.value
+        FROM package p
+        LEFT JOIN "group" g ON g.id = p.owner_org
+        LEFT JOIN package_extra pe ON pe.package_id = p.id
+            AND pe.key IN ('jenis', 'fase') AND pe.state = 'active'
+        WHERE p.name = :name OR p.id = :name
+    """), {'name': parts[1]})
+
+    facets = {}
+    for org_name, key, value in result:
+        if org_name:
+            facets.setdefault('organization', set()).add(org_name)
+        if key and value:
+            facets.setdefault(key, set()).update(
+                targeting.extra_values(value))
+    return facets
+
 def _save_form():
     """Save new Google Form to database"""
     try:
@@ -125,13 +176,20 @@ def _save_form():
         
         if not title or not form_url:
             abort(400, description='Title and Form URL are required')
+
+        try:
+            rules = targeting.rules_from_form(request.form)
+        except ValueError as e:
+            abort(400, description=str(e))
         
         # Insert into database
         from sqlalchemy import text
         from datetime import datetime
         result = model.Session.execute(text("""
-            INSERT INTO google_forms (title, description, form_url, category, status, exit_intent, created_at)
-            VALUES (:title, :description, :form_url, :category, :status, :exit_intent, :created_at)
+            INSERT INTO google_forms (title, description, form_url, category, status, exit_intent, created_at,
+                                      targeting)
+            VALUES (:title, :description, :form_url, :category, :status, :exit_intent, :created_at,
+                    :targeting)
             RETURNING id
         """), {
             'title': title,
@@ -140,7 +198,8 @@ def _save_form():
             'category': category,
             'status': status,
             'exit_intent': exit_intent,
-            'created_at': datetime.utcnow()
+            'created_at': datetime.utcnow(),
+            'targeting': targeting.dump_rules(rules)
         })
         
         form_id = result.fetchone()[0]
@@ -150,6 +209,9 @@ def _save_form():
         from flask import redirect, url_for
         return redirect(f'/google-forms/view/{form_id}')
         
+    except HTTPException:
+        # abort() for invalid input, keep its status code
+        raise
     except Exception as e:
         log.error(f"Save form error: {str(e)}")
         abort(500, description='Internal server error')
@@ -166,13 +228,19 @@ def _update_form(id):
         
         if not title or not form_url:
             abort(400, description='Title and Form URL are required')
+
+        try:
+            rules = targeting.rules_from_form(request.form)
+        except ValueError as e:
+            abort(400, description=str(e))
         
         # Update database
         from sqlalchemy import text
         model.Session.execute(text("""
             UPDATE google_forms 
             SET title = :title, description = :description, form_url = :form_url, 
-                category = :category, status = :status, exit_intent = :exit_intent
+                category = :category, status = :status, exit_intent = :exit_intent,
+                targeting = :targeting
             WHERE id = :id
         """), {
             'id': id,
@@ -181,7 +249,8 @@ def _update_form(id):
             'form_url': form_url,
             'category': category,
             'status': status,
-            'exit_intent': exit_intent
+            'exit_intent': exit_intent,
+            'targeting': targeting.dump_rules(rules)
         })
         
         model.Session.commit()
@@ -190,6 +259,9 @@ def _update_form(id):
         from flask import redirect
         return redirect(f'/google-forms/view/{id}')
         
+    except HTTPException:
+        # abort() for invalid input, keep its status code
+        raise
     except Exception as e:
         log.error(f"Update form error: {str(e)}")
         abort(500, description='Internal server error')
@@ -199,7 +271,8 @@ def _get_all_forms():
     try:
         from sqlalchemy import text
         result = model.Session.execute(text("""
-            SELECT id, title, description, form_url, category, status, exit_intent, created_at
+            SELECT id, title, description, form_url, category, status, exit_intent, created_at,
+                   targeting
             FROM google_forms 
             ORDER BY created_at DESC
         """))
@@ -214,7 +287,8 @@ def _get_all_forms():
                 'category': row[4],
                 'status': row[5],
                 'exit_intent': row[6],
-                'created_at': row[7]
+                'created_at': row[7],
+                'targeting': _safe_rules(row[8])
             })
         
         return forms
@@ -228,7 +302,8 @@ def _get_form_by_id(id):
     try:
         from sqlalchemy import text
         result = model.Session.execute(text("""
-            SELECT id, title, description, form_url, category, status, exit_intent, created_at
+            SELECT id, title, description, form_url, category, status, exit_intent, created_at,
+                   targeting
             FROM google_forms 
             WHERE id = :id
         """), {'id': id})
@@ -243,11 +318,19 @@ def _get_form_by_id(id):
                 'category': row[4],
                 'status': row[5],
                 'exit_intent': row[6],
-                'created_at': row[7]
+                'created_at': row[7],
+                'targeting': _safe_rules(row[8])
             }
         
         return None
         
     except Exception as e:
         log.error(f"Get form by ID error: {str(e)}")
-        return None 
\ No newline at end of file
+        return None
+
+def _safe_rules(raw):
+    """Parse stored targeting rules for display, ignoring bad values"""
+    try:
+        return targeting.parse_rules(raw)
+    except (ValueError, TypeError):
+        return {}
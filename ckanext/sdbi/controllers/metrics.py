@@ -0,0 +1,25 @@
+from flask import Blueprint, request, abort
+from flask import make_response as response
+import logging
+from ckan.common import config
+from ckanext.sdbi import metrics
+
+# Create Flask Blueprint
+metrics_blueprint = Blueprint('sdbi_metrics', __name__)
+
+log = logging.getLogger(__name__)
+
+@metrics_blueprint.route('/sdbi/metrics')
+def index():
+    """Expose the extension's metrics in Prometheus text format
+
+    If ``ckanext.sdbi.metrics.token`` is set, scrapers must send it as
+    ``Authorization: Bearer <token>``.
+    """
+    token = config.get('ckanext.sdbi.metrics.token')
+    if token and request.headers.get('Authorization') != 'Bearer %s' % token:
+        abort(403, description='Access denied.')
+
+    resp = response(metrics.render())
+    resp.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return resp
@@ -1,14 +1,21 @@
 import logging
 import json
+import time
 from datetime import datetime
 from ckan import model
 from ckan.plugins import toolkit
 from flask import request
 from flask import make_response as response
 from ckan.common import _
+from ckanext.sdbi.tracking_stats import stats
 
 log = logging.getLogger(__name__)
 
+# Limits for the batched beacon endpoint
+BATCH_MAX_EVENTS = 100
+BATCH_MAX_URL_LENGTH = 2000
+BATCH_TRACKING_TYPES = ('page', 'resource', 'exit')
+
 class TrackingController:
     """
     Custom tracking controller untuk CKAN SDBI
@@ -29,22 +36,21 @@ class TrackingController:
                 resp.status_code = 400
                 return resp
             
-            # Log tracking request
-            log.info(f"Tracking request: {url} ({tracking_type})")
-            
             # Insert into tracking_raw table
             from ckan.model.tracking import TrackingRaw
             
             tracking_raw = TrackingRaw(
+                user_key=self._user_key(),
                 url=url,
                 tracking_type=tracking_type,
                 access_timestamp=datetime.utcnow()
             )
             
             model.Session.add(tracking_raw)
+            started = time.perf_counter()
             model.Session.commit()
-            
-            log.info(f"Tracking data saved: {url}")
+            stats.hit('track', url, tracking_type,
+                      flush_seconds=time.perf_counter() - started)
             
             # Return success response
             resp = response(json.dumps({
@@ -58,7 +64,8 @@ class TrackingController:
             return resp
             
         except Exception as e:
-            log.error(f"Tracking error: {str(e)}")
+            model.Session.rollback()
+            stats.error('track', e)
             resp = response(json.dumps({'error': str(e)}))
             resp.status_code = 500
             return resp
@@ -66,30 +73,29 @@ class TrackingController:
     def track_page(self):
         """Track page view with GET request"""
         try:
-            url = request.params.get('url', '')
-            tracking_type = request.params.get('type', 'page')
+            url = request.args.get('url', '')
+            tracking_type = request.args.get('type', 'page')
             
             if not url:
                 resp = response(json.dumps({'error': 'URL is required'}))
                 resp.status_code = 400
                 return resp
             
-            # Log tracking request
-            log.info(f"Page tracking: {url} ({tracking_type})")
-            
             # Insert into tracking_raw table
             from ckan.model.tracking import TrackingRaw
             
             tracking_raw = TrackingRaw(
+                user_key=self._user_key(),
                 url=url,
                 tracking_type=tracking_type,
                 access_timestamp=datetime.utcnow()
             )
             
             model.Session.add(tracking_raw)
+            started = time.perf_counter()
             model.Session.commit()
-            
-            log.info(f"Page tracking saved: {url}")
+            stats.hit('track_page', url, tracking_type,
+                      flush_seconds=time.perf_counter() - started)
             
             # Return success response
             resp = response(json.dumps({
@@ -103,11 +109,142 @@ class TrackingController:
             return resp
             
         except Exception as e:
-            log.error(f"Page tracking error: {str(e)}")
+            model.Session.rollback()
+            stats.error('track_page', e)
             resp = response(json.dumps({'error': str(e)}))
             resp.status_code = 500
             return resp
     
+    def track_batch(self):
+        """Handle a batch of tracking events sent in one beacon
+
+        The body is a JSON array (or an object with an ``events`` array) of
+        ``{"url": ..., "type": ...}`` items. All events are validated first
+        and then inserted in a single transaction; nothing is saved if any
+        event is invalid.
+        """
+        try:
+            try:
+                payload = json.loads(request.get_data(as_text=True) or '[]')
+            except ValueError:
+                return self._error('Invalid JSON payload', 400)
+
+            if isinstance(payload, dict):
+                payload = payload.get('events', [])
+            if not isinstance(payload, list):
+                return self._error('Events must be a list', 400)
+            if len(payload) > BATCH_MAX_EVENTS:
+                return self._error(
+                    'At most %d events per batch' % BATCH_MAX_EVENTS, 400)
+
+            events = []
+            for index, event in enumerate(payload):
+                if not isinstance(event, dict):
+                    return self._error('Event %d is not an object' % index, 400)
+                url = event.get('url')
+                tracking_type = event.get('type', 'page')
+                if not url or not isinstance(url, str) or \
+                        len(url) > BATCH_MAX_URL_LENGTH:
+                    return self._error('Event %d has an invalid url' % index, 400)
+                if tracking_type not in BATCH_TRACKING_TYPES:
+                    return self._error('Event %d has an invalid type' % index, 400)
+                events.append((url, tracking_type))
+
+            if events:
+                from ckan.model.tracking import TrackingRaw
+
+                user_key = self._user_key()
+                now = datetime.utcnow()
+                model.Session.add_all([
+                    TrackingRaw(
+                        user_key=user_key,
+                        url=url,
+                        tracking_type=tracking_type,
+                        access_timestamp=now
+                    )
+                    for url, tracking_type in events
+                ])
+                started = time.perf_counter()
+                model.Session.commit()
+                stats.hit('track_batch', events[0][0], events[0][1],
+                          rows=len(events),
+                          flush_seconds=time.perf_counter() - started)
+
+            resp = response(json.dumps({
+                'success': True,
+                'count': len(events)
+            }))
+            resp.status_code = 200
+            return resp
+
+        except Exception as e:
+            model.Session.rollback()
+            stats.error('track_batch', e)
+            return self._error(str(e), 500)
+
+    def download(self, resource_id):
+        """Count a resource download and redirect to the resource URL
+
+        The hit is stored under ``download_tracking_url``, which the
+        dataset download counts include, so no client-side request is
+        needed. Failing to record the hit never blocks the download.
+        """
+        from flask import redirect
+        from ckan.lib.dictization import model_dictize
+
+        resource = model.Resource.get(resource_id)
+        if not resource or resource.state != 'active':
+            return toolkit.abort(404, _('Resource not found'))
+
+        context = {'model': model, 'session': model.Session,
+                   'user': toolkit.c.user}
+        try:
+            toolkit.check_access('resource_show', context, {'id': resource.id})
+        except toolkit.NotAuthorized:
+            return toolkit.abort(403, _('Unauthorized to read resource'))
+
+        url = model_dictize.resource_dictize(resource, context).get('url')
+        if not url:
+            return toolkit.abort(404, _('Resource has no URL'))
+
+        try:
+            from ckan.model.tracking import TrackingRaw
+            from ckanext.sdbi.plugin import download_tracking_url
+
+            tracked_url = download_tracking_url(resource.package_id,
+                                                resource.id)
+            model.Session.add(TrackingRaw(
+                user_key=self._user_key(),
+                url=tracked_url,
+                tracking_type='resource',
+                access_timestamp=datetime.utcnow()
+            ))
+            started = time.perf_counter()
+            model.Session.commit()
+            stats.hit('download', tracked_url, 'resource',
+                      flush_seconds=time.perf_counter() - started)
+        except Exception as e:
+            model.Session.rollback()
+            stats.error('download', e)
+
+        return redirect(url, code=302)
+
+    def _user_key(self):
+        """Anonymous visitor key, built the same way as CKAN's tracking"""
+        import hashlib
+        key = ''.join([
+            request.environ.get('HTTP_USER_AGENT', ''),
+            request.environ.get('REMOTE_ADDR', ''),
+            request.environ.get('HTTP_ACCEPT_LANGUAGE', ''),
+            request.environ.get('HTTP_ACCEPT_ENCODING', ''),
+        ])
+        return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def _error(self, message, status_code):
+        resp = response(json.dumps({'error': message}))
+        resp.status_code = status_code
+        return resp
+
     def get_downloads(self, dataset_name):
         """Get download count for a dataset"""
         try:
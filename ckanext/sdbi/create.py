@@ -5,13 +5,14 @@
 import logging
 import random
 import re
+from collections import OrderedDict
 from socket import error as socket_error
 import datetime
 
 import six
 
 import ckan.common
-from sqlalchemy import func
+from sqlalchemy import func, or_
 
 import ckan.lib.plugins as lib_plugins
 import ckan.logic as logic
@@ -27,12 +28,21 @@ import ckan.lib.mailer as mailer
 import ckan.lib.datapreview
 import ckan.lib.api_token as api_token
 import ckan.authz as authz
+from ckan.model.types import make_uuid
 
 from ckan.common import _, config
 
 # FIXME this looks nasty and should be shared better
 from ckan.logic.action.update import _update_package_relationship
 
+from ckanext.sdbi import activity
+from ckanext.sdbi import bulk
+from ckanext.sdbi import resource_views
+from ckanext.sdbi import responses
+from ckanext.sdbi import update
+from ckanext.sdbi import uploads
+from ckanext.sdbi import view_order
+
 log = logging.getLogger(__name__)
 
 # Define some shortcuts
@@ -128,6 +138,11 @@ def package_create(context, data_dict):
         option :ref:`ckan.auth.create_unowned_dataset` is set to ``True``.
     :type owner_org: string
 
+    :param return_mode: what to return, ``'show'``, ``'id'``, ``'saved'`` or
+        ``'changed'``, see :py:mod:`ckanext.sdbi.responses` (optional,
+        default: ``'show'``)
+    :type return_mode: string
+
     :returns: the newly created dataset (unless 'return_id_only' is set to True
               in the context, in which case just the dataset id will
               be returned)
@@ -135,8 +150,7 @@ def package_create(context, data_dict):
 
     '''
     model = context['model']
-    session = context['session']
-    user = context['user']
+    return_mode = responses.get_return_mode(context, data_dict)
 
     if 'type' not in data_dict:
         package_plugin = lib_plugins.lookup_package_plugin()
@@ -181,11 +195,9 @@ def package_create(context, data_dict):
         model.Session.rollback()
         raise ValidationError(errors)
 
-    if user:
-
-        user_obj = model.User.by_name(six.ensure_text(user))
-        if user_obj:
-            data['creator_user_id'] = user_obj.id
+    user_obj = activity.acting_user(context)
+    if user_obj:
+        data['creator_user_id'] = user_obj.id
 
     pkg = model_save.package_dict_save(data, context)
 
@@ -199,9 +211,9 @@ def package_create(context, data_dict):
     context_org_update = context.copy()
     context_org_update['ignore_auth'] = True
     context_org_update['defer_commit'] = True
-    _get_action('package_owner_org_update')(context_org_update,
-                                            {'id': pkg.id,
-                                             'organization_id': pkg.owner_org})
+    update.package_owner_org_update(context_org_update,
+                                    {'id': pkg.id,
+                                     'organization_id': pkg.owner_org})
 
     for item in plugins.PluginImplementations(plugins.IPackageController):
         item.create(pkg)
@@ -213,46 +225,240 @@ def package_create(context, data_dict):
     context.pop('schema', None)
 
     # Create default views for resources if necessary
-    if data.get('resources'):
-        logic.get_action('package_create_default_resource_views')(
-            {'model': context['model'], 'user': context['user'],
-             'ignore_auth': True},
-            {'package': data})
+    if data.get('resources') and not resource_views.in_background():
+        resource_views.create_default_views(context, data)
 
     # Create activity
-    if not pkg.private:
-        user_obj = model.User.by_name(user)
-        if user_obj:
-            user_id = user_obj.id
-        else:
-            user_id = 'not logged in'
-
-        activity = pkg.activity_stream_item('new', user_id)
-        session.add(activity)
-    
-    if pkg.private:
-        user_obj = model.User.by_name(user)
-        if user_obj:
-            user_id = user_obj.id
-        else:
-            user_id = 'not logged in'
-
-        activity = pkg.activity_stream_item('new', user_id)
-        session.add(activity)
+    activity.add_package_activity(context, pkg, 'new')
 
     if not context.get('defer_commit'):
         model.repo.commit()
 
-    return_id_only = context.get('return_id_only', False)
+    if data.get('resources') and resource_views.in_background():
+        resource_views.enqueue_default_views(context, data)
 
-    if return_id_only:
+    if return_mode == 'id':
         return pkg.id
+    if return_mode in ('saved', 'changed'):
+        # Everything is new, so everything changed
+        return responses.saved_package_dict(pkg, data)
 
     return _get_action('package_show')(
         context.copy(), {'id': pkg.id}
     )
 
 
+def package_create_many(context, data_dict):
+    '''Create many datasets (packages) at once, e.g. for harvest imports.
+
+    Every dataset is validated and checked for authorization like in
+    :py:func:`package_create`, but the acting user and the organizations are
+    looked up once, datasets are saved in chunks with one transaction per
+    chunk, activities and organization memberships are inserted in bulk and
+    the search index is updated with a single commit at the end.
+
+    A dataset that fails validation does not stop the others. If saving a
+    chunk fails, its datasets are retried one by one so that only the
+    failing ones are reported.
+
+    :param datasets: the datasets to create, see :py:func:`package_create`
+        for the format of dataset dictionaries
+    :type datasets: list of dictionaries
+    :param chunk_size: how many datasets to save per transaction (optional,
+        default: ``ckanext.sdbi.bulk.chunk_size`` or 200)
+    :type chunk_size: int
+
+    :returns: ``ids``, the ids of the new datasets in the order they were
+        given (``None`` for the ones that failed), and ``errors``, a list of
+        dictionaries with the ``index`` and ``name`` of each failed dataset
+        and its validation ``errors``
+    :rtype: dictionary
+
+    '''
+    model = context['model']
+
+    datasets = _get_or_bust(data_dict, 'datasets')
+    if not isinstance(datasets, list):
+        raise ValidationError({'datasets': [_('Must be a list')]})
+
+    user_obj = activity.acting_user(context)
+    state = {
+        'creator_user_id': user_obj.id if user_obj else None,
+        'organizations': {},
+        'access': {},
+    }
+
+    ids = [None] * len(datasets)
+    errors = []
+    for chunk in bulk.chunks(list(enumerate(datasets)),
+                             bulk.chunk_size(data_dict)):
+        try:
+            created, chunk_errors = _package_create_chunk(
+                context, chunk, state)
+        except Exception as e:
+            model.Session.rollback()
+            if len(chunk) == 1:
+                index, dataset = chunk[0]
+                log.error(f"Error creating dataset {index}: {str(e)}")
+                errors.append({'index': index, 'name': dataset.get('name'),
+                               'errors': {'message': str(e)}})
+                continue
+            log.warning(f"Error saving chunk, retrying one by one: {str(e)}")
+            created, chunk_errors = [], []
+            for item in chunk:
+                try:
+                    item_created, item_errors = _package_create_chunk(
+                        context, [item], state)
+                except Exception as e:
+                    model.Session.rollback()
+                    log.error(f"Error creating dataset {item[0]}: {str(e)}")
+                    item_created = []
+                    item_errors = [{'index': item[0],
+                                    'name': item[1].get('name'),
+                                    'errors': {'message': str(e)}}]
+                created.extend(item_created)
+                chunk_errors.extend(item_errors)
+
+        for index, package_id in created:
+            ids[index] = package_id
+        errors.extend(chunk_errors)
+
+    bulk.index_packages([package_id for package_id in ids if package_id])
+
+    return {'ids': ids, 'errors': errors}
+
+
+def _package_create_chunk(context, chunk, state):
+    '''Validate and save one chunk of :py:func:`package_create_many`
+
+    Returns the (index, id) of the created datasets and the errors of the
+    invalid ones; raises if saving the chunk fails.
+    '''
+    model = context['model']
+    session = context['session']
+
+    saved = []
+    errors = []
+    names = set()
+    for index, dataset in chunk:
+        item_context = dict(context)
+        item_context.pop('package', None)
+        item_context.pop('schema', None)
+        try:
+            data = _package_create_validate(
+                item_context, dict(dataset), state)
+            name = data.get('name')
+            # Not flushed yet, so the name validator cannot see these
+            if name in names:
+                raise ValidationError(
+                    {'name': [_('That URL is already in use.')]})
+        except ValidationError as e:
+            errors.append({'index': index, 'name': dataset.get('name'),
+                           'errors': e.error_dict})
+            continue
+
+        names.add(name)
+        if state['creator_user_id']:
+            data['creator_user_id'] = state['creator_user_id']
+        pkg = model_save.package_dict_save(data, item_context)
+        saved.append((index, pkg, data, item_context))
+
+    # One flush for the whole chunk instead of one per dataset
+    session.flush()
+
+    new_rows = []
+    for index, pkg, data, item_context in saved:
+        data['id'] = pkg.id
+        for resource_index, resource in enumerate(data.get('resources') or []):
+            resource['id'] = pkg.resources[resource_index].id
+
+        # What package_owner_org_update does for a dataset that has no
+        # organization memberships yet
+        if pkg.owner_org:
+            new_rows.append(model.Member(table_id=pkg.id,
+                                         table_name='package',
+                                         capacity='organization',
+                                         group_id=pkg.owner_org,
+                                         state='active'))
+
+        for item in plugins.PluginImplementations(plugins.IPackageController):
+            item.create(pkg)
+
+        if data.get('resources') and not resource_views.in_background():
+            resource_views.create_default_views(
+                dict(context, defer_commit=True), data)
+
+        # Built from the validated dict: activity_stream_item would run a
+        # package_show per dataset
+        new_rows.append(activity.new_package_activity(
+            context, pkg, responses.saved_package_dict(pkg, data)))
+
+    session.bulk_save_objects(new_rows)
+    bulk.commit_deferring_search(session)
+
+    # Only once the chunk is committed: a chunk that fails is retried one
+    # dataset at a time and must not run the hooks twice
+    for index, pkg, data, item_context in saved:
+        for item in plugins.PluginImplementations(plugins.IPackageController):
+            item.after_create(item_context, data)
+
+        if data.get('resources') and resource_views.in_background():
+            resource_views.enqueue_default_views(context, data)
+
+    return [(index, pkg.id) for index, pkg, data, item_context in saved], \
+        errors
+
+
+def _package_create_validate(context, data_dict, state):
+    '''Check access and validate one dataset of :py:func:`package_create_many`
+
+    Organizations are resolved once and access checks are cached per
+    organization and groups, as they only depend on those for a given user.
+    '''
+    model = context['model']
+
+    if 'type' not in data_dict:
+        package_plugin = lib_plugins.lookup_package_plugin()
+        try:
+            package_type = package_plugin.package_types()[0]
+        except (AttributeError, IndexError):
+            package_type = 'dataset'
+            package_plugin = lib_plugins.lookup_package_plugin(package_type)
+        data_dict['type'] = package_type
+    else:
+        package_plugin = lib_plugins.lookup_package_plugin(data_dict['type'])
+
+    owner_org = data_dict.get('owner_org')
+    if owner_org:
+        if owner_org not in state['organizations']:
+            org = model.Group.get(owner_org)
+            state['organizations'][owner_org] = \
+                org.id if org is not None and org.is_organization else None
+        if state['organizations'][owner_org]:
+            # The loaded organization is now in the session's identity map,
+            # so the validators get it without another query
+            data_dict['owner_org'] = state['organizations'][owner_org]
+
+    access_key = (data_dict.get('owner_org'), tuple(sorted(
+        g.get('id') or g.get('name') or '' for g in
+        (data_dict.get('groups') or []) if isinstance(g, dict))))
+    if access_key not in state['access']:
+        try:
+            _check_access('package_create', context, data_dict)
+            state['access'][access_key] = None
+        except NotAuthorized as e:
+            state['access'][access_key] = str(e) or _('Not authorized')
+    if state['access'][access_key] is not None:
+        raise ValidationError({'message': [state['access'][access_key]]})
+
+    schema = package_plugin.create_package_schema()
+    data, errors = lib_plugins.plugin_validate(
+        package_plugin, context, data_dict, schema, 'package_create')
+    if errors:
+        raise ValidationError(errors)
+    return data
+
+
 def resource_create(context, data_dict):
     '''Appends a new resource to a datasets list of resources.
 
@@ -299,6 +505,12 @@ def resource_create(context, data_dict):
     if not data_dict.get('url'):
         data_dict['url'] = ''
 
+    if uploads.is_enabled() and uploads.can_stream(data_dict):
+        return _resource_create_streamed(context, data_dict)
+
+    if _use_fast_append(context, package_id):
+        return _resource_append(context, data_dict)
+
     pkg_dict = _get_action('package_show')(
         dict(context, return_type='dict'),
         {'id': package_id})
@@ -346,14 +558,232 @@ def resource_create(context, data_dict):
     resource = updated_pkg_dict['resources'][-1]
 
     #  Add the default views to the new resource
-    logic.get_action('resource_create_default_resource_views')(
-        {'model': context['model'],
-         'user': context['user'],
-         'ignore_auth': True
-         },
-        {'resource': resource,
-         'package': updated_pkg_dict
-         })
+    if resource_views.in_background():
+        resource_views.enqueue_default_views(context, updated_pkg_dict,
+                                             [resource])
+    else:
+        resource_views.create_default_views(context, updated_pkg_dict,
+                                            [resource])
+
+    for plugin in plugins.PluginImplementations(plugins.IResourceController):
+        plugin.after_create(context, resource)
+
+    return resource
+
+
+def _resource_create_streamed(context, data_dict):
+    '''Write the uploaded file, then create the resource without it
+
+    The file is written before the transaction starts, so the transaction
+    only covers the database work; see :py:mod:`ckanext.sdbi.uploads`.
+    '''
+    # Check before anything is written to disk
+    _check_access('resource_create', context, data_dict)
+    written = uploads.store([data_dict])
+    try:
+        return resource_create(context, data_dict)
+    except Exception:
+        uploads.remove(written)
+        raise
+
+
+def resource_create_many(context, data_dict):
+    '''Append several resources to a dataset in one request.
+
+    Uploaded files are written in parallel before the database transaction
+    starts (see :py:mod:`ckanext.sdbi.uploads`), then all the resources are
+    added with a single dataset update.
+
+    :param package_id: id of the dataset the resources should be added to
+    :type package_id: string
+    :param resources: the resources to add, see :py:func:`resource_create`
+        for the format of resource dictionaries
+    :type resources: list of dictionaries
+
+    :returns: the newly created resources
+    :rtype: list of dictionaries
+
+    '''
+    model = context['model']
+
+    package_id = _get_or_bust(data_dict, 'package_id')
+    resources = _get_or_bust(data_dict, 'resources')
+    if not isinstance(resources, list) or not resources:
+        raise ValidationError({'resources': [_('Must be a non-empty list')]})
+
+    pkg_dict = _get_action('package_show')(
+        dict(context, return_type='dict'),
+        {'id': package_id})
+
+    for resource in resources:
+        resource['package_id'] = package_id
+        if not resource.get('url'):
+            resource['url'] = ''
+        _check_access('resource_create', context, resource)
+
+    for resource in resources:
+        for plugin in plugins.PluginImplementations(
+                plugins.IResourceController):
+            plugin.before_create(context, resource)
+
+    written = uploads.store(resources)
+
+    # Files an IUploader plugin handles are uploaded after the update
+    pending_uploads = []
+    for resource in resources:
+        upload = uploader.get_resource_uploader(resource)
+        if 'mimetype' not in resource:
+            if hasattr(upload, 'mimetype'):
+                resource['mimetype'] = upload.mimetype
+        if 'size' not in resource:
+            if hasattr(upload, 'filesize'):
+                resource['size'] = upload.filesize
+        pending_uploads.append(upload)
+
+    existing = len(pkg_dict.get('resources') or [])
+    pkg_dict['resources'] = (pkg_dict.get('resources') or []) + resources
+
+    try:
+        context['defer_commit'] = True
+        context['use_cache'] = False
+        _get_action('package_update')(context, pkg_dict)
+        context.pop('defer_commit')
+    except ValidationError as e:
+        uploads.remove(written)
+        try:
+            errors = e.error_dict['resources'][existing:]
+        except (KeyError, TypeError):
+            raise ValidationError(e.error_dict)
+        raise ValidationError({'resources': errors})
+    except Exception:
+        uploads.remove(written)
+        raise
+
+    new_resources = context['package'].resources[existing:]
+    for resource_obj, upload in zip(new_resources, pending_uploads):
+        upload.upload(resource_obj.id, uploader.get_max_resource_size())
+
+    model.repo.commit()
+
+    updated_pkg_dict = _get_action('package_show')(context, {'id': package_id})
+    created = updated_pkg_dict['resources'][existing:]
+
+    if resource_views.in_background():
+        resource_views.enqueue_default_views(context, updated_pkg_dict,
+                                             created)
+    else:
+        resource_views.create_default_views(context, updated_pkg_dict,
+                                            created)
+
+    for resource in created:
+        for plugin in plugins.PluginImplementations(
+                plugins.IResourceController):
+            plugin.after_create(context, resource)
+
+    return created
+
+
+def _use_fast_append(context, package_id):
+    '''Whether :py:func:`resource_create` can append without a package_update
+
+    Enabled with ``ckanext.sdbi.resource_create.fast_append`` or
+    ``fast_append`` in the context. Dataset types whose plugin validates the
+    whole dataset itself (e.g. ckanext-scheming) always take the full path,
+    as a resource on its own cannot be validated the same way.
+    '''
+    enabled = context.get('fast_append')
+    if enabled is None:
+        enabled = ckan.common.asbool(
+            config.get('ckanext.sdbi.resource_create.fast_append', False))
+    if not enabled:
+        return False
+
+    pkg = context['model'].Package.get(package_id)
+    if pkg is None:
+        # Let the full path raise the usual NotFound
+        return False
+    package_plugin = lib_plugins.lookup_package_plugin(pkg.type)
+    return not hasattr(package_plugin, 'validate')
+
+
+def _resource_append(context, data_dict):
+    '''Append a resource by validating and inserting only that resource
+
+    Does what the full :py:func:`resource_create` path does (access check,
+    plugin hooks, upload, metadata_modified, activity, default views) with
+    the same result, but without revalidating and re-saving the existing
+    resources. The search index is updated by the usual notification on
+    commit.
+    '''
+    model = context['model']
+    session = context['session']
+
+    # Lock the dataset so concurrent appends get distinct positions
+    pkg_id = model.Package.get(data_dict['package_id']).id
+    pkg = session.query(model.Package).filter_by(id=pkg_id) \
+        .with_for_update().one()
+    context['package'] = pkg
+
+    _check_access('resource_create', context, data_dict)
+
+    for plugin in plugins.PluginImplementations(plugins.IResourceController):
+        plugin.before_create(context, data_dict)
+
+    upload = uploader.get_resource_uploader(data_dict)
+
+    if 'mimetype' not in data_dict:
+        if hasattr(upload, 'mimetype'):
+            data_dict['mimetype'] = upload.mimetype
+
+    if 'size' not in data_dict:
+        if hasattr(upload, 'filesize'):
+            data_dict['size'] = upload.filesize
+
+    package_plugin = lib_plugins.lookup_package_plugin(pkg.type)
+    schema = context.get('schema') or package_plugin.update_package_schema()
+    data, errors = _validate(data_dict, schema['resources'], context)
+    if errors:
+        session.rollback()
+        raise ValidationError(errors)
+
+    # The position resource_list_save would give it: after the active ones
+    position = session.query(
+        func.coalesce(func.max(model.Resource.position), -1)) \
+        .filter(model.Resource.package_id == pkg.id) \
+        .filter(model.Resource.state == 'active').scalar() + 1
+
+    resource_obj = model_save.resource_dict_save(data, context)
+    resource_obj.package_id = pkg.id
+    resource_obj.position = position
+
+    #avoid revisioning by updating directly
+    session.query(model.Package).filter_by(id=pkg.id).update(
+        {"metadata_modified": datetime.datetime.utcnow()})
+    session.flush()
+    session.refresh(pkg)
+
+    pkg_dict = _get_action('package_show')(
+        dict(context, use_cache=False, for_view=False), {'id': pkg.id})
+
+    for item in plugins.PluginImplementations(plugins.IPackageController):
+        item.edit(pkg)
+
+        item.after_update(context, pkg_dict)
+
+    activity.add_package_activity(context, pkg, 'changed')
+
+    upload.upload(resource_obj.id, uploader.get_max_resource_size())
+
+    model.repo.commit()
+
+    resource = [res for res in pkg_dict['resources']
+                if res['id'] == resource_obj.id][0]
+
+    #  Add the default views to the new resource
+    if resource_views.in_background():
+        resource_views.enqueue_default_views(context, pkg_dict, [resource])
+    else:
+        resource_views.create_default_views(context, pkg_dict, [resource])
 
     for plugin in plugins.PluginImplementations(plugins.IResourceController):
         plugin.after_create(context, resource)
@@ -407,14 +837,7 @@ def resource_view_create(context, data_dict):
     if context.get('preview'):
         return data
 
-    max_order = model.Session.query(
-        func.max(model.ResourceView.order)
-    ).filter_by(resource_id=resource_id).first()
-
-    order = 0
-    if max_order[0] is not None:
-        order = max_order[0] + 1
-    data['order'] = order
+    data['order'] = view_order.next_order(model, resource_id)
 
     resource_view = model_save.resource_view_dict_save(data, context)
     if not context.get('defer_commit'):
@@ -631,6 +1054,144 @@ def member_create(context, data_dict=None):
     return model_dictize.member_dictize(member, context)
 
 
+def member_create_many(context, data_dict):
+    '''Make many objects of one type members of a group at once, e.g.
+    adding all the datasets of a disaster event to its group.
+
+    Like :py:func:`member_create`, objects that are already members get
+    their capacity updated. The access check is done once, the objects and
+    their existing memberships are looked up with one query each, the new
+    memberships are added with a single multi-row insert and everything is
+    committed (and, for datasets, reindexed) once.
+
+    You must be authorized to edit the group.
+
+    :param id: the id or name of the group to add the objects to
+    :type id: string
+    :param object_type: the type of the objects being added, e.g.
+        ``'package'`` or ``'user'``
+    :type object_type: string
+    :param members: the objects to add, as ``[object, capacity]`` pairs or
+        dictionaries with ``object`` and ``capacity`` keys, where ``object``
+        is the id or name of the object
+    :type members: list
+
+    :returns: the ids of the objects whose membership was ``created``,
+        ``updated`` or left ``unchanged``, and ``errors``, a list of
+        dictionaries with the ``index`` and ``object`` of each member that
+        could not be added and its ``errors``
+    :rtype: dictionary
+
+    '''
+    model = context['model']
+    session = context['session']
+
+    group_id, obj_type, members = \
+        _get_or_bust(data_dict, ['id', 'object_type', 'members'])
+    pairs = _member_pairs(members, 'object', 'capacity')
+
+    group = model.Group.get(group_id)
+    if not group:
+        raise NotFound('Group was not found.')
+
+    try:
+        obj_class = ckan.logic.model_name_to_class(model, obj_type)
+    except ValidationError:
+        raise ValidationError({'object_type': [_('Not a valid type')]})
+
+    for capacity in set(capacity for obj, capacity in pairs):
+        _check_access('member_create', context, {
+            'id': group.id, 'object_type': obj_type, 'capacity': capacity})
+
+    # Resolve all the objects with one query
+    keys = set(obj for obj, capacity in pairs if obj)
+    objects = {}
+    if keys:
+        key_filter = obj_class.id.in_(keys)
+        if hasattr(obj_class, 'name'):
+            key_filter = or_(key_filter, obj_class.name.in_(keys))
+        for obj in session.query(obj_class.id, *(
+                [obj_class.name] if hasattr(obj_class, 'name') else [])) \
+                .filter(key_filter):
+            for key in obj:
+                objects[key] = obj[0]
+
+    errors = []
+    wanted = OrderedDict()
+    for index, (obj, capacity) in enumerate(pairs):
+        if obj not in objects:
+            errors.append({'index': index, 'object': obj, 'errors': {
+                'object': ['%s was not found.' % obj_type.title()]}})
+            continue
+        # A later pair for the same object wins, like repeated calls would
+        wanted[objects[obj]] = (index, obj, capacity)
+
+    existing = {}
+    if wanted:
+        existing = dict(
+            (member.table_id, member) for member in
+            session.query(model.Member)
+            .filter(model.Member.table_name == obj_type)
+            .filter(model.Member.table_id.in_(list(wanted)))
+            .filter(model.Member.group_id == group.id)
+            .filter(model.Member.state == 'active'))
+
+    user_obj = activity.acting_user(context)
+    created, updated, unchanged = [], [], []
+    new_rows = []
+    for obj_id, (index, obj, capacity) in wanted.items():
+        member = existing.get(obj_id)
+        if member is None:
+            new_rows.append({'id': make_uuid(), 'table_name': obj_type,
+                             'table_id': obj_id, 'group_id': group.id,
+                             'capacity': capacity, 'state': 'active'})
+            created.append(obj_id)
+            continue
+        if member.capacity == capacity:
+            unchanged.append(obj_id)
+            continue
+        if obj_type == 'user' and user_obj is not None and \
+                obj_id == user_obj.id and member.capacity == 'admin':
+            errors.append({'index': index, 'object': obj, 'errors': {
+                'capacity': ["Administrators cannot revoke their "
+                             "own admin status"]}})
+            continue
+        member.capacity = capacity
+        updated.append(obj_id)
+
+    if new_rows:
+        session.execute(model.member_table.insert().values(new_rows))
+    bulk.commit_deferring_search(session)
+
+    if obj_type == 'package':
+        # Dataset group memberships are part of the search index
+        bulk.index_packages(created + updated)
+
+    return {'created': created, 'updated': updated, 'unchanged': unchanged,
+            'errors': sorted(errors, key=lambda error: error['index'])}
+
+
+def _member_pairs(members, object_key, capacity_key):
+    '''Normalize the ``members`` of the bulk member actions to a list of
+    (object, capacity) tuples'''
+    if not isinstance(members, list):
+        raise ValidationError({'members': [_('Must be a list')]})
+    pairs = []
+    for member in members:
+        if isinstance(member, dict):
+            pair = (member.get(object_key), member.get(capacity_key))
+        elif isinstance(member, (list, tuple)) and len(member) == 2:
+            pair = tuple(member)
+        else:
+            pair = (None, None)
+        if not pair[0] or not pair[1]:
+            raise ValidationError({'members': [
+                _('Each member needs a %s and a %s') % (
+                    object_key, capacity_key)]})
+        pairs.append(pair)
+    return pairs
+
+
 def package_collaborator_create(context, data_dict):
     '''Make a user a collaborator in a dataset.
 
@@ -1543,6 +2104,72 @@ def organization_member_create(context, data_dict):
     return _group_or_org_member_create(context, data_dict, is_org=True)
 
 
+def _group_or_org_member_create_many(context, data_dict, is_org=False):
+    model = context['model']
+
+    group_id = _get_or_bust(data_dict, 'id')
+    pairs = _member_pairs(data_dict.get('members'), 'username', 'role')
+    for username, role in pairs:
+        if role not in authz.ROLE_PERMISSIONS:
+            raise ValidationError({'members': [
+                _('role "%s" does not exist.') % role]})
+
+    group = model.Group.get(group_id)
+    if not group:
+        msg = _('Organization not found') if is_org else _('Group not found')
+        raise NotFound(msg)
+
+    member_create_context = {
+        'model': model,
+        'user': context['user'],
+        'session': context['session'],
+        'ignore_auth': context.get('ignore_auth'),
+    }
+    return member_create_many(member_create_context, {
+        'id': group.id,
+        'object_type': 'user',
+        'members': [list(pair) for pair in pairs],
+    })
+
+
+def group_member_create_many(context, data_dict):
+    '''Make many users members of a group at once.
+
+    You must be authorized to edit the group.
+
+    :param id: the id or name of the group
+    :type id: string
+    :param members: the users to add, as ``[username, role]`` pairs or
+        dictionaries with ``username`` and ``role`` keys, see
+        :py:func:`group_member_create`
+    :type members: list
+
+    :returns: see :py:func:`member_create_many`
+    :rtype: dictionary
+    '''
+    _check_access('group_member_create', context, data_dict)
+    return _group_or_org_member_create_many(context, data_dict)
+
+
+def organization_member_create_many(context, data_dict):
+    '''Make many users members of an organization at once.
+
+    You must be authorized to edit the organization.
+
+    :param id: the id or name of the organization
+    :type id: string
+    :param members: the users to add, as ``[username, role]`` pairs or
+        dictionaries with ``username`` and ``role`` keys, see
+        :py:func:`organization_member_create`
+    :type members: list
+
+    :returns: see :py:func:`member_create_many`
+    :rtype: dictionary
+    '''
+    _check_access('organization_member_create', context, data_dict)
+    return _group_or_org_member_create_many(context, data_dict, is_org=True)
+
+
 def follow_group(context, data_dict):
     '''Start following a group.
 
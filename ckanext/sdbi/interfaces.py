@@ -0,0 +1,21 @@
+'''Plugin interfaces provided by ckanext-sdbi.'''
+
+from ckan.plugins.interfaces import Interface
+
+
+class IDefaultResourceViews(Interface):
+    '''Get notified when the default views of a resource have been created.
+
+    Called both when the views are created during the request and when they
+    are created by the background job (see
+    ``ckanext.sdbi.resource_views.background``).
+    '''
+
+    def after_create_default_views(self, context, resource_dict, views):
+        '''Called after the default views were created for a resource.
+
+        :param resource_dict: the resource the views belong to
+        :type resource_dict: dictionary
+        :param views: the views that were created, may be empty
+        :type views: list of dictionaries
+        '''
@@ -0,0 +1,214 @@
+'''Prometheus-style metrics for the SDBI extension.
+
+Counters and histograms are kept in a plain dict per thread, so recording a
+value never takes a lock; the per-thread stores of the worker are merged
+when ``/sdbi/metrics`` is scraped and rendered in the text exposition
+format. Each worker process reports its own values, which is what a
+Prometheus scrape of a multi-process deployment expects per target.
+
+What is measured:
+
+* ``sdbi_helper_*``: calls, latency and DB queries of every template helper
+  registered in ``SDBIPlugin.get_helpers``
+* ``sdbi_request_*``: calls, latency and DB queries per request of every
+  tracking, google-forms and metrics route
+* ``sdbi_cache_requests_total``: hits and misses of the extension's caches
+* ``sdbi_tracking_*``: rows saved and errors of the tracking endpoints
+'''
+
+import bisect
+import functools
+import threading
+import time
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_DESCRIPTIONS = {
+    'sdbi_helper_calls_total':
+        ('counter', 'Template helper calls'),
+    'sdbi_helper_duration_seconds':
+        ('histogram', 'Template helper latency'),
+    'sdbi_helper_db_queries_total':
+        ('counter', 'DB queries issued by template helpers'),
+    'sdbi_requests_total':
+        ('counter', 'Requests to SDBI routes'),
+    'sdbi_request_duration_seconds':
+        ('histogram', 'Latency of SDBI routes'),
+    'sdbi_request_db_queries':
+        ('histogram', 'DB queries per request to SDBI routes'),
+    'sdbi_cache_requests_total':
+        ('counter', 'Cache lookups by result'),
+    'sdbi_tracking_rows_total':
+        ('counter', 'Tracking rows saved'),
+    'sdbi_tracking_errors_total':
+        ('counter', 'Failed tracking requests'),
+}
+
+_local = threading.local()
+_stores = []
+_stores_lock = threading.Lock()
+_installed = False
+
+
+def _store():
+    try:
+        return _local.store
+    except AttributeError:
+        store = _local.store = {'counters': {}, 'histograms': {}}
+        # Only taken once per thread, never on the recording path
+        with _stores_lock:
+            _stores.append(store)
+        return store
+
+
+def inc(name, labels=(), value=1):
+    """Increment a counter; ``labels`` is a tuple of (name, value) pairs"""
+    counters = _store()['counters']
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, labels, value, buckets=LATENCY_BUCKETS):
+    """Record a value in a histogram"""
+    histograms = _store()['histograms']
+    key = (name, labels)
+    histogram = histograms.get(key)
+    if histogram is None:
+        # [buckets, per-bucket counts (last one is +Inf), count, sum]
+        histogram = histograms[key] = [buckets, [0] * (len(buckets) + 1),
+                                       0, 0.0]
+    histogram[1][bisect.bisect_left(buckets, value)] += 1
+    histogram[2] += 1
+    histogram[3] += value
+
+
+def query_count():
+    """Number of DB queries issued by the current thread so far"""
+    return getattr(_local, 'queries', 0)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    _local.queries = getattr(_local, 'queries', 0) + 1
+
+
+def install():
+    """Start counting DB queries, once per process"""
+    global _installed
+    if _installed:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    event.listen(Engine, 'before_cursor_execute', _count_query)
+    _installed = True
+
+
+def instrument_helper(name, helper):
+    """Wrap a template helper to record its calls, latency and queries"""
+    labels = (('helper', name),)
+
+    @functools.wraps(helper)
+    def wrapper(*args, **kwargs):
+        queries = query_count()
+        started = time.perf_counter()
+        try:
+            return helper(*args, **kwargs)
+        finally:
+            observe('sdbi_helper_duration_seconds', labels,
+                    time.perf_counter() - started)
+            inc('sdbi_helper_calls_total', labels)
+            inc('sdbi_helper_db_queries_total', labels,
+                query_count() - queries)
+
+    return wrapper
+
+
+def instrument_blueprint(blueprint):
+    """Record calls, latency and queries of every route of a blueprint"""
+    from flask import g, request
+
+    @blueprint.before_request
+    def _start_request_metrics():
+        g.sdbi_metrics_start = (time.perf_counter(), query_count())
+
+    @blueprint.after_request
+    def _record_request_metrics(response):
+        start = getattr(g, 'sdbi_metrics_start', None)
+        if start is not None:
+            labels = (('endpoint', request.endpoint or ''),)
+            observe('sdbi_request_duration_seconds', labels,
+                    time.perf_counter() - start[0])
+            observe('sdbi_request_db_queries', labels,
+                    query_count() - start[1], QUERY_BUCKETS)
+            inc('sdbi_requests_total',
+                labels + (('status', str(response.status_code)),))
+        return response
+
+    return blueprint
+
+
+def _merge():
+    counters = {}
+    histograms = {}
+    with _stores_lock:
+        stores = list(_stores)
+    for store in stores:
+        # dict.copy() is atomic, so the owning thread can keep recording
+        for key, value in store['counters'].copy().items():
+            counters[key] = counters.get(key, 0) + value
+        for key, (buckets, counts, count, total) in \
+                store['histograms'].copy().items():
+            merged = histograms.get(key)
+            if merged is None:
+                merged = histograms[key] = [buckets, [0] * len(counts), 0, 0.0]
+            for i, bucket_count in enumerate(list(counts)):
+                merged[1][i] += bucket_count
+            merged[2] += count
+            merged[3] += total
+    return counters, histograms
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+        for k, v in labels)
+
+
+def _format_bound(bound):
+    return repr(float(bound)) if not isinstance(bound, str) else bound
+
+
+def render():
+    """Render all metrics in the Prometheus text exposition format"""
+    counters, histograms = _merge()
+    lines = []
+    described = set()
+
+    def describe(name):
+        if name in described or name not in _DESCRIPTIONS:
+            return
+        described.add(name)
+        kind, text = _DESCRIPTIONS[name]
+        lines.append('# HELP %s %s' % (name, text))
+        lines.append('# TYPE %s %s' % (name, kind))
+
+    for (name, labels), value in sorted(counters.items()):
+        describe(name)
+        lines.append('%s%s %s' % (name, _format_labels(labels), value))
+
+    for (name, labels), (buckets, counts, count, total) in \
+            sorted(histograms.items()):
+        describe(name)
+        cumulative = 0
+        for bound, bucket_count in zip(list(buckets) + ['+Inf'], counts):
+            cumulative += bucket_count
+            lines.append('%s_bucket%s %d' % (
+                name, _format_labels(labels + (('le', _format_bound(bound)),)),
+                cumulative))
+        lines.append('%s_sum%s %s' % (name, _format_labels(labels), total))
+        lines.append('%s_count%s %d' % (name, _format_labels(labels), count))
+
+    return '\n'.join(lines) + '\n'
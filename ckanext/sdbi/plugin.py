@@ -3,6 +3,11 @@ import ckan.plugins as plugins
 import ckan.plugins.toolkit as toolkit
 from ckan.common import config
 import ckan.model as model
+from ckanext.sdbi import cli
+from ckanext.sdbi import metrics
+from ckanext.sdbi import profiler
+from ckanext.sdbi import create
+from ckanext.sdbi import update
 
 def most_recent_datasets(num=3):
         datasets = toolkit.get_action('package_search')({}, {'sort': 'metadata_modified desc',
@@ -27,6 +32,26 @@ def package_showcase_list(context):
 def ckan_site_url():
     return config.get('ckan.site_url', '').rstrip('/')
 
+def download_redirect_enabled():
+    return toolkit.asbool(
+        config.get('ckanext.sdbi.tracking.download_redirect', False))
+
+def bulk_in_background():
+    """Whether the organization bulk edit runs as a background job"""
+    from ckanext.sdbi import bulk_jobs
+    return bulk_jobs.in_background({})
+
+def download_url(resource):
+    """Return the URL a download link for the resource should point to
+
+    With ``ckanext.sdbi.tracking.download_redirect`` enabled this is the
+    counting ``/sdbi/download/<resource_id>`` redirect, otherwise the
+    resource URL itself.
+    """
+    if download_redirect_enabled() and resource.get('id'):
+        return '/sdbi/download/%s' % resource['id']
+    return resource.get('url')
+
 def get_dataset_views(package_id):
     """Get tracking data for a dataset directly from raw tracking table"""
     try:
@@ -119,72 +144,74 @@ def get_dataset_views_by_name(dataset_name):
         # Return fallback data
         return {'total_views': 0, 'recent_views': 0, 'today_views': 0}
 
+def download_tracking_url(package_id, resource_id):
+    """The URL a resource download is recorded under in tracking_raw
+
+    Same form as the URL of an uploaded resource, so downloads recorded by
+    the ``/sdbi/download/`` redirect and clicks on upload links are counted
+    together.
+    """
+    return '/dataset/%s/resource/%s' % (package_id, resource_id)
+
+def _count_dataset_downloads(package_id, package_name):
+    """Count the resource hits of a dataset, by its id or its name
+
+    Uploaded resources and the download redirect record the dataset id in
+    the URL, links to the resource pages record the dataset name.
+    """
+    from sqlalchemy import text
+    from datetime import datetime, timedelta
+
+    params = {
+        'by_id': f"%/dataset/{package_id}/resource/%",
+        'by_name': f"%/dataset/{package_name}/resource/%",
+        'seven_days_ago': datetime.utcnow() - timedelta(days=7),
+        'today': datetime.utcnow().date(),
+    }
+    dataset_filter = """
+        WHERE tracking_type = 'resource'
+        AND (url LIKE :by_id OR url LIKE :by_name)
+    """
+
+    # Get total downloads
+    result = model.Session.execute(text(
+        "SELECT COUNT(*) as count FROM tracking_raw" + dataset_filter), params)
+    total_downloads = result.fetchone()[0]
+
+    # Get recent downloads (last 7 days)
+    result = model.Session.execute(text(
+        "SELECT COUNT(*) as count FROM tracking_raw" + dataset_filter +
+        "AND access_timestamp >= :seven_days_ago"), params)
+    recent_downloads = result.fetchone()[0]
+
+    # Get today's downloads
+    result = model.Session.execute(text(
+        "SELECT COUNT(*) as count FROM tracking_raw" + dataset_filter +
+        "AND DATE(access_timestamp) = :today"), params)
+    today_downloads = result.fetchone()[0]
+
+    return {
+        'total_downloads': total_downloads,
+        'recent_downloads': recent_downloads,
+        'today_downloads': today_downloads
+    }
+
 def get_dataset_downloads(package_id):
     """Get download count for a dataset from resource tracking data"""
     try:
-        # Get dataset name from package_id
         package = model.Package.get(package_id)
         if not package:
             return {'total_downloads': 0, 'recent_downloads': 0}
-        
-        dataset_url = f"/dataset/{package.name}"
-        
-        # Get all resources for this dataset
-        resources = package.resources
-        
-        # Count downloads for all resources of this dataset
-        from sqlalchemy import text
-        from datetime import datetime, timedelta
-        
-        # Get total downloads
-        result = model.Session.execute(text("""
-            SELECT COUNT(*) as count FROM tracking_raw 
-            WHERE tracking_type = 'resource' 
-            AND url LIKE :dataset_pattern
-        """), {'dataset_pattern': f"{dataset_url}/resource/%"})
-        total_downloads = result.fetchone()[0]
-        
-        # Get recent downloads (last 7 days)
-        seven_days_ago = datetime.utcnow() - timedelta(days=7)
-        result = model.Session.execute(text("""
-            SELECT COUNT(*) as count FROM tracking_raw 
-            WHERE tracking_type = 'resource' 
-            AND url LIKE :dataset_pattern
-            AND access_timestamp >= :seven_days_ago
-        """), {
-            'dataset_pattern': f"{dataset_url}/resource/%",
-            'seven_days_ago': seven_days_ago
-        })
-        recent_downloads = result.fetchone()[0]
-        
-        # Get today's downloads
-        today = datetime.utcnow().date()
-        result = model.Session.execute(text("""
-            SELECT COUNT(*) as count FROM tracking_raw 
-            WHERE tracking_type = 'resource' 
-            AND url LIKE :dataset_pattern
-            AND DATE(access_timestamp) = :today
-        """), {
-            'dataset_pattern': f"{dataset_url}/resource/%",
-            'today': today
-        })
-        today_downloads = result.fetchone()[0]
-        
-        return {
-            'total_downloads': total_downloads,
-            'recent_downloads': recent_downloads,
-            'today_downloads': today_downloads
-        }
+
+        return _count_dataset_downloads(package.id, package.name)
     except Exception as e:
         return {'total_downloads': 0, 'recent_downloads': 0, 'today_downloads': 0}
 
 def get_dataset_downloads_by_name(dataset_name):
     """Get download count for a dataset by name"""
     try:
-        # Use direct SQL query for better reliability
         from sqlalchemy import text
-        from datetime import datetime, timedelta
-        
+
         # Get dataset ID from name first
         result = model.Session.execute(text("""
             SELECT id FROM package WHERE name = :dataset_name
@@ -193,48 +220,8 @@ def get_dataset_downloads_by_name(dataset_name):
         
         if not dataset_row:
             return {'total_downloads': 0, 'recent_downloads': 0, 'today_downloads': 0}
-        
-        dataset_id = dataset_row[0]
-        
-        # Get total downloads - menggunakan dataset ID
-        result = model.Session.execute(text("""
-            SELECT COUNT(*) as count FROM tracking_raw 
-            WHERE tracking_type = 'resource' 
-            AND url LIKE :dataset_pattern
-        """), {'dataset_pattern': f"%/dataset/{dataset_id}/resource/%"})
-        total_downloads = result.fetchone()[0]
-        
-        # Get recent downloads (last 7 days)
-        seven_days_ago = datetime.utcnow() - timedelta(days=7)
-        result = model.Session.execute(text("""
-            SELECT COUNT(*) as count FROM tracking_raw 
-            WHERE tracking_type = 'resource' 
-            AND url LIKE :dataset_pattern
-            AND access_timestamp >= :seven_days_ago
-        """), {
-            'dataset_pattern': f"%/dataset/{dataset_id}/resource/%",
-            'seven_days_ago': seven_days_ago
-        })
-        recent_downloads = result.fetchone()[0]
-        
-        # Get today's downloads
-        today = datetime.utcnow().date()
-        result = model.Session.execute(text("""
-            SELECT COUNT(*) as count FROM tracking_raw 
-            WHERE tracking_type = 'resource' 
-            AND url LIKE :dataset_pattern
-            AND DATE(access_timestamp) = :today
-        """), {
-            'dataset_pattern': f"%/dataset/{dataset_id}/resource/%",
-            'today': today
-        })
-        today_downloads = result.fetchone()[0]
-        
-        return {
-            'total_downloads': total_downloads,
-            'recent_downloads': recent_downloads,
-            'today_downloads': today_downloads
-        }
+
+        return _count_dataset_downloads(dataset_row[0], dataset_name)
     except Exception as e:
         return {'total_downloads': 0, 'recent_downloads': 0, 'today_downloads': 0}
 
@@ -314,6 +301,9 @@ class SDBIPlugin(plugins.SingletonPlugin):
     plugins.implements(plugins.IFacets, inherit=True)
     plugins.implements(plugins.ITemplateHelpers)
     plugins.implements(plugins.IBlueprint)
+    plugins.implements(plugins.IMiddleware, inherit=True)
+    plugins.implements(plugins.IActions)
+    plugins.implements(plugins.IClick)
 
     # IConfigurer
     def update_config(self, config_):
@@ -383,17 +373,22 @@ class SDBIPlugin(plugins.SingletonPlugin):
     def get_helpers(self):
         """Register sdbi_theme_* helper functions"""
 
-        return {'sdbi_theme_most_recent_datasets': most_recent_datasets,
-                'sdbi_theme_dataset_count': dataset_count,
-                'sdbi_theme_groups': groups,
-                'ckan_site_url': ckan_site_url,
-                'package_showcase_list': package_showcase_list,
-                'get_dataset_views': get_dataset_views,
-                'get_dataset_views_by_name': get_dataset_views_by_name,
-                'get_dataset_downloads': get_dataset_downloads,
-                'get_dataset_downloads_by_name': get_dataset_downloads_by_name,
-                'get_total_visitors': get_total_visitors,
-                'json_loads': json_loads}
+        helpers = {'sdbi_theme_most_recent_datasets': most_recent_datasets,
+                   'sdbi_theme_dataset_count': dataset_count,
+                   'sdbi_theme_groups': groups,
+                   'ckan_site_url': ckan_site_url,
+                   'package_showcase_list': package_showcase_list,
+                   'get_dataset_views': get_dataset_views,
+                   'get_dataset_views_by_name': get_dataset_views_by_name,
+                   'get_dataset_downloads': get_dataset_downloads,
+                   'get_dataset_downloads_by_name': get_dataset_downloads_by_name,
+                   'get_total_visitors': get_total_visitors,
+                   'json_loads': json_loads,
+                   'sdbi_download_url': download_url,
+                   'sdbi_bulk_in_background': bulk_in_background}
+
+        return dict((name, metrics.instrument_helper(name, helper))
+                    for name, helper in helpers.items())
 
     # IBlueprint
     def get_blueprint(self):
@@ -404,6 +399,7 @@ class SDBIPlugin(plugins.SingletonPlugin):
         
         from ckanext.sdbi.controllers.google_forms import google_forms_blueprint
         from ckanext.sdbi.controllers.tracking import TrackingController
+        from ckanext.sdbi.controllers.metrics import metrics_blueprint
         
         # Create tracking blueprint
         from flask import Blueprint
@@ -412,9 +408,64 @@ class SDBIPlugin(plugins.SingletonPlugin):
         # Add routes
         tracking_blueprint.add_url_rule('/sdbi/tracking', 'track', TrackingController().track, methods=['POST'])
         tracking_blueprint.add_url_rule('/sdbi/tracking/page', 'track_page', TrackingController().track_page, methods=['GET'])
+        tracking_blueprint.add_url_rule('/sdbi/tracking/batch', 'track_batch', TrackingController().track_batch, methods=['POST'])
         tracking_blueprint.add_url_rule('/sdbi/downloads/<dataset_name>', 'get_downloads', TrackingController().get_downloads, methods=['GET'])
-        
+        if download_redirect_enabled():
+            tracking_blueprint.add_url_rule('/sdbi/download/<resource_id>', 'download', TrackingController().download, methods=['GET'])
+        
+        # Record request and DB query metrics for every SDBI route
+        metrics.install()
+        blueprints = [google_forms_blueprint, tracking_blueprint,
+                      metrics_blueprint]
+        for blueprint in blueprints:
+            metrics.instrument_blueprint(blueprint)
+
         # Return list of blueprints
-        return [google_forms_blueprint, tracking_blueprint]
+        return blueprints
+
+    # IActions
+    def get_actions(self):
+        """Register the SDBI actions
+
+        Actions named like a core action replace it: package_create and
+        package_update for return_mode, package_revise to skip no-op
+        revisions, resource_create and resource_update for the fast append
+        and in-place update, the resource view actions and
+        package_resource_reorder for the set-based reordering, and the
+        organization bulk_update_* actions so they can run as background
+        jobs. The rest are new actions.
+        """
+        return {'package_create': create.package_create,
+                'package_update': update.package_update,
+                'package_create_many': create.package_create_many,
+                'package_resource_reorder': update.package_resource_reorder,
+                'package_revise': update.package_revise,
+                'package_revise_many': update.package_revise_many,
+                'bulk_update_owner_org': update.bulk_update_owner_org,
+                'bulk_update_private': update.bulk_update_private,
+                'bulk_update_public': update.bulk_update_public,
+                'bulk_update_delete': update.bulk_update_delete,
+                'bulk_update_status': update.bulk_update_status,
+                'bulk_update_resume': update.bulk_update_resume,
+                'resource_create': create.resource_create,
+                'resource_create_many': create.resource_create_many,
+                'resource_update': update.resource_update,
+                'resource_view_create': create.resource_view_create,
+                'resource_view_reorder': update.resource_view_reorder,
+                'task_status_update_many': update.task_status_update_many,
+                'member_create_many': create.member_create_many,
+                'group_member_create_many': create.group_member_create_many,
+                'organization_member_create_many':
+                    create.organization_member_create_many}
 
+    # IClick
+    def get_commands(self):
+        return cli.get_commands()
 
+    # IMiddleware
+    def make_middleware(self, app, config):
+        """Attach the opt-in SQL profiler to the Flask app"""
+        from flask import Flask
+        if isinstance(app, Flask):
+            return profiler.install(app)
+        return app
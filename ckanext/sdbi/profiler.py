@@ -0,0 +1,231 @@
+'''Opt-in per-request SQL profiler.
+
+Enabled with ``ckanext.sdbi.profiler.enabled = true``. When the option is
+off nothing is registered at all, so there is no overhead. When it is on, a
+sysadmin can profile a single request by adding ``?sdbi_profile=1`` to the
+URL (or sending an ``X-SDBI-Profile: 1`` header). For that request every
+query is timed and attributed to the SDBI function (e.g. a template helper)
+or, failing that, the CKAN action that issued it, and the response carries a
+JSON summary in the ``X-SDBI-Profile`` header::
+
+    {"queries": 143, "time_ms": 212.4,
+     "by_owner": {"ckanext.sdbi.plugin:get_dataset_views_by_name": [60, 48.1],
+                  "ckanext.sdbi.plugin:dataset_count>action:package_search":
+                      [1, 4.2],
+                  "action:package_search": [3, 12.0], ...},
+     "n_plus_one": [{"statement": "SELECT COUNT(*) ...", "count": 20,
+                     "owner": "ckanext.sdbi.plugin:get_dataset_views_by_name"}]}
+
+Statements repeated more than ``ckanext.sdbi.profiler.n_plus_one_threshold``
+times (default ``5``) in one request are reported as N+1 candidates.
+'''
+
+import json
+import logging
+import re
+import sys
+import threading
+import time
+
+from ckan.common import asbool, config
+
+log = logging.getLogger(__name__)
+
+HEADER = 'X-SDBI-Profile'
+MAX_HEADER_LENGTH = 7000
+
+# Modules whose frames are never reported as the owner of a query
+_SKIP_MODULES = ('ckanext.sdbi.profiler', 'ckanext.sdbi.metrics')
+
+_local = threading.local()
+_listeners = 0
+_listeners_lock = threading.Lock()
+
+_whitespace = re.compile(r'\s+')
+_placeholder_list = re.compile(
+    r'\((?:\s*(?:%\(\w+\)s|\?|:\w+)\s*,)+\s*(?:%\(\w+\)s|\?|:\w+)\s*\)')
+
+
+def is_enabled():
+    return asbool(config.get('ckanext.sdbi.profiler.enabled', False))
+
+
+def _statement_shape(statement):
+    shape = _whitespace.sub(' ', statement).strip()
+    # Count "IN (:a, :b, ...)" with any number of values as one shape
+    return _placeholder_list.sub('(...)', shape)
+
+
+def _query_owner():
+    action = None
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith('ckanext.sdbi') and \
+                not module.startswith(_SKIP_MODULES):
+            owner = '%s:%s' % (module, frame.f_code.co_name)
+            # e.g. a helper calling package_search
+            return '%s>%s' % (owner, action) if action else owner
+        if action is None and module.startswith('ckan.logic.action.'):
+            action = 'action:%s' % frame.f_code.co_name
+        frame = frame.f_back
+    return action or 'core'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    profile = getattr(_local, 'profile', None)
+    if profile is not None:
+        profile['started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    profile = getattr(_local, 'profile', None)
+    if profile is None or profile['started'] is None:
+        return
+    elapsed = time.perf_counter() - profile['started']
+    profile['started'] = None
+    profile['queries'].append((_statement_shape(statement), _query_owner(),
+                               elapsed))
+
+
+def _listen():
+    global _listeners
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    with _listeners_lock:
+        if _listeners == 0:
+            event.listen(Engine, 'before_cursor_execute',
+                         _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         _after_cursor_execute)
+        _listeners += 1
+
+
+def _unlisten():
+    global _listeners
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    with _listeners_lock:
+        _listeners -= 1
+        if _listeners == 0:
+            event.remove(Engine, 'before_cursor_execute',
+                         _before_cursor_execute)
+            event.remove(Engine, 'after_cursor_execute',
+                         _after_cursor_execute)
+
+
+def summarize(queries, threshold):
+    """Build the summary dict for a list of (shape, owner, seconds)"""
+    by_owner = {}
+    shapes = {}
+    total = 0.0
+    for shape, owner, elapsed in queries:
+        total += elapsed
+        owner_stats = by_owner.setdefault(owner, [0, 0.0])
+        owner_stats[0] += 1
+        owner_stats[1] += elapsed
+        shape_stats = shapes.setdefault(shape, [0, owner])
+        shape_stats[0] += 1
+
+    n_plus_one = [
+        {'statement': shape[:200], 'count': count, 'owner': owner}
+        for shape, (count, owner) in shapes.items() if count > threshold
+    ]
+    n_plus_one.sort(key=lambda item: -item['count'])
+
+    return {
+        'queries': len(queries),
+        'time_ms': round(total * 1000, 1),
+        'by_owner': dict((owner, [count, round(elapsed * 1000, 1)])
+                         for owner, (count, elapsed) in by_owner.items()),
+        'n_plus_one': n_plus_one,
+    }
+
+
+def _dumps(summary):
+    return json.dumps(summary, separators=(',', ':'), sort_keys=True)
+
+
+def header_value(summary):
+    """Serialize a summary for the header, in at most MAX_HEADER_LENGTH
+
+    A summary that is too long is marked ``truncated`` and shrunk a whole
+    field at a time, so the header is always valid JSON: only the first 5
+    N+1 candidates are kept, then their statements are shortened, then
+    dropped, then the candidates and finally ``by_owner`` are dropped.
+    """
+    header = _dumps(summary)
+    if len(header) <= MAX_HEADER_LENGTH:
+        return header
+
+    candidates = summary['n_plus_one'][:5]
+    shortened = [dict(item, statement=item['statement'][:60])
+                 for item in candidates]
+    without_statements = [dict((key, value) for key, value in item.items()
+                               if key != 'statement')
+                          for item in candidates]
+    for n_plus_one, by_owner in ((candidates, summary['by_owner']),
+                                 (shortened, summary['by_owner']),
+                                 (without_statements, summary['by_owner']),
+                                 ([], summary['by_owner']),
+                                 ([], {})):
+        header = _dumps(dict(summary, n_plus_one=n_plus_one,
+                             by_owner=by_owner, truncated=True))
+        if len(header) <= MAX_HEADER_LENGTH:
+            break
+    return header
+
+
+def _wants_profile():
+    from flask import g, request
+    if request.args.get('sdbi_profile') != '1' and \
+            request.headers.get(HEADER) != '1':
+        return False
+    userobj = getattr(g, 'userobj', None)
+    return bool(userobj and userobj.sysadmin)
+
+
+def _start_profile():
+    if not _wants_profile():
+        return
+    _local.profile = {'started': None, 'queries': []}
+    _listen()
+
+
+def _finish_profile(response):
+    profile = getattr(_local, 'profile', None)
+    if profile is None:
+        return response
+    _local.profile = None
+    _unlisten()
+
+    try:
+        threshold = int(
+            config.get('ckanext.sdbi.profiler.n_plus_one_threshold', 5))
+    except ValueError:
+        threshold = 5
+    summary = summarize(profile['queries'], threshold)
+    log.info('sql_profile %s', json.dumps(summary, sort_keys=True))
+
+    response.headers[HEADER] = header_value(summary)
+    return response
+
+
+def _teardown_profile(exc):
+    # Make sure the listeners are released if the request failed
+    if getattr(_local, 'profile', None) is not None:
+        _local.profile = None
+        _unlisten()
+
+
+def install(app):
+    """Register the profiler on a Flask app if it is enabled"""
+    if not is_enabled():
+        return app
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+    app.teardown_request(_teardown_profile)
+    log.info('SDBI SQL profiler enabled')
+    return app
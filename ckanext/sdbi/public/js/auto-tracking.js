@@ -4,6 +4,72 @@
 (function ($) {
   'use strict';
 
+  // Antrian event tracking, dikirim sekaligus dalam satu beacon
+  var BATCH_URL = '/sdbi/tracking/batch';
+  var BATCH_TIMEOUT = 10000; // Kirim paling lambat 10 detik setelah event pertama
+  var BATCH_MAX_EVENTS = 100; // Sama dengan batas di TrackingController
+  var queue = [];
+  var flushTimer = null;
+
+  function queueEvent(url, type) {
+    queue.push({ url: url, type: type });
+    if (queue.length >= BATCH_MAX_EVENTS) {
+      flushQueue();
+    } else if (!flushTimer) {
+      flushTimer = setTimeout(flushQueue, BATCH_TIMEOUT);
+    }
+  }
+
+  // Jika done diberikan, antrian dikirim lewat AJAX dan done dipanggil
+  // setelah server selesai menyimpannya (beacon tidak memberi respons)
+  function flushQueue(done) {
+    var callback = typeof done === 'function' ? done : null;
+    if (flushTimer) {
+      clearTimeout(flushTimer);
+      flushTimer = null;
+    }
+    if (!queue.length) {
+      if (callback) {
+        callback();
+      }
+      return;
+    }
+    var payload = JSON.stringify(queue.splice(0, BATCH_MAX_EVENTS));
+
+    var sent = false;
+    if (!callback && navigator.sendBeacon) {
+      sent = navigator.sendBeacon(BATCH_URL, new Blob([payload], { type: 'application/json' }));
+    }
+    if (!sent) {
+      // Fallback jika beacon tidak didukung atau ditolak browser
+      $.ajax({
+        url: BATCH_URL,
+        method: 'POST',
+        data: payload,
+        contentType: 'application/json',
+        dataType: 'json',
+        complete: !queue.length && callback ? callback : $.noop
+      });
+    }
+    if (queue.length) {
+      flushQueue(callback);
+    }
+  }
+
+  // Kirim antrian ketika halaman disembunyikan atau ditutup
+  document.addEventListener('visibilitychange', function () {
+    if (document.visibilityState === 'hidden') {
+      flushQueue();
+    }
+  });
+  window.addEventListener('pagehide', flushQueue);
+
+  // Dipakai script lain (mis. exit-intent.js) untuk menambah event
+  window.sdbiTracking = {
+    queue: queueEvent,
+    flush: flushQueue
+  };
+
   // Track page view ketika halaman dimuat
   $(document).ready(function () {
     // Cek apakah kita berada di halaman dataset
@@ -12,59 +78,21 @@
       // Extract dataset ID dari URL
       var datasetId = currentUrl.split('/dataset/')[1];
       if (datasetId) {
-        // Kirim tracking data
-        sendTrackingData(currentUrl, 'page');
+        // Masukkan page view ke antrian
+        queueEvent(currentUrl, 'page');
 
-        // Update view count dan download count setelah 2 detik
+        // Setelah 2 detik kirim antrian dulu (jangan tunggu BATCH_TIMEOUT),
+        // lalu update view count dan download count
         setTimeout(function () {
-          updateViewCount(datasetId);
-          updateDownloadCount(datasetId);
+          flushQueue(function () {
+            updateViewCount(datasetId);
+            updateDownloadCount(datasetId);
+          });
         }, 2000);
       }
     }
   });
 
-  function sendTrackingData(url, type) {
-    // Kirim POST request ke custom tracking endpoint
-    $.ajax({
-      url: '/sdbi/tracking',
-      method: 'POST',
-      data: JSON.stringify({
-        url: url,
-        type: type
-      }),
-      contentType: 'application/json',
-      dataType: 'json',
-      success: function (response) {
-        console.log('Auto-tracking successful:', response);
-      },
-      error: function (xhr, status, error) {
-        console.error('Auto-tracking failed:', error);
-        // Fallback: coba kirim ke endpoint usertracking jika custom tracking gagal
-        sendToUserTracking(url, type);
-      }
-    });
-  }
-
-  function sendToUserTracking(url, type) {
-    // Fallback ke usertracking endpoint
-    $.ajax({
-      url: '/_usertracking',
-      method: 'POST',
-      data: {
-        url: url,
-        type: type
-      },
-      dataType: 'json',
-      success: function (response) {
-        console.log('UserTracking fallback successful:', response);
-      },
-      error: function (xhr, status, error) {
-        console.error('UserTracking fallback failed:', error);
-      }
-    });
-  }
-
   function updateViewCount(datasetId) {
     // Update view count dari tracking summary
     $.ajax({
@@ -138,9 +166,13 @@
     var resourceUrl = $(this).attr('href');
     var currentUrl = window.location.pathname;
 
+    // Link lewat /sdbi/download/ sudah dihitung di server
+    if (resourceUrl && resourceUrl.indexOf('/sdbi/download/') === 0) {
+      return;
+    }
+
     if (resourceUrl && currentUrl.indexOf('/dataset/') !== -1) {
-      console.log('Download tracking: ' + resourceUrl);
-      sendTrackingData(resourceUrl, 'resource');
+      queueEvent(resourceUrl, 'resource');
     }
   });
 
@@ -0,0 +1,110 @@
+// Bulk edit organisasi sebagai background job
+// Mengirim aksi bulk ke API dengan background=true, lalu menampilkan
+// progres job dari bulk_update_status sampai selesai
+
+(function ($) {
+  'use strict';
+
+  var POLL_INTERVAL = 2000;
+  var ACTIONS = {
+    'public': 'bulk_update_public',
+    'private': 'bulk_update_private',
+    'delete': 'bulk_update_delete'
+  };
+
+  function formatSeconds(seconds) {
+    if (seconds === null || seconds === undefined) {
+      return '-';
+    }
+    seconds = Math.round(seconds);
+    if (seconds < 60) {
+      return seconds + ' detik';
+    }
+    return Math.floor(seconds / 60) + ' menit ' + (seconds % 60) + ' detik';
+  }
+
+  function showProgress(box, status) {
+    var percent = status.total ? Math.round(100 * status.done / status.total) : 100;
+    var text = 'Memproses ' + status.done + ' dari ' + status.total + ' dataset';
+    if (status.rate) {
+      text += ' (' + status.rate + ' dataset/detik, sisa ' + formatSeconds(status.eta) + ')';
+    }
+    if (status.state === 'queued') {
+      text = 'Menunggu antrian job...';
+    } else if (status.state === 'done') {
+      text = 'Selesai: ' + status.total + ' dataset diperbarui.';
+    } else if (status.state === 'error') {
+      text = 'Gagal setelah ' + status.done + ' dari ' + status.total + ' dataset: ' + status.error;
+      box.removeClass('alert-info').addClass('alert-danger');
+    }
+    box.find('.sdbi-bulk-progress-text').text(text);
+    box.find('.progress-bar').css('width', percent + '%');
+  }
+
+  function poll(box, apiUrl, jobId) {
+    $.getJSON(apiUrl + 'bulk_update_status', { id: jobId })
+      .done(function (response) {
+        var status = response.result;
+        showProgress(box, status);
+        if (status.state === 'done') {
+          // Muat ulang agar daftar dataset menampilkan status terbaru
+          setTimeout(function () { window.location.reload(); }, 1000);
+        } else if (status.state !== 'error') {
+          setTimeout(function () { poll(box, apiUrl, jobId); }, POLL_INTERVAL);
+        }
+      })
+      .fail(function () {
+        setTimeout(function () { poll(box, apiUrl, jobId); }, POLL_INTERVAL * 2);
+      });
+  }
+
+  $(function () {
+    var box = $('#sdbi-bulk-progress');
+    if (!box.length) {
+      return;
+    }
+    var apiUrl = box.data('api-url');
+    var form = $('button[name^="bulk_action."]').closest('form');
+    var action = null;
+
+    form.on('click', 'button[name^="bulk_action."]', function () {
+      action = $(this).val();
+    });
+
+    form.on('submit', function (event) {
+      if (!ACTIONS[action]) {
+        return;
+      }
+      var datasets = form.find('input[type="checkbox"][name^="dataset_"]:checked')
+        .map(function () { return this.name.substring('dataset_'.length); })
+        .get();
+      if (!datasets.length) {
+        return;
+      }
+      event.preventDefault();
+      form.find('button[name^="bulk_action."]').prop('disabled', true);
+      box.show();
+
+      $.ajax({
+        url: apiUrl + ACTIONS[action],
+        method: 'POST',
+        contentType: 'application/json',
+        dataType: 'json',
+        data: JSON.stringify({
+          datasets: datasets,
+          org_id: box.data('org-id'),
+          background: true
+        })
+      }).done(function (response) {
+        showProgress(box, { state: 'queued', done: 0, total: response.result.total });
+        poll(box, apiUrl, response.result.job_id);
+      }).fail(function (xhr) {
+        var message = (xhr.responseJSON && xhr.responseJSON.error &&
+          xhr.responseJSON.error.message) || xhr.statusText;
+        box.removeClass('alert-info').addClass('alert-danger')
+          .find('.sdbi-bulk-progress-text').text('Gagal memulai job: ' + message);
+        form.find('button[name^="bulk_action."]').prop('disabled', false);
+      });
+    });
+  });
+})(jQuery);
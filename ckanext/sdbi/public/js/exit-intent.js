@@ -53,9 +53,13 @@
   let timeBasedTimer = null;
   let pageLoadTime = Date.now();
 
-  // Get Google Forms with exit intent enabled
+  // Get Google Forms with exit intent enabled that target the current page
   function getExitIntentForms() {
-    return fetch('/api/google-forms/exit-intent')
+    const params = new URLSearchParams({
+      path: window.location.pathname,
+      search: window.location.search
+    });
+    return fetch('/api/google-forms/exit-intent?' + params.toString())
       .then(response => response.json())
       .then(data => {
         if (data.success) {
@@ -274,6 +278,9 @@
     }
 
     popupShown = true;
+    if (window.sdbiTracking) {
+      window.sdbiTracking.queue(window.location.pathname, 'exit');
+    }
     setCookie(SMART_EXIT_INTENT_CONFIG.cookieName, 'true', SMART_EXIT_INTENT_CONFIG.cookieExpiry);
 
     if (SMART_EXIT_INTENT_CONFIG.debug) {
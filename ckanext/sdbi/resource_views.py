@@ -0,0 +1,127 @@
+'''Default resource view creation, in the request or as a background job.
+
+With ``ckanext.sdbi.resource_views.background = true`` the dataset and
+resource create actions enqueue a job that creates the default views once
+the data is committed, instead of running every view plugin's ``can_view``
+check inside the request. Jobs are deduplicated per resource with a Redis
+key, so a resource that already has a job queued or running is skipped.
+Plugins implementing :py:class:`~ckanext.sdbi.interfaces.IDefaultResourceViews`
+are notified when the views of a resource have been created, in both modes.
+'''
+
+import logging
+import time
+
+import ckan.model as model
+import ckan.logic as logic
+import ckan.plugins as plugins
+from ckan.common import asbool, config
+
+from ckanext.sdbi.interfaces import IDefaultResourceViews
+
+log = logging.getLogger(__name__)
+
+DEDUPE_TTL = 3600
+# The job may start before a deferred commit of the request lands
+NOT_FOUND_RETRIES = 5
+NOT_FOUND_DELAY = 2
+
+
+def in_background():
+    return asbool(config.get('ckanext.sdbi.resource_views.background', False))
+
+
+def _dedupe_key(resource_id):
+    return '%s:sdbi:default-views:%s' % (config.get('ckan.site_id'),
+                                         resource_id)
+
+
+def create_default_views(context, package_dict, resources=None):
+    """Create the default views of resources now
+
+    ``resources`` defaults to all the resources of ``package_dict``. Views
+    are saved with ``defer_commit`` when the context has it.
+    """
+    views_context = {'model': context['model'], 'user': context['user'],
+                     'ignore_auth': True}
+    if context.get('defer_commit'):
+        views_context['defer_commit'] = True
+
+    created = []
+    for resource_dict in (package_dict.get('resources') or []
+                          if resources is None else resources):
+        views = logic.get_action('resource_create_default_resource_views')(
+            dict(views_context),
+            {'resource': resource_dict, 'package': package_dict})
+        for plugin in plugins.PluginImplementations(IDefaultResourceViews):
+            plugin.after_create_default_views(views_context, resource_dict,
+                                              views)
+        created.extend(views)
+    return created
+
+
+def enqueue_default_views(context, package_dict, resources=None):
+    """Queue a job creating the default views of resources
+
+    Call after the resources are committed. Resources with a job already
+    queued or running are skipped; if the job cannot be queued the views
+    are created right away.
+    """
+    import ckan.lib.jobs as jobs
+    from ckan.lib.redis import connect_to_redis
+
+    if resources is None:
+        resources = package_dict.get('resources') or []
+    resource_ids = [resource['id'] for resource in resources]
+    if not resource_ids:
+        return
+
+    try:
+        redis = connect_to_redis()
+        queued = [resource_id for resource_id in resource_ids
+                  if redis.set(_dedupe_key(resource_id), '1', nx=True,
+                               ex=DEDUPE_TTL)]
+        if queued:
+            jobs.enqueue(create_default_views_job,
+                         [package_dict['id'], queued],
+                         title='Default views for %s' % package_dict['id'])
+    except Exception as e:
+        log.error(f"Could not queue default views for "
+                  f"{package_dict['id']}, creating them now: {str(e)}")
+        create_default_views(context, package_dict, resources)
+
+
+def create_default_views_job(package_id, resource_ids):
+    """Background job creating the default views of some resources"""
+    from ckan.lib.redis import connect_to_redis
+
+    site_user = logic.get_action('get_site_user')(
+        {'model': model, 'ignore_auth': True}, {})
+    context = {'model': model, 'session': model.Session,
+               'user': site_user['name'], 'ignore_auth': True}
+    try:
+        package_dict = None
+        found = []
+        for attempt in range(NOT_FOUND_RETRIES):
+            try:
+                package_dict = logic.get_action('package_show')(
+                    dict(context, use_cache=False), {'id': package_id})
+                found = [resource for resource in package_dict['resources']
+                         if resource['id'] in resource_ids]
+            except logic.NotFound:
+                package_dict = None
+            if package_dict is not None and len(found) == len(resource_ids):
+                break
+            if attempt < NOT_FOUND_RETRIES - 1:
+                model.Session.remove()
+                time.sleep(NOT_FOUND_DELAY)
+
+        if package_dict is None:
+            log.warning(f"Dataset {package_id} not found, no default views "
+                        f"created")
+            return
+        create_default_views(context, package_dict, found)
+    finally:
+        redis = connect_to_redis()
+        redis.delete(*[_dedupe_key(resource_id)
+                       for resource_id in resource_ids])
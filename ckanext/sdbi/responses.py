@@ -0,0 +1,79 @@
+'''Response modes for ``package_create`` and ``package_update``.
+
+By default both actions finish with a ``package_show`` of the saved dataset.
+Clients that do not need the full dataset can pass ``return_mode`` in the
+data dict (or the context) to skip that extra read:
+
+* ``show``: the ``package_show`` result (default)
+* ``id``: only the dataset id, like ``return_id_only`` in the context
+* ``saved``: the validated dataset as saved, with its id, resource ids and
+  timestamps, built from the objects in memory; ``after_show`` plugins are
+  not run and fields only added by ``package_show`` (e.g. ``organization``,
+  ``num_resources``) are missing
+* ``changed``: the id, ``metadata_modified``, the dataset fields whose value
+  changed and the list fields (``resources``, ``tags``, ...) that were sent
+'''
+
+import datetime
+
+from sqlalchemy.orm import object_mapper
+
+from ckan.common import _
+import ckan.logic as logic
+
+RETURN_MODES = ('show', 'id', 'saved', 'changed')
+LIST_FIELDS = ('resources', 'tags', 'extras', 'groups')
+
+
+def get_return_mode(context, data_dict):
+    """Pop ``return_mode`` from the data dict, falling back to the context"""
+    mode = data_dict.pop('return_mode', None) or context.get('return_mode')
+    if not mode:
+        mode = 'id' if context.get('return_id_only') else 'show'
+    if mode not in RETURN_MODES:
+        raise logic.ValidationError({'return_mode': [
+            _('Must be one of: %s') % ', '.join(RETURN_MODES)]})
+    return mode
+
+
+def _serialize(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def package_columns(pkg):
+    """Snapshot the package table values of a package"""
+    return dict((attr.key, getattr(pkg, attr.key, None))
+                for attr in object_mapper(pkg).column_attrs)
+
+
+def saved_package_dict(pkg, data):
+    """Dataset dict from the saved package and the validated data"""
+    saved = dict(data)
+    for name, value in package_columns(pkg).items():
+        saved[name] = _serialize(value)
+    if 'resources' in data:
+        # Resources that were not sent are kept as they are, but not loaded
+        saved['resources'] = [
+            dict((k, _serialize(v)) for k, v in
+                 dict(resource, package_id=pkg.id, position=position).items())
+            for position, resource in enumerate(data['resources'] or [])]
+    return saved
+
+
+def changed_package_dict(pkg, data, before, submitted):
+    """Only what an update changed
+
+    ``before`` is a :py:func:`package_columns` snapshot taken before saving
+    and ``submitted`` the data dict the client sent.
+    """
+    saved = saved_package_dict(pkg, data)
+    changed = {'id': pkg.id, 'metadata_modified': saved['metadata_modified']}
+    for name, value in package_columns(pkg).items():
+        if before.get(name) != value:
+            changed[name] = saved[name]
+    for name in LIST_FIELDS:
+        if name in submitted:
+            changed[name] = saved.get(name, [])
+    return changed
@@ -0,0 +1,201 @@
+'''Targeting rules for exit-intent Google Forms.
+
+Each form may carry a JSON object in ``google_forms.targeting`` describing
+the pages it should appear on, e.g.::
+
+    {
+        "url_prefix": ["/dataset", "/organization/bnpb"],
+        "url_regex": "^/dataset/banjir-",
+        "organization": ["bnpb"],
+        "jenis": ["banjir", "gempa-bumi"],
+        "fase": ["prabencana"],
+        "sample": 25
+    }
+
+Every rule that is present must match; an empty or missing object matches
+every page. Rules are compiled once into a matcher function and cached by
+form id, so the exit-intent endpoint only pays for the comparisons.
+'''
+
+import json
+import logging
+import re
+import zlib
+
+from ckanext.sdbi import metrics
+
+log = logging.getLogger(__name__)
+
+RULE_KEYS = ('url_prefix', 'url_regex', 'organization', 'jenis', 'fase',
+             'sample')
+FACET_KEYS = ('organization', 'jenis', 'fase')
+
+# form id -> (raw rules string, compiled matcher)
+_matchers = {}
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [v.strip() for v in value if v and v.strip()]
+
+
+def extra_values(value):
+    """Values of a dataset extra such as ``jenis`` or ``fase``
+
+    Multiple-choice fields are stored as a JSON list, e.g.
+    ``["banjir", "gempa-bumi"]``; other values are split on commas.
+    """
+    if not value:
+        return []
+    if value.lstrip().startswith('['):
+        try:
+            values = json.loads(value)
+        except ValueError:
+            values = None
+        if isinstance(values, list):
+            return [str(v).strip() for v in values
+                    if v is not None and str(v).strip()]
+    return _as_list(value)
+
+
+def parse_rules(raw):
+    """Parse a stored targeting value into a rules dict"""
+    if not raw:
+        return {}
+    if isinstance(raw, dict):
+        rules = raw
+    else:
+        rules = json.loads(raw)
+    if not isinstance(rules, dict):
+        raise ValueError('Targeting rules must be a JSON object')
+    return dict((k, v) for k, v in rules.items()
+                if k in RULE_KEYS and (v or k == 'sample'))
+
+
+def rules_from_form(form):
+    """Build a rules dict from the google_forms create/edit form fields
+
+    Raises ValueError when the regex or the sample percentage is invalid.
+    """
+    rules = {}
+    for key in ('url_prefix', 'organization', 'jenis', 'fase'):
+        values = _as_list(form.get('targeting_%s' % key, ''))
+        if values:
+            rules[key] = values
+
+    url_regex = form.get('targeting_url_regex', '').strip()
+    if url_regex:
+        try:
+            re.compile(url_regex)
+        except re.error as e:
+            raise ValueError('Invalid URL regex: %s' % e)
+        rules['url_regex'] = url_regex
+
+    sample = form.get('targeting_sample', '').strip()
+    if sample:
+        try:
+            sample = int(sample)
+        except ValueError:
+            raise ValueError('Sample percentage must be a number')
+        if not 0 <= sample <= 100:
+            raise ValueError('Sample percentage must be between 0 and 100')
+        if sample < 100:
+            rules['sample'] = sample
+
+    return rules
+
+
+def dump_rules(rules):
+    """Serialize a rules dict for storage, None when there are no rules"""
+    if not rules:
+        return None
+    return json.dumps(rules, sort_keys=True)
+
+
+def compile_rules(rules, form_id=''):
+    """Compile a rules dict into a ``matcher(page)`` function
+
+    ``page`` is a dict as returned by :py:func:`page_context`; facet values
+    are only looked up through ``page['facets']()`` when a facet rule is
+    present, so URL-only rules never touch the database.
+    """
+    checks = []
+
+    prefixes = tuple(_as_list(rules.get('url_prefix')))
+    if prefixes:
+        checks.append(lambda page: page['path'].startswith(prefixes))
+
+    if rules.get('url_regex'):
+        pattern = re.compile(rules['url_regex'])
+        checks.append(lambda page: pattern.search(page['path']) is not None)
+
+    for key in FACET_KEYS:
+        wanted = frozenset(_as_list(rules.get(key)))
+        if wanted:
+            checks.append(
+                lambda page, key=key, wanted=wanted:
+                    not wanted.isdisjoint(page['facets']().get(key, ())))
+
+    sample = rules.get('sample')
+    if sample is not None and int(sample) < 100:
+        threshold = int(sample)
+        salt = str(form_id).encode('utf-8')
+        # Bucket visitors deterministically so a visitor either always or
+        # never sees a sampled form.
+        checks.append(
+            lambda page: zlib.crc32(salt + page['visitor']) % 100 < threshold)
+
+    def matcher(page):
+        for check in checks:
+            if not check(page):
+                return False
+        return True
+
+    return matcher
+
+
+def get_matcher(form_id, raw):
+    """Return the cached matcher for a form, compiling it on first use"""
+    cached = _matchers.get(form_id)
+    if cached is not None and cached[0] == raw:
+        metrics.inc('sdbi_cache_requests_total',
+                    (('cache', 'targeting'), ('result', 'hit')))
+        return cached[1]
+    metrics.inc('sdbi_cache_requests_total',
+                (('cache', 'targeting'), ('result', 'miss')))
+    try:
+        matcher = compile_rules(parse_rules(raw), form_id)
+    except (ValueError, TypeError, re.error) as e:
+        log.warning(f"Invalid targeting rules for form {form_id}: {str(e)}")
+        matcher = lambda page: False
+    _matchers[form_id] = (raw, matcher)
+    return matcher
+
+
+def page_context(path, query_args, visitor, lookup_facets):
+    """Describe the page a visitor is on for the matchers
+
+    ``lookup_facets(path)`` returns a dict of facet name to list of values
+    for the page and is only called (once) if a matcher needs it. Facet
+    values in the query string, e.g. on the dataset search page, are merged
+    in as well.
+    """
+    resolved = []
+
+    def facets():
+        if not resolved:
+            values = dict((k, set(v)) for k, v in lookup_facets(path).items())
+            for key in FACET_KEYS:
+                for value in query_args.getlist(key):
+                    values.setdefault(key, set()).add(value)
+            resolved.append(values)
+        return resolved[0]
+
+    return {
+        'path': path or '/',
+        'visitor': (visitor or '').encode('utf-8'),
+        'facets': facets,
+    }
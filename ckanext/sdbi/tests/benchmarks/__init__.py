@@ -0,0 +1,6 @@
+'''Benchmarks for ckanext-sdbi.
+
+These are not collected by the test runner; run each module directly, e.g.::
+
+    python -m ckanext.sdbi.tests.benchmarks.tracking --help
+'''
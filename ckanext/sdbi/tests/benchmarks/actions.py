@@ -0,0 +1,275 @@
+'''Benchmark the SDBI action functions against a CKAN test database.
+
+Times the dataset actions of ``create.py`` and ``update.py`` and counts the
+DB queries they issue, so changes to the write path can be compared between
+commits::
+
+    python -m ckanext.sdbi.tests.benchmarks.actions --config test.ini \\
+        --output before.json
+    python -m ckanext.sdbi.tests.benchmarks.actions --config test.ini \\
+        --output after.json --compare before.json
+
+The benchmark creates its own user, organization and ``sdbi-bench-*``
+datasets and purges the datasets when it is done. Only run it against a
+throwaway CKAN database with Solr configured.
+'''
+
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import sys
+import uuid
+
+from ckanext.sdbi.tests.benchmarks.common import (
+    compare, git_commit, report_errors, time_call)
+
+PREFIX = 'sdbi-bench'
+
+
+def load_app(config_path):
+    from ckan.cli import load_config
+    from ckan.config.middleware import make_app
+    app = make_app(load_config(config_path))
+    return app.apps['flask_app']._wsgi_app
+
+
+def setup_fixtures():
+    """Get or create the benchmark user and organization"""
+    import ckan.model as model
+    import ckan.logic as logic
+
+    site_user = logic.get_action('get_site_user')(
+        {'model': model, 'ignore_auth': True}, {})
+    context = {'model': model, 'session': model.Session,
+               'user': site_user['name'], 'ignore_auth': True}
+
+    user_name = '%s-user' % PREFIX
+    if model.User.by_name(user_name) is None:
+        logic.get_action('user_create')(dict(context), {
+            'name': user_name, 'email': '%s@example.org' % user_name,
+            'password': uuid.uuid4().hex})
+
+    org_name = '%s-org' % PREFIX
+    if model.Group.get(org_name) is None:
+        logic.get_action('organization_create')(dict(context), {
+            'name': org_name,
+            'users': [{'name': user_name, 'capacity': 'admin'}]})
+    return user_name, model.Group.get(org_name).id
+
+
+def dataset_dict(org_id, resources=3):
+    name = '%s-%s' % (PREFIX, uuid.uuid4().hex[:12])
+    return {
+        'name': name,
+        'title': name,
+        'owner_org': org_id,
+        'notes': 'Synthetic dataset for benchmarks',
+        'tags': [{'name': 'banjir'}, {'name': 'benchmark'}],
+        'extras': [{'key': 'jenis', 'value': 'banjir'},
+                   {'key': 'fase', 'value': 'prabencana'}],
+        'resources': [{'url': 'https://example.org/%s/%d.csv' % (name, i),
+                       'name': 'Resource %d' % i, 'format': 'CSV'}
+                      for i in range(resources)],
+    }
+
+
+def measure(func, repeat):
+    """Time ``func`` and count the DB queries of each call"""
+    from ckanext.sdbi import metrics
+
+    queries = []
+
+    def call():
+        import ckan.model as model
+
+        before = metrics.query_count()
+        try:
+            func()
+        except Exception:
+            # Counted as an error by time_call; keep the session usable
+            model.Session.rollback()
+            raise
+        finally:
+            queries.append(metrics.query_count() - before)
+
+    result = time_call(call, [()], repeat)
+    result['queries_median'] = statistics.median(queries)
+    result['queries_max'] = max(queries)
+    return result
+
+
+def bench_actions(user_name, org_id, repeat, bulk_size):
+    import ckan.model as model
+    from ckanext.sdbi import create, update
+
+    def context():
+        return {'model': model, 'session': model.Session, 'user': user_name}
+
+    created = []
+    results = {}
+
+    def package_create():
+        created.append(create.package_create(
+            context(), dict(dataset_dict(org_id), return_mode='id')))
+
+    results['action.package_create'] = measure(package_create, repeat)
+
+    package_id = created[0]
+    for mode in ('show', 'saved', 'changed'):
+        def package_update(mode=mode):
+            data = dataset_dict(org_id)
+            data.pop('name')
+            data.update({'id': package_id, 'notes': uuid.uuid4().hex,
+                         'return_mode': mode})
+            update.package_update(context(), data)
+
+        results['action.package_update.%s' % mode] = \
+            measure(package_update, repeat)
+
+    def package_create_many():
+        result = create.package_create_many(
+            context(), {'datasets': [dataset_dict(org_id)
+                                     for _ in range(bulk_size)]})
+        created.extend(package_id for package_id in result['ids']
+                       if package_id)
+
+    results['action.package_create_many.%d' % bulk_size] = \
+        measure(package_create_many, max(repeat // 5, 1))
+
+    bulk_ids = created[-bulk_size:]
+    flags = iter([True, False] * repeat)
+
+    def bulk_update_visibility():
+        update._bulk_update_dataset(
+            context(), {'datasets': bulk_ids, 'org_id': org_id},
+            {'private': next(flags)})
+
+    results['action._bulk_update_dataset.%d' % bulk_size] = \
+        measure(bulk_update_visibility, repeat)
+
+    def package_revise_many(notes=None):
+        update.package_revise_many(context(), {'revisions': [
+            {'match': {'id': package_id},
+             'update': {'notes': notes or uuid.uuid4().hex}}
+            for package_id in bulk_ids]})
+
+    results['action.package_revise_many.%d' % bulk_size] = \
+        measure(package_revise_many, max(repeat // 5, 1))
+    results['action.package_revise_many.unchanged.%d' % bulk_size] = \
+        measure(lambda: package_revise_many('unchanged'),
+                max(repeat // 5, 1))
+
+    return results, created
+
+
+def bench_views(user_name, package_id, repeat, views, view_type):
+    """Create many views on one resource and time reordering them"""
+    import ckan.model as model
+    from ckanext.sdbi import create, update
+
+    def context():
+        return {'model': model, 'session': model.Session, 'user': user_name}
+
+    resource_id = model.Package.get(package_id).resources[0].id
+    results = {}
+    counter = iter(range(views + repeat))
+
+    def resource_view_create():
+        create.resource_view_create(context(), {
+            'resource_id': resource_id, 'view_type': view_type,
+            'title': 'View %d' % next(counter)})
+
+    results['action.resource_view_create'] = \
+        measure(resource_view_create, views)
+
+    view_ids = [view.id for view in model.Session.query(model.ResourceView)
+                .filter_by(resource_id=resource_id)
+                .order_by(model.ResourceView.order)]
+
+    def resource_view_reorder():
+        view_ids.reverse()
+        update.resource_view_reorder(context(), {'id': resource_id,
+                                                 'order': list(view_ids)})
+
+    results['action.resource_view_reorder.%d' % len(view_ids)] = \
+        measure(resource_view_reorder, repeat)
+    return results
+
+
+def purge(package_ids):
+    import ckan.model as model
+    import ckan.logic as logic
+
+    site_user = logic.get_action('get_site_user')(
+        {'model': model, 'ignore_auth': True}, {})
+    for package_id in package_ids:
+        logic.get_action('dataset_purge')(
+            {'model': model, 'session': model.Session,
+             'user': site_user['name'], 'ignore_auth': True},
+            {'id': package_id})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--config', required=True,
+                        help='CKAN ini file of a throwaway test instance')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--bulk-size', type=int, default=100,
+                        help='datasets per bulk action call')
+    parser.add_argument('--views', type=int, default=200,
+                        help='views to create on one resource')
+    parser.add_argument('--view-type', default='image_view',
+                        help='an enabled view plugin')
+    parser.add_argument('--keep', action='store_true',
+                        help='do not purge the benchmark datasets')
+    parser.add_argument('--output', help='write the JSON results here')
+    parser.add_argument('--compare', help='baseline JSON results file')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    from ckanext.sdbi import metrics
+
+    flask_app = load_app(args.config)
+    metrics.install()
+    with flask_app.test_request_context():
+        user_name, org_id = setup_fixtures()
+        results, created = bench_actions(user_name, org_id, args.repeat,
+                                         args.bulk_size)
+        results.update(bench_views(user_name, created[0], args.repeat,
+                                   args.views, args.view_type))
+        if not args.keep:
+            purge(created)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'date': datetime.datetime.utcnow().isoformat(),
+            'repeat': args.repeat,
+            'bulk_size': args.bulk_size,
+            'views': args.views,
+            'python': platform.python_version(),
+        },
+        'results': results,
+    }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            return 1
+    if report_errors(results):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
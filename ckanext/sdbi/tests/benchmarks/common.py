@@ -0,0 +1,74 @@
+'''Helpers shared by the benchmark scripts.'''
+
+import statistics
+import subprocess
+import sys
+import time
+
+
+def time_call(func, args_list, repeat, check=None):
+    """Call ``func`` for every args tuple ``repeat`` times, in ms
+
+    A call that raises, or whose result ``check`` rejects, is counted in
+    ``errors``: a fast run made of errors is not an improvement.
+    """
+    timings = []
+    errors = 0
+    for _ in range(repeat):
+        for args in args_list:
+            started = time.perf_counter()
+            try:
+                result = func(*args)
+            except Exception:
+                errors += 1
+            else:
+                if check is not None and not check(result):
+                    errors += 1
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'calls': len(timings),
+        'errors': errors,
+        'min_ms': round(timings[0], 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1
+                                if len(timings) > 1 else 0], 3),
+        'max_ms': round(timings[-1], 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report_errors(results):
+    """Print the benchmarks that had errors, return True if any had"""
+    failed = sorted(key for key in results if results[key].get('errors'))
+    for key in failed:
+        print('%-50s %d of %d calls failed' % (
+            key, results[key]['errors'], results[key]['calls']),
+            file=sys.stderr)
+    return bool(failed)
+
+
+def compare(results, baseline, threshold):
+    """Print median changes against a baseline, return True if regressed"""
+    regressed = False
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        old = baseline[key]['median_ms']
+        new = results[key]['median_ms']
+        change = (new - old) / old if old else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        print('%-50s %10.3f -> %10.3f ms %+7.1f%%%s' % (
+            key, old, new, change * 100, flag))
+    return regressed
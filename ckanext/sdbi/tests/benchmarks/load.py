@@ -0,0 +1,303 @@
+'''Load-test the tracking ingestion endpoints of a running CKAN instance.
+
+Drives a fixed number of concurrent asyncio workers, each on its own
+keep-alive connection, against one ingestion mode for a fixed duration::
+
+    python -m ckanext.sdbi.tests.benchmarks.load --url http://localhost:5000 \\
+        --mode sync --concurrency 50 --duration 60 --output sync.json
+    python -m ckanext.sdbi.tests.benchmarks.load --url http://localhost:5000 \\
+        --mode batched --batch-size 20 --concurrency 50 --output batched.json
+    python -m ckanext.sdbi.tests.benchmarks.load --compare sync.json \\
+        batched.json
+
+Modes:
+
+* ``sync``: one event per ``POST /sdbi/tracking``
+* ``page``: one event per ``GET /sdbi/tracking/page``
+* ``batched``: ``--batch-size`` events per ``POST /sdbi/tracking/batch``
+
+The report has p50/p95/p99 latency, the error rate, requests and events per
+second and, with ``--db`` pointing at the instance's database, the rows
+actually written to ``tracking_raw`` per second. ``--rate`` caps the
+request rate, which is how to find the highest rate a worker sustains
+without latency or errors climbing.
+
+Only the standard library is needed to generate load; ``--db`` needs
+SQLAlchemy. Run it against a test instance: every request adds rows to
+``tracking_raw``.
+'''
+
+import argparse
+import asyncio
+import datetime
+import json
+import platform
+import random
+import sys
+import time
+from urllib.parse import urlencode, urlsplit
+
+from ckanext.sdbi.tests.benchmarks.common import git_commit
+
+MODES = ('sync', 'page', 'batched')
+
+
+def build_request(mode, host, prefix, batch_size, rnd):
+    """Build the raw HTTP request for one call in the given mode"""
+    visitor = rnd.randint(0, 99999)
+    url = '/dataset/dataset-%06d' % min(int(5000 * rnd.random() ** 3), 4999)
+    headers = [
+        'Host: %s' % host,
+        # Vary the visitor so rows get different user keys
+        'User-Agent: sdbi-load/%d' % visitor,
+        'Connection: keep-alive',
+    ]
+
+    if mode == 'page':
+        path = '%s/sdbi/tracking/page?%s' % (
+            prefix, urlencode({'url': url, 'type': 'page'}))
+        return ('GET %s HTTP/1.1\r\n%s\r\n\r\n' % (
+            path, '\r\n'.join(headers))).encode('utf-8'), 1
+
+    if mode == 'batched':
+        path = '%s/sdbi/tracking/batch' % prefix
+        body = [{'url': url, 'type': 'page'}]
+        body += [{'url': '/dataset/dataset-%06d' % rnd.randint(0, 4999),
+                  'type': 'page'} for _ in range(batch_size - 1)]
+        events = batch_size
+    else:
+        path = '%s/sdbi/tracking' % prefix
+        body = {'url': url, 'type': 'page'}
+        events = 1
+
+    payload = json.dumps(body).encode('utf-8')
+    headers += ['Content-Type: application/json',
+                'Content-Length: %d' % len(payload)]
+    return ('POST %s HTTP/1.1\r\n%s\r\n\r\n' % (
+        path, '\r\n'.join(headers))).encode('utf-8') + payload, events
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response, returning (status, keep_alive)"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed by server')
+    status = int(status_line.split()[1])
+
+    length = 0
+    chunked = False
+    keep_alive = True
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        value = value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value:
+            chunked = True
+        elif name == 'connection' and value == 'close':
+            keep_alive = False
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length:
+        await reader.readexactly(length)
+    return status, keep_alive
+
+
+class Pacer(object):
+    """Spread requests evenly to cap the total request rate"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_slot = time.perf_counter()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.perf_counter()
+        slot = max(self.next_slot, now)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def worker(target, args, deadline, pacer, results, seed):
+    rnd = random.Random(seed)
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        await pacer.wait()
+        request, events = build_request(args.mode, target.netloc,
+                                        target.path.rstrip('/'),
+                                        args.batch_size, rnd)
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(
+                    target.hostname, target.port or 80)
+            writer.write(request)
+            status, keep_alive = await asyncio.wait_for(
+                read_response(reader), args.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError,
+                ValueError, IndexError) as e:
+            results['latencies'].append(time.perf_counter() - started)
+            results['errors'] += 1
+            key = type(e).__name__
+            results['statuses'][key] = results['statuses'].get(key, 0) + 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            continue
+
+        results['latencies'].append(time.perf_counter() - started)
+        results['statuses'][str(status)] = \
+            results['statuses'].get(str(status), 0) + 1
+        if 200 <= status < 300:
+            results['events'] += events
+        else:
+            results['errors'] += 1
+        if not keep_alive:
+            writer.close()
+            reader = writer = None
+
+    if writer is not None:
+        writer.close()
+
+
+async def run_load(args):
+    target = urlsplit(args.url)
+    if target.scheme != 'http':
+        raise SystemExit('Only plain http:// targets are supported')
+    results = {'latencies': [], 'errors': 0, 'events': 0, 'statuses': {}}
+    pacer = Pacer(args.rate)
+    started = time.perf_counter()
+    deadline = started + args.duration
+    await asyncio.gather(*[
+        worker(target, args, deadline, pacer, results, args.seed + i)
+        for i in range(args.concurrency)])
+    results['elapsed'] = time.perf_counter() - started
+    return results
+
+
+def tracking_rows(db_url):
+    from sqlalchemy import create_engine, text
+    engine = create_engine(db_url)
+    try:
+        with engine.connect() as conn:
+            return conn.execute(
+                text('SELECT COUNT(*) FROM tracking_raw')).scalar()
+    finally:
+        engine.dispose()
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarize(results, rows_written):
+    latencies = sorted(results['latencies'])
+    requests = len(latencies)
+    elapsed = results['elapsed']
+    summary = {
+        'requests': requests,
+        'errors': results['errors'],
+        'error_rate': round(results['errors'] / requests, 4)
+        if requests else 0.0,
+        'statuses': results['statuses'],
+        'requests_per_sec': round(requests / elapsed, 2),
+        'events_per_sec': round(results['events'] / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'max_ms': round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+    if rows_written is not None:
+        summary['rows_written'] = rows_written
+        summary['db_rows_per_sec'] = round(rows_written / elapsed, 2)
+    return summary
+
+
+def compare(paths):
+    """Print saved runs side by side"""
+    columns = ('requests_per_sec', 'events_per_sec', 'db_rows_per_sec',
+               'p50_ms', 'p95_ms', 'p99_ms', 'error_rate')
+    print('%-28s %8s %5s' % ('run', 'mode', 'conc') +
+          ''.join(' %16s' % c for c in columns))
+    for path in paths:
+        with open(path) as f:
+            run = json.load(f)
+        meta, summary = run['meta'], run['results']
+        print('%-28s %8s %5d' % (meta.get('label') or path, meta['mode'],
+                                 meta['concurrency']) +
+              ''.join(' %16s' % summary.get(c, '-') for c in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', default='http://localhost:5000',
+                        help='base URL of the CKAN instance')
+    parser.add_argument('--mode', choices=MODES, default='sync')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=30,
+                        help='seconds to run for')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='cap on requests per second (0: no cap)')
+    parser.add_argument('--batch-size', type=int, default=20,
+                        help='events per request in batched mode')
+    parser.add_argument('--timeout', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--db', help='SQLAlchemy URL of the instance '
+                        'database, to count the rows written')
+    parser.add_argument('--label', help='name of the run in comparisons')
+    parser.add_argument('--output', help='write the JSON results here')
+    parser.add_argument('--compare', nargs='+', metavar='RUN',
+                        help='print saved runs side by side and exit')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(args.compare)
+        return 0
+    if args.mode != 'batched':
+        args.batch_size = 1
+
+    rows_before = tracking_rows(args.db) if args.db else None
+    results = asyncio.run(run_load(args))
+    rows_written = None
+    if args.db:
+        rows_written = tracking_rows(args.db) - rows_before
+
+    report = {
+        'meta': {
+            'label': args.label,
+            'commit': git_commit(),
+            'date': datetime.datetime.utcnow().isoformat(),
+            'url': args.url,
+            'mode': args.mode,
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'rate': args.rate,
+            'batch_size': args.batch_size,
+            'python': platform.python_version(),
+        },
+        'results': summarize(results, rows_written),
+    }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
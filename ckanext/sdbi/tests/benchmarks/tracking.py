@@ -0,0 +1,342 @@
+'''Benchmark the tracking helpers and endpoints against synthetic data.
+
+Loads synthetic ``tracking_raw`` rows into a throwaway database (SQLite by
+default, or a dedicated PostgreSQL database), then times
+``get_dataset_views_by_name``, ``get_dataset_downloads_by_name``,
+``get_total_visitors`` and the ``/sdbi/tracking`` endpoints, and writes the
+results as JSON::
+
+    python -m ckanext.sdbi.tests.benchmarks.tracking --rows 1m \\
+        --db sqlite:////tmp/sdbi-bench.db --output before.json
+    # ... change the code ...
+    python -m ckanext.sdbi.tests.benchmarks.tracking --rows 1m \\
+        --db sqlite:////tmp/sdbi-bench.db --reuse --output after.json \\
+        --compare before.json
+
+``--compare`` prints the change of every median and exits with status 1 if
+any got slower by more than ``--threshold`` (default 20%). The command also
+exits with status 1 if any call failed: the helpers swallow their errors
+and return zeros, so a DB error during a helper call, or all zeros for a
+dataset that has hits, counts as a failed call.
+
+The generated data is skewed like real traffic: a few datasets get most of
+the views, most hits are recent, and a minority of visitors make most of
+the requests. Never point ``--db`` at a CKAN database: the benchmark creates
+and fills its own ``package`` and ``tracking_raw`` tables.
+'''
+
+import argparse
+import datetime
+import io
+import json
+import platform
+import random
+import sys
+import time
+
+from sqlalchemy import create_engine, event, text
+
+from ckanext.sdbi.tests.benchmarks.common import (
+    compare, git_commit, report_errors, time_call)
+
+DEFAULT_DB = 'sqlite:////tmp/sdbi-bench.db'
+SEED = 20240101
+CHUNK_SIZE = 50000
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS package (
+        id VARCHAR(100) PRIMARY KEY,
+        name VARCHAR(100) NOT NULL UNIQUE
+    )""",
+    """CREATE TABLE IF NOT EXISTS tracking_raw (
+        user_key VARCHAR(100) NOT NULL,
+        url TEXT NOT NULL,
+        tracking_type VARCHAR(10) NOT NULL,
+        access_timestamp TIMESTAMP
+    )""",
+    # Same indexes as CKAN creates on tracking_raw
+    "CREATE INDEX IF NOT EXISTS tracking_raw_url ON tracking_raw (url)",
+    "CREATE INDEX IF NOT EXISTS tracking_raw_user_key "
+    "ON tracking_raw (user_key)",
+    "CREATE INDEX IF NOT EXISTS tracking_raw_access_timestamp "
+    "ON tracking_raw (access_timestamp)",
+]
+
+
+def parse_rows(value):
+    """Parse a row count such as ``1000000``, ``1m``, ``10M`` or ``500k``"""
+    value = value.strip().lower()
+    multiplier = 1
+    if value.endswith('m'):
+        multiplier, value = 1000000, value[:-1]
+    elif value.endswith('k'):
+        multiplier, value = 1000, value[:-1]
+    return int(float(value) * multiplier)
+
+
+def skewed_index(rnd, size, skew=3):
+    """Pick an index in ``range(size)`` favouring the low end"""
+    return min(int(size * rnd.random() ** skew), size - 1)
+
+
+def dataset_names(count):
+    return ['dataset-%06d' % i for i in range(count)]
+
+
+def dataset_id(index):
+    return '00000000-0000-4000-8000-%012d' % index
+
+
+def generate_rows(rows, datasets, visitors, now, rnd):
+    """Yield synthetic (user_key, url, tracking_type, access_timestamp)"""
+    names = dataset_names(datasets)
+    for _ in range(rows):
+        # Most traffic is recent: square the fraction of a year
+        age = datetime.timedelta(days=365 * rnd.random() ** 2,
+                                 seconds=rnd.randint(0, 86399))
+        timestamp = now - age
+
+        if rnd.random() < 0.1:
+            user_key = 'anonymous'
+        else:
+            user_key = 'visitor-%d' % skewed_index(rnd, visitors, 2)
+
+        kind = rnd.random()
+        index = skewed_index(rnd, datasets)
+        if kind < 0.80:
+            yield user_key, '/dataset/%s' % names[index], 'page', timestamp
+        elif kind < 0.95:
+            url = 'https://data.example.org/dataset/%s/resource/%s/' \
+                'download/data.csv' % (dataset_id(index),
+                                       dataset_id(rnd.randint(0, 9)))
+            yield user_key, url, 'resource', timestamp
+        else:
+            url = rnd.choice(['/', '/dataset/', '/organization/bnpb',
+                              '/dataset/?fase=prabencana'])
+            yield user_key, url, 'page', timestamp
+
+
+def create_schema(engine):
+    with engine.begin() as conn:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+
+
+def row_count(engine):
+    with engine.connect() as conn:
+        return conn.execute(text('SELECT COUNT(*) FROM tracking_raw')).scalar()
+
+
+def load(engine, rows, datasets, visitors, seed):
+    """Fill the package and tracking_raw tables, returning load seconds"""
+    rnd = random.Random(seed)
+    now = datetime.datetime.utcnow()
+    started = time.perf_counter()
+
+    with engine.begin() as conn:
+        conn.execute(text('DELETE FROM tracking_raw'))
+        conn.execute(text('DELETE FROM package'))
+        conn.execute(text('INSERT INTO package (id, name) VALUES (:id, :name)'),
+                     [{'id': dataset_id(i), 'name': name}
+                      for i, name in enumerate(dataset_names(datasets))])
+
+    generator = generate_rows(rows, datasets, visitors, now, rnd)
+    loaded = 0
+    while loaded < rows:
+        chunk = [next(generator) for _ in range(min(CHUNK_SIZE, rows - loaded))]
+        if engine.dialect.name == 'postgresql':
+            _copy_chunk(engine, chunk)
+        else:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    'INSERT INTO tracking_raw '
+                    '(user_key, url, tracking_type, access_timestamp) '
+                    'VALUES (:user_key, :url, :tracking_type, :ts)'),
+                    [{'user_key': r[0], 'url': r[1], 'tracking_type': r[2],
+                      'ts': r[3]} for r in chunk])
+        loaded += len(chunk)
+        print('loaded %d/%d rows' % (loaded, rows), file=sys.stderr)
+
+    with engine.begin() as conn:
+        if engine.dialect.name == 'postgresql':
+            conn.execute(text('ANALYZE tracking_raw'))
+        else:
+            conn.execute(text('ANALYZE'))
+    return time.perf_counter() - started
+
+
+def _copy_chunk(engine, chunk):
+    buf = io.StringIO()
+    for user_key, url, tracking_type, timestamp in chunk:
+        buf.write('%s\t%s\t%s\t%s\n' % (user_key, url, tracking_type,
+                                        timestamp.isoformat()))
+    buf.seek(0)
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.copy_expert(
+            'COPY tracking_raw (user_key, url, tracking_type, '
+            'access_timestamp) FROM STDIN', buf)
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def bind_session(engine):
+    """Point CKAN's scoped session at the benchmark database"""
+    import ckan.model as model
+    model.Session.remove()
+    model.Session.configure(bind=engine)
+    return model
+
+
+def helper_check(engine):
+    """Build ``check(expect_hits)`` result checks for the helpers
+
+    The helpers catch their exceptions and return zeros, so a call fails
+    when the DB raised an error during it or, for data known to have hits,
+    when every count is zero.
+    """
+    db_errors = []
+    event.listen(engine, 'handle_error',
+                 lambda context: db_errors.append(context.original_exception))
+
+    def check(expect_hits):
+        seen = [0]
+
+        def ok(result):
+            failed = len(db_errors) > seen[0]
+            seen[0] = len(db_errors)
+            return not failed and (not expect_hits or any(result.values()))
+        return ok
+    return check
+
+
+def bench_helpers(engine, datasets, repeat):
+    from ckanext.sdbi import plugin
+
+    names = dataset_names(datasets)
+    # The head of the skewed distribution has most rows, the tail few
+    hot = [(name,) for name in names[:5]]
+    cold = [(name,) for name in names[-5:]]
+    check = helper_check(engine)
+
+    results = {}
+    for helper in (plugin.get_dataset_views_by_name,
+                   plugin.get_dataset_downloads_by_name):
+        results['helper.%s.hot' % helper.__name__] = \
+            time_call(helper, hot, repeat, check(True))
+        results['helper.%s.cold' % helper.__name__] = \
+            time_call(helper, cold, repeat, check(False))
+    results['helper.get_total_visitors'] = \
+        time_call(plugin.get_total_visitors, [()], repeat, check(True))
+    return results
+
+
+def make_app():
+    """A bare Flask app serving the tracking routes"""
+    from flask import Flask
+    from ckanext.sdbi.controllers.tracking import TrackingController
+
+    app = Flask(__name__)
+    controller = TrackingController()
+    app.add_url_rule('/sdbi/tracking', 'track', controller.track,
+                     methods=['POST'])
+    app.add_url_rule('/sdbi/tracking/batch', 'track_batch',
+                     controller.track_batch, methods=['POST'])
+    return app
+
+
+def bench_endpoints(repeat):
+    client = make_app().test_client()
+
+    def track():
+        return client.post('/sdbi/tracking',
+                           json={'url': '/dataset/dataset-000001',
+                                 'type': 'page'})
+
+    batch = [{'url': '/dataset/dataset-%06d' % i, 'type': 'page'}
+             for i in range(20)]
+
+    def track_batch():
+        return client.post('/sdbi/tracking/batch', json=batch)
+
+    def ok(resp):
+        return resp.status_code == 200
+
+    return {
+        'endpoint.track': time_call(track, [()], repeat, ok),
+        'endpoint.track_batch_20': time_call(track_batch, [()], repeat, ok),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--db', default=DEFAULT_DB,
+                        help='SQLAlchemy URL of a throwaway database')
+    parser.add_argument('--rows', default='1m', type=parse_rows,
+                        help='tracking_raw rows, e.g. 1m, 10m, 50m')
+    parser.add_argument('--datasets', type=int, default=5000)
+    parser.add_argument('--visitors', type=int, default=None,
+                        help='distinct visitors (default: rows / 20)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--reuse', action='store_true',
+                        help='reuse loaded data if the row count matches')
+    parser.add_argument('--skip-endpoints', action='store_true')
+    parser.add_argument('--output', help='write the JSON results here')
+    parser.add_argument('--compare', help='baseline JSON results file')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    engine = create_engine(args.db)
+    create_schema(engine)
+
+    load_seconds = None
+    existing = row_count(engine)
+    if not (args.reuse and existing == args.rows):
+        if existing and not args.reuse:
+            parser.error('tracking_raw already has %d rows, use --reuse or '
+                         'an empty database' % existing)
+        load_seconds = load(engine, args.rows, args.datasets,
+                            args.visitors or max(args.rows // 20, 1),
+                            args.seed)
+
+    bind_session(engine)
+    results = bench_helpers(engine, args.datasets, args.repeat)
+    if not args.skip_endpoints:
+        results.update(bench_endpoints(args.repeat * 20))
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'date': datetime.datetime.utcnow().isoformat(),
+            'db': engine.dialect.name,
+            'rows': args.rows,
+            'datasets': args.datasets,
+            'repeat': args.repeat,
+            'load_seconds': load_seconds,
+            'python': platform.python_version(),
+        },
+        'results': results,
+    }
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            return 1
+    if report_errors(results):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""Tests for activity.py."""
+import pytest
+
+import ckan.model as model
+import ckan.tests.factories as factories
+
+from ckanext.sdbi import activity
+
+
+@pytest.mark.usefixtures("clean_db")
+class TestActingUser(object):
+
+    def test_cached_for_the_same_user(self):
+        user = factories.User()
+        context = {'model': model, 'user': user['name']}
+
+        first = activity.acting_user(context)
+
+        assert first.id == user['id']
+        assert activity.acting_user(context) is first
+
+    def test_looked_up_again_when_the_user_changes(self):
+        user = factories.User()
+        other = factories.User()
+        context = {'model': model, 'user': user['name']}
+        activity.acting_user(context)
+
+        copied = dict(context, user=other['name'])
+
+        assert activity.acting_user(copied).id == other['id']
+        assert activity.acting_user(context).id == user['id']
+
+    def test_not_logged_in(self):
+        context = {'model': model, 'user': ''}
+
+        assert activity.acting_user(context) is None
+        assert activity.acting_user_id(context) == activity.NOT_LOGGED_IN
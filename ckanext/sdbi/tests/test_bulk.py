@@ -0,0 +1,87 @@
+"""Tests for bulk.py."""
+import pytest
+
+import ckan.lib.search as search
+import ckan.model as model
+import ckan.plugins as plugins
+import ckan.tests.helpers as helpers
+
+from ckanext.sdbi import bulk
+
+
+def test_chunks():
+    assert list(bulk.chunks([1, 2, 3, 4, 5], 2)) == [[1, 2], [3, 4], [5]]
+    assert list(bulk.chunks([], 2)) == []
+
+
+@pytest.mark.parametrize('data_dict, expected', [
+    (None, bulk.DEFAULT_CHUNK_SIZE),
+    ({'chunk_size': 10}, 10),
+    ({'chunk_size': '25'}, 25),
+    ({'chunk_size': 0}, bulk.DEFAULT_CHUNK_SIZE),
+    ({'chunk_size': -5}, 1),
+    ({'chunk_size': 'many'}, bulk.DEFAULT_CHUNK_SIZE),
+])
+def test_chunk_size(data_dict, expected):
+    assert bulk.chunk_size(data_dict) == expected
+
+
+@pytest.mark.ckan_config('ckanext.sdbi.bulk.chunk_size', '50')
+def test_chunk_size_from_config():
+    assert bulk.chunk_size({}) == 50
+    assert bulk.chunk_size({'chunk_size': 5}) == 5
+
+
+def _found(name):
+    return helpers.call_action('package_search', q='name:%s' % name)['count']
+
+
+def _new_package(name):
+    pkg = model.Package(name=name)
+    model.Session.add(pkg)
+    return pkg
+
+
+@pytest.mark.usefixtures('clean_db', 'clean_index')
+class TestCommitDeferringSearch(object):
+
+    def test_packages_are_not_indexed(self):
+        pkg = _new_package('deferred')
+
+        bulk.commit_deferring_search(model.Session)
+
+        assert model.Package.get('deferred') is not None
+        assert _found('deferred') == 0
+        assert bulk.index_packages([pkg.id]) == []
+        assert _found('deferred') == 1
+
+    def test_later_commits_still_index(self):
+        _new_package('deferred')
+        bulk.commit_deferring_search(model.Session)
+
+        _new_package('indexed')
+        model.Session.commit()
+
+        assert _found('indexed') == 1
+        assert _found('deferred') == 0
+
+    def test_other_observers_are_notified(self, monkeypatch):
+        notified = []
+
+        class Observer(object):
+            def notify(self, entity, operation):
+                notified.append((entity.name, operation))
+
+        observers = [search.SynchronousSearchPlugin(), Observer()]
+        implementations = plugins.PluginImplementations
+        monkeypatch.setattr(
+            plugins, 'PluginImplementations',
+            lambda interface: observers
+            if interface is plugins.IDomainObjectModification
+            else implementations(interface))
+        _new_package('deferred')
+
+        bulk.commit_deferring_search(model.Session)
+
+        assert ('deferred', model.DomainObjectOperation.new) in notified
+        assert _found('deferred') == 0
@@ -0,0 +1,136 @@
+"""Tests for bulk_jobs.py."""
+import json
+
+import pytest
+
+from ckanext.sdbi import bulk_jobs
+from ckanext.sdbi import update
+
+
+class FakeRedis(object):
+    """The hash commands bulk_jobs uses, storing bytes like redis-py"""
+
+    def __init__(self):
+        self.hashes = {}
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def hset(self, key, name, value):
+        self.hashes.setdefault(key, {})[name.encode('utf-8')] = \
+            str(value).encode('utf-8')
+
+    def expire(self, key, seconds):
+        pass
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        pass
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(bulk_jobs, '_redis', lambda: fake)
+    return fake
+
+
+@pytest.fixture
+def now(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(bulk_jobs.time, 'time', lambda: clock[0])
+    return clock
+
+
+def _job(redis, **fields):
+    progress = {'action': 'private', 'org_id': 'org', 'state': 'running',
+                'total': 200, 'done': 0, 'created': 900.0}
+    progress.update(fields)
+    bulk_jobs._save(redis, 'job', **progress)
+    return 'job'
+
+
+def test_status_of_unknown_job(redis):
+    assert bulk_jobs.status('missing') is None
+
+
+def test_status_before_the_first_chunk(redis, now):
+    status = bulk_jobs.status(_job(redis, state='queued'))
+
+    assert status['state'] == 'queued'
+    assert (status['done'], status['total']) == (0, 200)
+    assert status['rate'] is None
+    assert status['eta'] is None
+
+
+def test_status_rate_and_eta(redis, now):
+    job_id = _job(redis, started=990.0, started_done=0, done=50)
+
+    status = bulk_jobs.status(job_id)
+
+    assert status['rate'] == 5.0
+    assert status['eta'] == 30.0
+    assert status['created'] == 900.0
+    assert status['finished'] is None
+
+
+def test_status_of_a_resumed_job_counts_from_the_restart(redis, now):
+    job_id = _job(redis, started=990.0, started_done=40, done=60)
+
+    status = bulk_jobs.status(job_id)
+
+    assert status['rate'] == 2.0
+    assert status['eta'] == 70.0
+
+
+def test_status_of_a_finished_job_uses_the_finish_time(redis, now):
+    job_id = _job(redis, state='done', started=900.0, started_done=0,
+                  done=200, finished=950.0)
+
+    status = bulk_jobs.status(job_id)
+
+    assert status['rate'] == 4.0
+    assert status['eta'] == 0.0
+    assert status['finished'] == 950.0
+
+
+def test_resume(redis, monkeypatch):
+    queued = []
+    monkeypatch.setattr(bulk_jobs, '_enqueue_job',
+                        lambda *args: queued.append(args))
+    job_id = _job(redis, state='error', error='Solr is down', done=100)
+
+    assert bulk_jobs.resume(job_id)
+
+    status = bulk_jobs.status(job_id)
+    assert (status['state'], status['error'], status['done']) == \
+        ('queued', '', 100)
+    assert queued == [(job_id, 'private', 'org')]
+
+
+def test_resume_a_finished_job(redis, monkeypatch):
+    monkeypatch.setattr(bulk_jobs, '_enqueue_job', lambda *args: None)
+
+    assert not bulk_jobs.resume(_job(redis, state='done'))
+    assert not bulk_jobs.resume('missing')
+
+
+def test_job_carries_on_after_the_last_chunk(redis, monkeypatch):
+    chunks = []
+    monkeypatch.setattr(
+        update, '_bulk_update_dataset',
+        lambda context, data_dict, update_dict:
+            chunks.append((data_dict['datasets'], update_dict)))
+    datasets = ['d%d' % i for i in range(5)]
+    job_id = _job(redis, datasets=json.dumps(datasets),
+                  update=json.dumps({'private': True}), chunk_size=2,
+                  total=5, done=2, user='')
+
+    bulk_jobs.bulk_update_job(job_id)
+
+    assert chunks == [(['d2', 'd3'], {'private': True}),
+                      (['d4'], {'private': True})]
+    status = bulk_jobs.status(job_id)
+    assert (status['state'], status['done']) == ('done', 5)
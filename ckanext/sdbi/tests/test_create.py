@@ -0,0 +1,361 @@
+"""Tests for create.py."""
+import hashlib
+import io
+import threading
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import ckan.lib.uploader as uploader
+import ckan.logic as logic
+import ckan.model as model
+import ckan.tests.factories as factories
+import ckan.tests.helpers as helpers
+
+from ckanext.sdbi import bulk
+
+
+def _group_members(group_id, table_name):
+    return dict((member.table_id, member.capacity) for member in
+                model.Session.query(model.Member)
+                .filter(model.Member.group_id == group_id)
+                .filter(model.Member.table_name == table_name)
+                .filter(model.Member.state == 'active'))
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.usefixtures("clean_db", "clean_index", "with_plugins")
+class TestMemberCreateMany(object):
+
+    def test_adds_datasets_to_a_group(self):
+        group = factories.Group()
+        datasets = [factories.Dataset() for _ in range(3)]
+
+        result = helpers.call_action(
+            'member_create_many', id=group['name'], object_type='package',
+            members=[[dataset['name'], 'public'] for dataset in datasets])
+
+        ids = [dataset['id'] for dataset in datasets]
+        assert result == {'created': ids, 'updated': [], 'unchanged': [],
+                          'errors': []}
+        assert _group_members(group['id'], 'package') == \
+            dict((package_id, 'public') for package_id in ids)
+        # Reindexed once after the commit
+        found = helpers.call_action('package_search',
+                                    fq='groups:%s' % group['name'])
+        assert found['count'] == 3
+
+    def test_existing_members_are_updated_or_left_unchanged(self):
+        group = factories.Group()
+        kept = factories.Dataset(groups=[{'id': group['id']}])
+        changed = factories.Dataset(groups=[{'id': group['id']}])
+
+        result = helpers.call_action(
+            'member_create_many', id=group['id'], object_type='package',
+            members=[{'object': kept['id'], 'capacity': 'public'},
+                     {'object': changed['name'], 'capacity': 'private'}])
+
+        assert result['created'] == []
+        assert result['updated'] == [changed['id']]
+        assert result['unchanged'] == [kept['id']]
+        assert _group_members(group['id'], 'package')[changed['id']] == \
+            'private'
+
+    def test_unknown_objects_are_reported(self):
+        group = factories.Group()
+        dataset = factories.Dataset()
+
+        result = helpers.call_action(
+            'member_create_many', id=group['id'], object_type='package',
+            members=[['missing', 'public'], [dataset['id'], 'public']])
+
+        assert result['created'] == [dataset['id']]
+        assert [(error['index'], error['object'])
+                for error in result['errors']] == [(0, 'missing')]
+
+    def test_last_pair_for_an_object_wins(self):
+        group = factories.Group()
+        user = factories.User()
+
+        result = helpers.call_action(
+            'member_create_many', id=group['id'], object_type='user',
+            members=[[user['name'], 'member'], [user['id'], 'editor']])
+
+        assert result['created'] == [user['id']]
+        assert _group_members(group['id'], 'user')[user['id']] == 'editor'
+
+    def test_unknown_group(self):
+        with pytest.raises(logic.NotFound):
+            helpers.call_action('member_create_many', id='missing',
+                                object_type='package', members=[])
+
+    def test_organization_member_create_many(self):
+        org = factories.Organization()
+        users = [factories.User() for _ in range(2)]
+
+        result = helpers.call_action(
+            'organization_member_create_many', id=org['name'],
+            members=[{'username': users[0]['name'], 'role': 'editor'},
+                     {'username': users[1]['name'], 'role': 'member'}])
+
+        assert sorted(result['created']) == \
+            sorted(user['id'] for user in users)
+        members = _group_members(org['id'], 'user')
+        assert members[users[0]['id']] == 'editor'
+        assert members[users[1]['id']] == 'member'
+
+    def test_organization_member_create_many_checks_roles(self):
+        org = factories.Organization()
+        user = factories.User()
+
+        with pytest.raises(logic.ValidationError):
+            helpers.call_action(
+                'organization_member_create_many', id=org['id'],
+                members=[[user['name'], 'owner']])
+
+
+def _activities(package_id):
+    return (model.Session.query(model.Activity)
+            .filter(model.Activity.object_id == package_id)
+            .order_by(model.Activity.timestamp).all())
+
+
+def _comparable(resource):
+    return dict((key, value) for key, value in resource.items()
+                if key not in ('id', 'package_id', 'created',
+                               'metadata_modified'))
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.usefixtures("clean_db", "clean_index", "with_plugins")
+class TestResourceCreateFastAppend(object):
+
+    def _append(self, fast_append):
+        user = factories.User()
+        dataset = factories.Dataset(
+            user=user, resources=[{'url': 'http://example.com/first.csv',
+                                   'name': 'first'}])
+        before = model.Package.get(dataset['id']).metadata_modified
+        activities = len(_activities(dataset['id']))
+
+        context = {'user': user['name'], 'fast_append': fast_append}
+        resource = helpers.call_action(
+            'resource_create', context=context, package_id=dataset['id'],
+            url='http://example.com/second.csv', name='second',
+            format='CSV', description='Second file')
+
+        pkg_dict = helpers.call_action('package_show', id=dataset['id'])
+        after = model.Package.get(dataset['id']).metadata_modified
+        new_activities = _activities(dataset['id'])[activities:]
+        return resource, pkg_dict, before, after, new_activities
+
+    def test_same_result_as_the_full_path(self):
+        full = self._append(fast_append=False)
+        fast = self._append(fast_append=True)
+
+        for resource, pkg_dict, before, after, activities in (full, fast):
+            assert resource['position'] == 1
+            assert [res['name'] for res in pkg_dict['resources']] == \
+                ['first', 'second']
+            assert pkg_dict['resources'][1] == resource
+            assert after > before
+            assert [row.activity_type for row in activities] == \
+                ['changed package']
+            assert [res['id'] for res in
+                    activities[0].data['package']['resources']] == \
+                [res['id'] for res in pkg_dict['resources']]
+
+        assert _comparable(fast[0]) == _comparable(full[0])
+        assert [_comparable(res) for res in fast[1]['resources']] == \
+            [_comparable(res) for res in full[1]['resources']]
+        assert fast[1]['num_resources'] == full[1]['num_resources']
+
+    def test_concurrent_appends_get_distinct_positions(self):
+        dataset = factories.Dataset()
+        errors = []
+
+        def append(index):
+            try:
+                helpers.call_action(
+                    'resource_create', context={'fast_append': True},
+                    package_id=dataset['id'],
+                    url='http://example.com/%d.csv' % index)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                # Each thread has its own scoped session
+                model.Session.remove()
+
+        threads = [threading.Thread(target=append, args=(index,))
+                   for index in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        pkg_dict = helpers.call_action('package_show', id=dataset['id'])
+        assert sorted(res['position'] for res in pkg_dict['resources']) == \
+            list(range(5))
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.usefixtures("clean_db", "clean_index", "with_plugins")
+class TestPackageCreateMany(object):
+
+    def test_invalid_dataset_does_not_stop_the_chunk(self):
+        result = helpers.call_action('package_create_many', datasets=[
+            {'name': 'first'},
+            {'name': 'Not Valid!'},
+            {'name': 'third'},
+            {'name': 'first'},
+        ])
+
+        assert result['ids'][0] and result['ids'][2]
+        assert result['ids'][1] is None and result['ids'][3] is None
+        assert [(error['index'], error['name'])
+                for error in result['errors']] == \
+            [(1, 'Not Valid!'), (3, 'first')]
+        assert 'name' in result['errors'][0]['errors']
+        assert model.Package.get('first').id == result['ids'][0]
+        assert model.Package.get('third').id == result['ids'][2]
+
+    def test_returns_only_ids(self):
+        result = helpers.call_action('package_create_many', datasets=[
+            {'name': 'first', 'resources': [{'url': 'http://example.com'}]}])
+
+        assert set(result) == {'ids', 'errors'}
+        assert result['errors'] == []
+        pkg = model.Package.get(result['ids'][0])
+        assert pkg.name == 'first'
+        assert len(pkg.resources) == 1
+
+    def test_adds_organization_memberships(self):
+        org = factories.Organization()
+
+        result = helpers.call_action('package_create_many', datasets=[
+            {'name': 'in-org', 'owner_org': org['name']},
+            {'name': 'no-org'}])
+
+        in_org, no_org = result['ids']
+        assert model.Package.get(in_org).owner_org == org['id']
+        assert _group_members(org['id'], 'package') == \
+            {in_org: 'organization'}
+        assert model.Session.query(model.Member) \
+            .filter(model.Member.table_id == no_org).count() == 0
+
+    def test_records_new_package_activities(self):
+        user = factories.User()
+
+        result = helpers.call_action(
+            'package_create_many', context={'user': user['name']},
+            datasets=[{'name': 'first', 'title': 'First'}])
+
+        activities = _activities(result['ids'][0])
+        assert [row.activity_type for row in activities] == ['new package']
+        assert activities[0].user_id == user['id']
+        assert activities[0].data['actor'] == user['name']
+        assert activities[0].data['package']['id'] == result['ids'][0]
+        assert activities[0].data['package']['title'] == 'First'
+
+    def test_reindexes_once_after_commit(self, monkeypatch):
+        calls = []
+        index_packages = bulk.index_packages
+
+        def recording_index_packages(package_ids):
+            # Counted on another connection, so only committed rows
+            committed = model.meta.engine.execute(
+                'SELECT count(*) FROM package WHERE id = ANY(%s)',
+                (list(package_ids),)).scalar()
+            calls.append((list(package_ids), committed))
+            return index_packages(package_ids)
+        monkeypatch.setattr(bulk, 'index_packages', recording_index_packages)
+
+        result = helpers.call_action(
+            'package_create_many', chunk_size=2,
+            datasets=[{'name': 'dataset-%d' % i} for i in range(5)])
+
+        assert calls == [(result['ids'], 5)]
+        found = helpers.call_action('package_search', q='name:dataset-*')
+        assert found['count'] == 5
+
+
+def _file(content, filename='data.csv'):
+    return FileStorage(stream=io.BytesIO(content), filename=filename)
+
+
+@pytest.fixture
+def storage_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploader, 'get_storage_path', lambda: str(tmp_path))
+    return tmp_path
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.ckan_config("ckanext.sdbi.upload.streaming", "true")
+@pytest.mark.usefixtures("clean_db", "clean_index", "with_plugins")
+class TestResourceCreateStreamed(object):
+
+    def _stored(self, resource):
+        path = uploader.ResourceUpload({}).get_path(resource['id'])
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_fills_size_and_hash(self, storage_path):
+        dataset = factories.Dataset()
+        content = b'a,b\n1,2\n' * 1000
+
+        resource = helpers.call_action(
+            'resource_create', package_id=dataset['id'],
+            upload=_file(content))
+
+        assert resource['url_type'] == 'upload'
+        assert resource['size'] == len(content)
+        assert resource['hash'] == hashlib.sha256(content).hexdigest()
+        assert self._stored(resource) == content
+        shown = helpers.call_action('resource_show', id=resource['id'])
+        assert (shown['size'], shown['hash']) == \
+            (resource['size'], resource['hash'])
+
+    def test_several_files_in_one_request(self, storage_path):
+        dataset = factories.Dataset()
+        contents = [b'first', b'second' * 100, b'third']
+
+        created = helpers.call_action(
+            'resource_create_many', package_id=dataset['id'],
+            resources=[{'name': str(index),
+                        'upload': _file(content, '%d.csv' % index)}
+                       for index, content in enumerate(contents)])
+
+        assert [resource['name'] for resource in created] == ['0', '1', '2']
+        for resource, content in zip(created, contents):
+            assert resource['size'] == len(content)
+            assert resource['hash'] == hashlib.sha256(content).hexdigest()
+            assert self._stored(resource) == content
+
+    def test_failed_upload_leaves_no_resource(self, storage_path,
+                                              monkeypatch):
+        monkeypatch.setattr(uploader, 'get_max_resource_size', lambda: 1)
+        dataset = factories.Dataset()
+
+        with pytest.raises(logic.ValidationError):
+            helpers.call_action(
+                'resource_create', package_id=dataset['id'],
+                upload=_file(b'x' * (2 * 1024 * 1024)))
+
+        assert model.Session.query(model.Resource) \
+            .filter(model.Resource.package_id == dataset['id']).count() == 0
+        assert [path for path in storage_path.rglob('*')
+                if path.is_file()] == []
+
+    def test_failed_create_removes_the_file(self, storage_path):
+        dataset = factories.Dataset()
+
+        with pytest.raises(logic.ValidationError):
+            helpers.call_action(
+                'resource_create', package_id=dataset['id'],
+                upload=_file(b'content'), created='not a date')
+
+        assert model.Session.query(model.Resource) \
+            .filter(model.Resource.package_id == dataset['id']).count() == 0
+        assert [path for path in storage_path.rglob('*')
+                if path.is_file()] == []
@@ -0,0 +1,42 @@
+"""Tests for controllers/google_forms.py."""
+import pytest
+
+import ckan.tests.factories as factories
+
+
+def _form(**kwargs):
+    form = {'title': 'Survey', 'form_url': 'https://forms.example.com/f',
+            'category': 'general', 'status': 'active'}
+    form.update(kwargs)
+    return form
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.usefixtures("clean_db", "with_plugins")
+class TestSaveForm(object):
+
+    def _post(self, app, url, data, user=None):
+        if user is None:
+            user = factories.Sysadmin()
+        return app.post(url, data=data,
+                        extra_environ={'REMOTE_USER': str(user['name'])})
+
+    @pytest.mark.parametrize('url', ['/google-forms/create',
+                                     '/google-forms/edit/1'])
+    @pytest.mark.parametrize('data', [
+        _form(targeting_url_regex='('),
+        _form(targeting_sample='many'),
+        _form(targeting_sample='150'),
+        _form(title=''),
+    ])
+    def test_invalid_input_is_a_bad_request(self, app, url, data):
+        res = self._post(app, url, data)
+
+        assert res.status_code == 400
+
+    def test_needs_a_sysadmin(self, app):
+        res = self._post(app, '/google-forms/create',
+                         _form(targeting_url_regex='('),
+                         user=factories.User())
+
+        assert res.status_code == 403
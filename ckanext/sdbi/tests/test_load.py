@@ -0,0 +1,138 @@
+"""Tests for the tracking load generator, benchmarks/load.py."""
+import asyncio
+import json
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from ckanext.sdbi.tests.benchmarks import load
+
+
+def _split(request):
+    head, _, body = request.partition(b'\r\n\r\n')
+    lines = head.decode('utf-8').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines[1:])
+    return lines[0], headers, body
+
+
+def _reader(data):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await load.read_response(reader)
+    return asyncio.run(read())
+
+
+def test_build_request_sync():
+    request, events = load.build_request('sync', 'localhost:5000', '/ckan',
+                                         20, random.Random(1))
+
+    request_line, headers, body = _split(request)
+    assert request_line == 'POST /ckan/sdbi/tracking HTTP/1.1'
+    assert headers['Host'] == 'localhost:5000'
+    assert int(headers['Content-Length']) == len(body)
+    assert json.loads(body.decode('utf-8'))['type'] == 'page'
+    assert events == 1
+
+
+def test_build_request_batched():
+    request, events = load.build_request('batched', 'localhost', '', 20,
+                                         random.Random(1))
+
+    request_line, headers, body = _split(request)
+    assert request_line == 'POST /sdbi/tracking/batch HTTP/1.1'
+    assert len(json.loads(body.decode('utf-8'))) == 20
+    assert events == 20
+
+
+def test_build_request_page():
+    request, events = load.build_request('page', 'localhost', '', 20,
+                                         random.Random(1))
+
+    request_line, headers, body = _split(request)
+    assert request_line.startswith('GET /sdbi/tracking/page?url=%2Fdataset')
+    assert body == b''
+    assert events == 1
+
+
+def test_read_response_with_content_length():
+    assert _reader(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok') == \
+        (200, True)
+
+
+def test_read_response_chunked_and_close():
+    assert _reader(b'HTTP/1.1 500 ERROR\r\nTransfer-Encoding: chunked\r\n'
+                   b'Connection: close\r\n\r\n2\r\nok\r\n0\r\n\r\n') == \
+        (500, False)
+
+
+def test_read_response_closed_connection():
+    with pytest.raises(ConnectionError):
+        _reader(b'')
+
+
+def test_percentile():
+    values = list(range(100))
+
+    assert load.percentile(values, 0.5) == 50
+    assert load.percentile(values, 0.99) == 99
+    assert load.percentile(values, 1.0) == 99
+    assert load.percentile([], 0.5) == 0.0
+
+
+def test_summarize():
+    results = {'latencies': [0.002, 0.001, 0.004, 0.003], 'errors': 1,
+               'events': 30, 'statuses': {'200': 3, '500': 1},
+               'elapsed': 2.0}
+
+    summary = load.summarize(results, 10)
+
+    assert summary['requests'] == 4
+    assert summary['error_rate'] == 0.25
+    assert summary['requests_per_sec'] == 2.0
+    assert summary['events_per_sec'] == 15.0
+    assert summary['p50_ms'] == 3.0
+    assert summary['max_ms'] == 4.0
+    assert summary['db_rows_per_sec'] == 5.0
+
+
+def test_run_load_against_a_local_server():
+    async def run():
+        bodies = []
+
+        async def handle(reader, writer):
+            # One keep-alive connection per worker, until it closes
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    writer.close()
+                    return
+                length = [int(line.split(b':')[1]) for line in
+                          head.split(b'\r\n')
+                          if line.lower().startswith(b'content-length')]
+                bodies.append(await reader.readexactly(length[0]))
+                status = b'200 OK' if len(bodies) % 2 else b'400 BAD'
+                writer.write(b'HTTP/1.1 ' + status +
+                             b'\r\nContent-Length: 0\r\n\r\n')
+                await writer.drain()
+
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        args = SimpleNamespace(url='http://127.0.0.1:%d' % port,
+                               mode='batched', batch_size=5, concurrency=2,
+                               duration=0.2, rate=50, timeout=1, seed=1)
+        try:
+            results = await load.run_load(args)
+        finally:
+            server.close()
+        return results, bodies
+
+    results, bodies = asyncio.run(run())
+
+    requests = len(results['latencies'])
+    assert requests == len(bodies) > 0
+    assert results['errors'] == results['statuses'].get('400', 0)
+    assert results['events'] == 5 * results['statuses']['200']
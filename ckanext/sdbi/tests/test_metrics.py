@@ -0,0 +1,89 @@
+"""Tests for metrics.py."""
+import threading
+
+import pytest
+
+from ckanext.sdbi import metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    with metrics._stores_lock:
+        del metrics._stores[:]
+    if hasattr(metrics._local, 'store'):
+        del metrics._local.store
+    yield
+
+
+def test_render_counters():
+    metrics.inc('sdbi_tracking_rows_total', (('endpoint', 'track'),))
+    metrics.inc('sdbi_tracking_rows_total', (('endpoint', 'track'),), 4)
+    metrics.inc('sdbi_tracking_errors_total')
+
+    assert metrics.render().splitlines() == [
+        '# HELP sdbi_tracking_errors_total Failed tracking requests',
+        '# TYPE sdbi_tracking_errors_total counter',
+        'sdbi_tracking_errors_total 1',
+        '# HELP sdbi_tracking_rows_total Tracking rows saved',
+        '# TYPE sdbi_tracking_rows_total counter',
+        'sdbi_tracking_rows_total{endpoint="track"} 5',
+    ]
+
+
+def test_render_histogram_buckets_are_cumulative():
+    labels = (('endpoint', 'tracking.track'),)
+    for value in (0, 1, 3, 1000):
+        metrics.observe('sdbi_request_db_queries', labels, value,
+                        metrics.QUERY_BUCKETS)
+
+    lines = metrics.render().splitlines()
+
+    assert lines[:2] == [
+        '# HELP sdbi_request_db_queries DB queries per request to SDBI routes',
+        '# TYPE sdbi_request_db_queries histogram']
+    buckets = [line for line in lines if '_bucket' in line]
+    assert buckets[0] == 'sdbi_request_db_queries_bucket' \
+        '{endpoint="tracking.track",le="0.0"} 1'
+    assert buckets[1].endswith('le="1.0"} 2')
+    assert buckets[3].endswith('le="5.0"} 3')
+    assert buckets[-2].endswith('le="500.0"} 3')
+    assert buckets[-1].endswith('le="+Inf"} 4')
+    assert 'sdbi_request_db_queries_sum{endpoint="tracking.track"} 1004.0' \
+        in lines
+    assert 'sdbi_request_db_queries_count{endpoint="tracking.track"} 4' \
+        in lines
+
+
+def test_render_merges_threads():
+    def record():
+        metrics.inc('sdbi_requests_total', (('status', '200'),))
+
+    threads = [threading.Thread(target=record) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    record()
+
+    assert 'sdbi_requests_total{status="200"} 4' in \
+        metrics.render().splitlines()
+
+
+def test_render_escapes_label_values():
+    metrics.inc('sdbi_cache_requests_total', (('cache', 'a"b\\c'),))
+
+    assert 'sdbi_cache_requests_total{cache="a\\"b\\\\c"} 1' in \
+        metrics.render().splitlines()
+
+
+def test_instrument_helper_records_failed_calls():
+    def helper():
+        raise ValueError()
+
+    wrapped = metrics.instrument_helper('broken', helper)
+    with pytest.raises(ValueError):
+        wrapped()
+
+    lines = metrics.render().splitlines()
+    assert 'sdbi_helper_calls_total{helper="broken"} 1' in lines
+    assert 'sdbi_helper_duration_seconds_count{helper="broken"} 1' in lines
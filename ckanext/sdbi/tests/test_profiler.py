@@ -0,0 +1,93 @@
+"""Tests for profiler.py."""
+import json
+
+from ckanext.sdbi import profiler
+
+
+def test_statement_shape():
+    assert profiler._statement_shape(
+        'SELECT *\n  FROM package\n WHERE id IN (%(id_1)s, %(id_2)s)') == \
+        'SELECT * FROM package WHERE id IN (...)'
+    assert profiler._statement_shape(
+        'SELECT * FROM package WHERE id IN (?, ?, ?)') == \
+        profiler._statement_shape('SELECT * FROM package WHERE id IN (?, ?)')
+
+
+def test_summarize():
+    helper = 'ckanext.sdbi.plugin:get_dataset_views_by_name'
+    queries = [('SELECT 1', helper, 0.010)] * 6 + \
+        [('SELECT 2', 'action:package_show', 0.002),
+         ('SELECT 3', 'core', 0.0005)]
+
+    summary = profiler.summarize(queries, 5)
+
+    assert summary['queries'] == 8
+    assert summary['time_ms'] == 62.5
+    assert summary['by_owner'] == {helper: [6, 60.0],
+                                   'action:package_show': [1, 2.0],
+                                   'core': [1, 0.5]}
+    assert summary['n_plus_one'] == [
+        {'statement': 'SELECT 1', 'count': 6, 'owner': helper}]
+
+
+def test_summarize_threshold_is_exclusive():
+    queries = [('SELECT 1', 'core', 0.001)] * 5
+
+    assert profiler.summarize(queries, 5)['n_plus_one'] == []
+    assert len(profiler.summarize(queries, 4)['n_plus_one']) == 1
+
+
+def test_summarize_sorts_and_truncates_candidates():
+    queries = [('SELECT a' + 'x' * 300, 'core', 0.001)] * 3 + \
+        [('SELECT b', 'core', 0.001)] * 4
+
+    n_plus_one = profiler.summarize(queries, 2)['n_plus_one']
+
+    assert [item['count'] for item in n_plus_one] == [4, 3]
+    assert len(n_plus_one[1]['statement']) == 200
+
+
+def test_summarize_nothing():
+    assert profiler.summarize([], 5) == {
+        'queries': 0, 'time_ms': 0.0, 'by_owner': {}, 'n_plus_one': []}
+
+
+def _long_summary(candidates=50, owners=0):
+    queries = []
+    for index in range(candidates):
+        queries += [('SELECT %d ' % index + 'x' * 300, 'core', 0.001)] * 3
+    for index in range(owners):
+        queries.append(('SELECT 1', 'ckanext.sdbi.plugin:owner_%d_%s'
+                        % (index, 'y' * 50), 0.001))
+    return profiler.summarize(queries, 2)
+
+
+def test_header_value_fits_as_is():
+    summary = profiler.summarize([('SELECT 1', 'core', 0.001)] * 3, 2)
+
+    assert json.loads(profiler.header_value(summary)) == summary
+
+
+def test_header_value_keeps_the_first_candidates():
+    summary = _long_summary()
+    assert len(json.dumps(summary)) > profiler.MAX_HEADER_LENGTH
+
+    header = profiler.header_value(summary)
+
+    assert len(header) <= profiler.MAX_HEADER_LENGTH
+    parsed = json.loads(header)
+    assert parsed['truncated'] is True
+    assert parsed['n_plus_one'] == summary['n_plus_one'][:5]
+    assert parsed['queries'] == summary['queries']
+
+
+def test_header_value_drops_whole_fields():
+    summary = _long_summary(owners=200)
+
+    header = profiler.header_value(summary)
+
+    assert len(header) <= profiler.MAX_HEADER_LENGTH
+    parsed = json.loads(header)
+    assert parsed == {'queries': summary['queries'],
+                      'time_ms': summary['time_ms'], 'by_owner': {},
+                      'n_plus_one': [], 'truncated': True}
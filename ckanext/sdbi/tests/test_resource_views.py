@@ -0,0 +1,71 @@
+"""Tests for resource_views.py."""
+import pytest
+
+import ckan.lib.jobs as jobs
+import ckan.model as model
+import ckan.tests.helpers as helpers
+from ckan.lib.redis import connect_to_redis
+
+from ckanext.sdbi import resource_views
+
+
+def _resource():
+    return {'url': 'http://example.org/image.png', 'format': 'PNG'}
+
+
+def _views(resource_id):
+    return model.Session.query(model.ResourceView) \
+        .filter_by(resource_id=resource_id).count()
+
+
+@pytest.fixture
+def queued(monkeypatch):
+    calls = []
+    monkeypatch.setattr(jobs, 'enqueue',
+                        lambda func, args, title=None: calls.append(args))
+    return calls
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi image_view")
+@pytest.mark.ckan_config("ckan.views.default_views", "image_view")
+@pytest.mark.ckan_config("ckanext.sdbi.resource_views.background", "true")
+@pytest.mark.usefixtures("clean_db", "with_plugins")
+class TestBackgroundDefaultViews(object):
+
+    def test_package_create_queues_a_job(self, queued):
+        dataset = helpers.call_action('package_create', name='views',
+                                      resources=[_resource()])
+        resource_id = dataset['resources'][0]['id']
+
+        assert queued == [[dataset['id'], [resource_id]]]
+        assert _views(resource_id) == 0
+
+    def test_resources_with_a_queued_job_are_skipped(self, queued):
+        dataset = helpers.call_action('package_create', name='views',
+                                      resources=[_resource()])
+
+        resource_views.enqueue_default_views({}, dataset)
+
+        assert len(queued) == 1
+
+    def test_job_creates_the_views_and_clears_the_key(self, queued):
+        dataset = helpers.call_action('package_create', name='views',
+                                      resources=[_resource()])
+        resource_id = dataset['resources'][0]['id']
+
+        resource_views.create_default_views_job(dataset['id'], [resource_id])
+
+        assert _views(resource_id) == 1
+        assert not connect_to_redis().exists(
+            resource_views._dedupe_key(resource_id))
+
+    def test_views_are_created_now_if_the_job_cannot_be_queued(
+            self, monkeypatch):
+        def fail(*args, **kwargs):
+            raise RuntimeError('No queue')
+        monkeypatch.setattr(jobs, 'enqueue', fail)
+
+        dataset = helpers.call_action('package_create', name='views',
+                                      resources=[_resource()])
+
+        assert _views(dataset['resources'][0]['id']) == 1
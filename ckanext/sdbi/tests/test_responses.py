@@ -0,0 +1,63 @@
+"""Tests for responses.py and the return_mode of the dataset actions."""
+import pytest
+
+import ckan.logic as logic
+import ckan.tests.factories as factories
+import ckan.tests.helpers as helpers
+
+from ckanext.sdbi import responses
+
+
+@pytest.mark.parametrize('context, data_dict, expected', [
+    ({}, {}, 'show'),
+    ({}, {'return_mode': 'saved'}, 'saved'),
+    ({'return_mode': 'changed'}, {}, 'changed'),
+    ({'return_mode': 'changed'}, {'return_mode': 'id'}, 'id'),
+    ({'return_id_only': True}, {}, 'id'),
+])
+def test_get_return_mode(context, data_dict, expected):
+    assert responses.get_return_mode(context, data_dict) == expected
+    assert 'return_mode' not in data_dict
+
+
+def test_get_return_mode_rejects_unknown_modes():
+    with pytest.raises(logic.ValidationError):
+        responses.get_return_mode({}, {'return_mode': 'everything'})
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.usefixtures("clean_db", "with_plugins")
+class TestReturnMode(object):
+
+    def test_create_id(self):
+        result = helpers.call_action('package_create', name='return-id',
+                                     return_mode='id')
+
+        assert result == helpers.call_action('package_show',
+                                             id='return-id')['id']
+
+    def test_create_saved(self):
+        result = helpers.call_action(
+            'package_create', name='return-saved', notes='Notes',
+            resources=[{'url': 'http://example.org/a.csv'}],
+            return_mode='saved')
+
+        shown = helpers.call_action('package_show', id='return-saved')
+        assert result['id'] == shown['id']
+        assert result['notes'] == 'Notes'
+        assert result['metadata_modified'] == shown['metadata_modified']
+        assert [r['id'] for r in result['resources']] == \
+            [r['id'] for r in shown['resources']]
+
+    def test_update_changed(self):
+        dataset = factories.Dataset(notes='Old', title='Title')
+
+        result = helpers.call_action(
+            'package_update', id=dataset['id'], name=dataset['name'],
+            title='Title', notes='New', return_mode='changed')
+
+        assert result['id'] == dataset['id']
+        assert result['notes'] == 'New'
+        assert 'title' not in result
+        assert 'resources' not in result
+        assert result['metadata_modified'] != dataset['metadata_modified']
@@ -0,0 +1,142 @@
+"""Tests for targeting.py."""
+import pytest
+from werkzeug.datastructures import MultiDict
+
+from ckanext.sdbi import targeting
+
+
+def _page(path='/', facets=None, visitor='visitor', query_args=None):
+    calls = []
+
+    def lookup(page_path):
+        calls.append(page_path)
+        return facets or {}
+
+    page = targeting.page_context(path, query_args or MultiDict(), visitor,
+                                  lookup)
+    return page, calls
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('', []),
+    ('banjir', ['banjir']),
+    ('banjir, gempa-bumi', ['banjir', 'gempa-bumi']),
+    ('["banjir", "gempa-bumi"]', ['banjir', 'gempa-bumi']),
+    ('["banjir, longsor"]', ['banjir, longsor']),
+    ('[banjir', ['[banjir']),
+])
+def test_extra_values(value, expected):
+    assert targeting.extra_values(value) == expected
+
+
+def test_parse_rules_drops_unknown_and_empty_keys():
+    rules = targeting.parse_rules(
+        '{"url_prefix": ["/dataset"], "jenis": [], "color": "red",'
+        ' "sample": 0}')
+
+    assert rules == {'url_prefix': ['/dataset'], 'sample': 0}
+    assert targeting.parse_rules(None) == {}
+
+
+def test_parse_rules_needs_an_object():
+    with pytest.raises(ValueError):
+        targeting.parse_rules('["/dataset"]')
+
+
+def test_rules_from_form():
+    rules = targeting.rules_from_form({
+        'targeting_url_prefix': '/dataset, /organization/bnpb',
+        'targeting_jenis': 'banjir',
+        'targeting_url_regex': '^/dataset/banjir-',
+        'targeting_sample': '25',
+    })
+
+    assert rules == {'url_prefix': ['/dataset', '/organization/bnpb'],
+                     'jenis': ['banjir'],
+                     'url_regex': '^/dataset/banjir-',
+                     'sample': 25}
+    assert targeting.rules_from_form({'targeting_sample': '100'}) == {}
+
+
+@pytest.mark.parametrize('form', [
+    {'targeting_url_regex': '('},
+    {'targeting_sample': 'half'},
+    {'targeting_sample': '101'},
+])
+def test_rules_from_form_rejects_invalid_values(form):
+    with pytest.raises(ValueError):
+        targeting.rules_from_form(form)
+
+
+def test_dump_rules():
+    assert targeting.dump_rules({}) is None
+    assert targeting.parse_rules(
+        targeting.dump_rules({'fase': ['prabencana']})) == \
+        {'fase': ['prabencana']}
+
+
+def test_empty_rules_match_every_page():
+    page, calls = _page('/anything')
+
+    assert targeting.compile_rules({})(page)
+    assert calls == []
+
+
+def test_url_rules_do_not_look_up_facets():
+    matcher = targeting.compile_rules({'url_prefix': ['/dataset'],
+                                       'url_regex': 'banjir'})
+
+    page, calls = _page('/dataset/banjir-2020')
+    assert matcher(page)
+    assert not matcher(_page('/dataset/gempa')[0])
+    assert not matcher(_page('/organization/banjir')[0])
+    assert calls == []
+
+
+def test_facet_rules_look_up_facets_once():
+    matcher = targeting.compile_rules({'organization': ['bnpb'],
+                                       'jenis': ['banjir', 'longsor']})
+
+    page, calls = _page('/dataset/x', facets={'organization': ['bnpb'],
+                                              'jenis': ['banjir']})
+    assert matcher(page)
+    assert matcher(page)
+    assert calls == ['/dataset/x']
+
+    page, calls = _page('/dataset/x', facets={'organization': ['bnpb'],
+                                              'jenis': ['gempa-bumi']})
+    assert not matcher(page)
+
+
+def test_facets_from_the_query_string():
+    matcher = targeting.compile_rules({'fase': ['prabencana']})
+
+    page, calls = _page('/dataset/',
+                        query_args=MultiDict([('fase', 'prabencana')]))
+
+    assert matcher(page)
+
+
+def test_sample_is_stable_per_visitor():
+    matcher = targeting.compile_rules({'sample': 50}, 'form-1')
+    visitors = ['visitor-%d' % i for i in range(200)]
+
+    shown = [v for v in visitors if matcher(_page(visitor=v)[0])]
+
+    assert 0 < len(shown) < len(visitors)
+    assert shown == [v for v in visitors if matcher(_page(visitor=v)[0])]
+    assert not targeting.compile_rules({'sample': 0})(_page()[0])
+
+
+def test_get_matcher_caches_by_raw_rules():
+    raw = '{"url_prefix": ["/dataset"]}'
+    matcher = targeting.get_matcher('cached-form', raw)
+
+    assert targeting.get_matcher('cached-form', raw) is matcher
+    assert targeting.get_matcher('cached-form', '{}') is not matcher
+
+
+def test_get_matcher_with_invalid_rules_matches_nothing():
+    matcher = targeting.get_matcher('invalid-form', '{"url_regex": "("}')
+
+    assert not matcher(_page('/')[0])
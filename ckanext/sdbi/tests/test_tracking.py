@@ -0,0 +1,187 @@
+"""Tests for controllers/tracking.py."""
+import json
+
+import pytest
+
+import ckan.model as model
+import ckan.tests.factories as factories
+import ckan.tests.helpers as helpers
+from ckan.model.tracking import TrackingRaw
+
+from ckanext.sdbi import plugin
+from ckanext.sdbi.controllers import tracking
+
+BATCH_URL = '/sdbi/tracking/batch'
+
+
+def _post(app, payload):
+    data = payload if isinstance(payload, str) else json.dumps(payload)
+    return app.post(BATCH_URL, data=data, content_type='application/json')
+
+
+def _rows():
+    return sorted((row.url, row.tracking_type)
+                  for row in model.Session.query(TrackingRaw))
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.usefixtures("clean_db", "with_plugins")
+class TestTrackBatch(object):
+
+    def test_saves_every_event(self, app):
+        res = _post(app, [{'url': '/dataset/a', 'type': 'page'},
+                          {'url': '/dataset/a/resource/r', 'type': 'resource'},
+                          {'url': '/dataset/b'}])
+
+        assert res.status_code == 200
+        assert res.json == {'success': True, 'count': 3}
+        assert _rows() == [('/dataset/a', 'page'),
+                           ('/dataset/a/resource/r', 'resource'),
+                           ('/dataset/b', 'page')]
+
+    def test_events_object(self, app):
+        res = _post(app, {'events': [{'url': '/', 'type': 'exit'}]})
+
+        assert res.status_code == 200
+        assert _rows() == [('/', 'exit')]
+
+    def test_empty_batch(self, app):
+        res = _post(app, [])
+
+        assert res.status_code == 200
+        assert res.json['count'] == 0
+        assert _rows() == []
+
+    @pytest.mark.parametrize('payload, message', [
+        ('not json', 'Invalid JSON payload'),
+        ({'events': 'x'}, 'Events must be a list'),
+        ('"x"', 'Events must be a list'),
+        ([{'url': '/'}] * (tracking.BATCH_MAX_EVENTS + 1),
+         'At most %d events per batch' % tracking.BATCH_MAX_EVENTS),
+        (['/dataset/a'], 'Event 0 is not an object'),
+        ([{'url': '/'}, {'type': 'page'}], 'Event 1 has an invalid url'),
+        ([{'url': 42}], 'Event 0 has an invalid url'),
+        ([{'url': '/' * (tracking.BATCH_MAX_URL_LENGTH + 1)}],
+         'Event 0 has an invalid url'),
+        ([{'url': '/', 'type': 'click'}], 'Event 0 has an invalid type'),
+    ])
+    def test_invalid_batches_save_nothing(self, app, payload, message):
+        res = _post(app, payload)
+
+        assert res.status_code == 400
+        assert res.json == {'error': message}
+        assert _rows() == []
+
+    def test_max_events_is_accepted(self, app):
+        res = _post(app, [{'url': '/'}] * tracking.BATCH_MAX_EVENTS)
+
+        assert res.status_code == 200
+        assert len(_rows()) == tracking.BATCH_MAX_EVENTS
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.usefixtures("clean_db", "with_plugins")
+class TestTrack(object):
+
+    def test_saves_the_event(self, app):
+        res = app.post('/sdbi/tracking',
+                       data=json.dumps({'url': '/dataset/a', 'type': 'page'}),
+                       content_type='application/json')
+
+        assert res.status_code == 200
+        assert res.json['success'] is True
+        assert _rows() == [('/dataset/a', 'page')]
+        assert model.Session.query(TrackingRaw).one().user_key
+
+    def test_form_data(self, app):
+        res = app.post('/sdbi/tracking',
+                       data={'url': '/dataset/a/resource/r',
+                             'type': 'resource'})
+
+        assert res.status_code == 200
+        assert _rows() == [('/dataset/a/resource/r', 'resource')]
+
+    def test_url_is_required(self, app):
+        res = app.post('/sdbi/tracking', data={'type': 'page'})
+
+        assert res.status_code == 400
+        assert _rows() == []
+
+    def test_track_page(self, app):
+        res = app.get('/sdbi/tracking/page',
+                      query_string={'url': '/dataset/a'})
+
+        assert res.status_code == 200
+        assert _rows() == [('/dataset/a', 'page')]
+        assert model.Session.query(TrackingRaw).one().user_key
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.ckan_config("ckanext.sdbi.tracking.download_redirect", "true")
+@pytest.mark.usefixtures("clean_db", "with_plugins")
+class TestDownload(object):
+
+    def _download(self, app, resource_id, user=None):
+        extra_environ = {'REMOTE_USER': str(user['name'])} if user else {}
+        return app.get('/sdbi/download/%s' % resource_id,
+                       extra_environ=extra_environ, follow_redirects=False)
+
+    def test_redirects_to_the_resource(self, app):
+        resource = factories.Resource(url='http://example.com/data.csv')
+
+        res = self._download(app, resource['id'])
+
+        assert res.status_code == 302
+        assert res.headers['Location'] == 'http://example.com/data.csv'
+
+    def test_counts_the_download(self, app):
+        resource = factories.Resource(url='http://example.com/data.csv')
+        dataset = model.Package.get(resource['package_id'])
+
+        self._download(app, resource['id'])
+
+        assert _rows() == [(plugin.download_tracking_url(
+            dataset.id, resource['id']), 'resource')]
+        assert model.Session.query(TrackingRaw).one().user_key
+        assert plugin.get_dataset_downloads(
+            dataset.id)['total_downloads'] == 1
+        assert plugin.get_dataset_downloads_by_name(
+            dataset.name)['total_downloads'] == 1
+
+    def test_private_dataset(self, app):
+        org = factories.Organization()
+        dataset = factories.Dataset(owner_org=org['id'], private=True)
+        resource = factories.Resource(package_id=dataset['id'])
+
+        res = self._download(app, resource['id'], user=factories.User())
+
+        assert res.status_code == 403
+        assert _rows() == []
+
+    def test_private_dataset_for_a_member(self, app):
+        user = factories.User()
+        org = factories.Organization(
+            users=[{'name': user['name'], 'capacity': 'member'}])
+        dataset = factories.Dataset(owner_org=org['id'], private=True)
+        resource = factories.Resource(package_id=dataset['id'],
+                                      url='http://example.com/data.csv')
+
+        res = self._download(app, resource['id'], user=user)
+
+        assert res.status_code == 302
+        assert len(_rows()) == 1
+
+    def test_missing_resource(self, app):
+        res = self._download(app, 'missing')
+
+        assert res.status_code == 404
+        assert _rows() == []
+
+    def test_deleted_resource(self, app):
+        resource = factories.Resource()
+        helpers.call_action('resource_delete', id=resource['id'])
+
+        res = self._download(app, resource['id'])
+
+        assert res.status_code == 404
+        assert _rows() == []
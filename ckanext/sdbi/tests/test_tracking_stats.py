@@ -0,0 +1,100 @@
+"""Tests for tracking_stats.py."""
+import logging
+
+import pytest
+
+from ckanext.sdbi import tracking_stats
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(tracking_stats.time, 'time', lambda: now[0])
+    return now
+
+
+def _stats(sample_rate=0.0, summary_interval=60.0):
+    stats = tracking_stats.TrackingStats()
+    stats.sample_rate = sample_rate
+    stats.summary_interval = summary_interval
+    stats._configured = True
+    return stats
+
+
+def _messages(logs, prefix):
+    return [record.getMessage() for record in logs.records
+            if record.getMessage().startswith(prefix)]
+
+
+@pytest.fixture
+def logs(caplog):
+    caplog.set_level(logging.INFO, logger=tracking_stats.log.name)
+    return caplog
+
+
+def test_no_hits_logged_at_sample_rate_0(clock, logs):
+    stats = _stats(sample_rate=0.0)
+
+    for _ in range(100):
+        stats.hit('track', '/dataset/a', 'page')
+
+    assert _messages(logs, 'tracking_hit') == []
+    assert stats.snapshot()['hits'] == 100
+
+
+def test_every_hit_logged_at_sample_rate_1(clock, logs):
+    stats = _stats(sample_rate=1.0)
+
+    stats.hit('track', '/dataset/a', 'page')
+    stats.hit('track_batch', '/dataset/b', 'resource', rows=3)
+
+    assert _messages(logs, 'tracking_hit') == [
+        'tracking_hit endpoint=track type=page rows=1 url=/dataset/a',
+        'tracking_hit endpoint=track_batch type=resource rows=3 '
+        'url=/dataset/b']
+
+
+def test_errors_are_counted_and_always_logged(clock, logs):
+    stats = _stats(sample_rate=0.0)
+
+    stats.error('track', ValueError('broken'))
+    stats.error('track_batch', ValueError('again'))
+
+    assert stats.snapshot()['errors'] == 2
+    assert stats.snapshot()['hits'] == 0
+    assert _messages(logs, 'tracking_error') == [
+        'tracking_error endpoint=track error=broken',
+        'tracking_error endpoint=track_batch error=again']
+
+
+def test_summary_once_the_interval_passed(clock, logs):
+    stats = _stats(summary_interval=60.0)
+
+    stats.hit('track', '/dataset/a', 'page', flush_seconds=0.002)
+    stats.error('track', ValueError('broken'))
+    clock[0] += 59
+    stats.hit('track', '/dataset/a', 'page')
+    assert _messages(logs, 'tracking_summary') == []
+
+    clock[0] += 1
+    stats.hit('track_batch', '/dataset/b', 'page', rows=3,
+              flush_seconds=0.004)
+
+    assert _messages(logs, 'tracking_summary') == [
+        'tracking_summary interval=60.0s hits=3 hits_per_sec=0.05 rows=5 '
+        'errors=1 flush_avg_ms=3.00 flush_max_ms=4.00']
+    snapshot = stats.snapshot()
+    assert (snapshot['hits'], snapshot['rows'], snapshot['errors']) == \
+        (0, 0, 0)
+    assert snapshot['started'] == clock[0]
+
+
+def test_summary_disabled_with_interval_0(clock, logs):
+    stats = _stats(summary_interval=0)
+
+    stats.hit('track', '/dataset/a', 'page')
+    clock[0] += 3600
+    stats.hit('track', '/dataset/a', 'page')
+
+    assert _messages(logs, 'tracking_summary') == []
+    assert stats.snapshot()['hits'] == 2
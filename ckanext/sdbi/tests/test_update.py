@@ -0,0 +1,593 @@
+"""Tests for update.py."""
+import pytest
+from sqlalchemy import event
+
+import ckan.lib.navl.dictization_functions as dfunc
+import ckan.logic as logic
+import ckan.model as model
+import ckan.tests.factories as factories
+import ckan.tests.helpers as helpers
+
+from ckanext.sdbi import update
+
+
+def _task_status(**kwargs):
+    task_status = {'entity_id': 'entity-1', 'entity_type': 'package',
+                   'task_type': 'harvest', 'key': 'status', 'value': 'new'}
+    task_status.update(kwargs)
+    return task_status
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.usefixtures("clean_db", "with_plugins")
+class TestTaskStatusUpdateMany(object):
+
+    def _call(self, data, **kwargs):
+        sysadmin = factories.Sysadmin()
+        context = {'user': sysadmin['name'], 'ignore_auth': False}
+        return helpers.call_action('task_status_update_many',
+                                   context=context, data=data, **kwargs)
+
+    def test_last_row_wins(self):
+        result = self._call([_task_status(value='first'),
+                             _task_status(value='second'),
+                             _task_status(key='other', value='third')])
+
+        values = dict((row['key'], row['value']) for row in result['results'])
+        assert values == {'status': 'second', 'other': 'third'}
+
+    def test_updates_existing_row_whatever_its_id(self):
+        existing = helpers.call_action('task_status_update',
+                                       **_task_status(value='old'))
+
+        result = self._call([_task_status(value='new')])
+
+        assert [row['id'] for row in result['results']] == [existing['id']]
+        shown = helpers.call_action('task_status_show', id=existing['id'])
+        assert shown['value'] == 'new'
+
+    def test_only_given_columns_are_set(self):
+        first = helpers.call_action(
+            'task_status_update', **_task_status(error='kept'))
+        second = helpers.call_action(
+            'task_status_update', **_task_status(key='other', error='old'))
+
+        # Rows with and without "error" are written by separate statements
+        self._call([_task_status(value='v1'),
+                    _task_status(key='other', value='v2', error='replaced')],
+                   chunk_size=10)
+
+        first = helpers.call_action('task_status_show', id=first['id'])
+        second = helpers.call_action('task_status_show', id=second['id'])
+        assert (first['value'], first['error']) == ('v1', 'kept')
+        assert (second['value'], second['error']) == ('v2', 'replaced')
+
+    def test_invalid_row_writes_nothing(self):
+        with pytest.raises(logic.ValidationError):
+            self._call([_task_status(value='ok'),
+                        _task_status(entity_id='')])
+
+        with pytest.raises(logic.NotFound):
+            helpers.call_action('task_status_show', entity_id='entity-1',
+                                task_type='harvest', key='status')
+
+
+def _org_memberships(package_id):
+    return dict((member.group_id, (member.id, member.state))
+                for member in model.Session.query(model.Member)
+                .filter(model.Member.table_id == package_id)
+                .filter(model.Member.capacity == 'organization'))
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.usefixtures("clean_db", "with_plugins")
+class TestReconcileOwnerOrgMembers(object):
+
+    def test_keeps_the_current_membership(self):
+        org = factories.Organization()
+        other = factories.Organization()
+        dataset = factories.Dataset(owner_org=org['id'])
+        kept_id = _org_memberships(dataset['id'])[org['id']][0]
+        model.Session.add(model.Member(
+            table_id=dataset['id'], table_name='package',
+            capacity='organization', group_id=other['id'], state='active'))
+        model.Session.commit()
+
+        update._reconcile_owner_org_members(
+            {'model': model}, [dataset['id']], org['id'])
+        model.Session.commit()
+
+        memberships = _org_memberships(dataset['id'])
+        assert memberships[org['id']] == (kept_id, 'active')
+        assert memberships[other['id']][1] == 'deleted'
+        assert len(memberships) == 2
+
+    def test_adds_missing_memberships(self):
+        org = factories.Organization()
+        dataset = factories.Dataset()
+
+        update._reconcile_owner_org_members(
+            {'model': model}, [dataset['id']], org['id'])
+        model.Session.commit()
+
+        assert [state for _id, state in
+                _org_memberships(dataset['id']).values()] == ['active']
+
+    def test_no_organization_deletes_every_membership(self):
+        org = factories.Organization()
+        dataset = factories.Dataset(owner_org=org['id'])
+
+        update._reconcile_owner_org_members(
+            {'model': model}, [dataset['id']], None)
+        model.Session.commit()
+
+        assert _org_memberships(dataset['id'])[org['id']][1] == 'deleted'
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.usefixtures("clean_db", "clean_index", "with_plugins")
+class TestBulkUpdateOwnerOrg(object):
+
+    def test_moves_only_the_datasets_of_the_organization(self):
+        org = factories.Organization()
+        new_org = factories.Organization()
+        other_org = factories.Organization()
+        moved = [factories.Dataset(owner_org=org['id']) for _ in range(3)]
+        other = factories.Dataset(owner_org=other_org['id'])
+
+        result = helpers.call_action(
+            'bulk_update_owner_org',
+            datasets=[dataset['id'] for dataset in moved] + [other['id']],
+            org_id=org['id'], new_org_id=new_org['name'])
+
+        moved_ids = sorted(dataset['id'] for dataset in moved)
+        assert sorted(result['datasets']) == moved_ids
+        assert result['index_errors'] == []
+        for dataset in moved:
+            assert model.Package.get(dataset['id']).owner_org == \
+                new_org['id']
+            memberships = _org_memberships(dataset['id'])
+            assert memberships[new_org['id']][1] == 'active'
+            assert memberships[org['id']][1] == 'deleted'
+        assert model.Package.get(other['id']).owner_org == other_org['id']
+
+        found = helpers.call_action('package_search',
+                                    fq='owner_org:%s' % new_org['id'])
+        assert sorted(r['id'] for r in found['results']) == moved_ids
+
+    def test_records_a_changed_activity(self):
+        org = factories.Organization()
+        new_org = factories.Organization()
+        dataset = factories.Dataset(owner_org=org['id'])
+
+        helpers.call_action('bulk_update_owner_org', datasets=[dataset['id']],
+                            org_id=org['id'], new_org_id=new_org['id'])
+
+        activities = helpers.call_action('package_activity_list',
+                                         id=dataset['id'])
+        assert activities[0]['activity_type'] == 'changed package'
+
+    def test_unknown_organization(self):
+        org = factories.Organization()
+        dataset = factories.Dataset(owner_org=org['id'])
+
+        with pytest.raises(logic.NotFound):
+            helpers.call_action('bulk_update_owner_org',
+                                datasets=[dataset['id']], org_id=org['id'],
+                                new_org_id='missing')
+
+    def test_needs_rights_on_both_organizations(self):
+        user = factories.User()
+        org = factories.Organization(
+            users=[{'name': user['name'], 'capacity': 'admin'}])
+        new_org = factories.Organization()
+        dataset = factories.Dataset(owner_org=org['id'])
+
+        with pytest.raises(logic.NotAuthorized):
+            helpers.call_action(
+                'bulk_update_owner_org',
+                context={'user': user['name'], 'ignore_auth': False},
+                datasets=[dataset['id']], org_id=org['id'],
+                new_org_id=new_org['id'])
+
+        assert model.Package.get(dataset['id']).owner_org == org['id']
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.ckan_config("ckanext.sdbi.bulk.index_batch_size", "2")
+@pytest.mark.usefixtures("clean_db", "clean_index", "with_plugins")
+class TestBulkUpdateDataset(object):
+
+    def _private_ids(self, org_id):
+        found = helpers.call_action(
+            'package_search', include_private=True, rows=100,
+            fq='owner_org:%s AND capacity:private' % org_id)
+        return sorted(result['id'] for result in found['results'])
+
+    def test_reindexes_every_batch(self):
+        org = factories.Organization()
+        datasets = [factories.Dataset(owner_org=org['id']) for _ in range(5)]
+        ids = [dataset['id'] for dataset in datasets]
+
+        # Five datasets in batches of two: the last batch is fetched
+        # while the previous ones are indexed
+        helpers.call_action('bulk_update_private', datasets=ids,
+                            org_id=org['id'], background=False)
+
+        assert all(model.Package.get(package_id).private
+                   for package_id in ids)
+        assert self._private_ids(org['id']) == sorted(ids)
+
+        helpers.call_action('bulk_update_public', datasets=ids[:3],
+                            org_id=org['id'], background=False)
+
+        assert self._private_ids(org['id']) == sorted(ids[3:])
+
+    def test_skips_datasets_of_other_organizations(self):
+        org = factories.Organization()
+        other_org = factories.Organization()
+        dataset = factories.Dataset(owner_org=org['id'])
+        other = factories.Dataset(owner_org=other_org['id'])
+
+        helpers.call_action('bulk_update_private',
+                            datasets=[dataset['id'], other['id']],
+                            org_id=org['id'], background=False)
+
+        assert model.Package.get(dataset['id']).private
+        assert not model.Package.get(other['id']).private
+        assert self._private_ids(other_org['id']) == []
+
+    def test_bulk_update_delete(self):
+        org = factories.Organization()
+        datasets = [factories.Dataset(owner_org=org['id']) for _ in range(3)]
+
+        helpers.call_action('bulk_update_delete',
+                            datasets=[dataset['id'] for dataset in datasets],
+                            org_id=org['id'], background=False)
+
+        assert [model.Package.get(dataset['id']).state
+                for dataset in datasets] == ['deleted'] * 3
+        found = helpers.call_action('package_search',
+                                    fq='owner_org:%s' % org['id'])
+        assert found['count'] == 0
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.usefixtures("clean_db", "clean_index", "with_plugins")
+class TestPackageReviseMany(object):
+
+    def test_statuses_in_the_given_order(self):
+        changed = factories.Dataset(notes='Old')
+        same = factories.Dataset(notes='Same')
+
+        result = helpers.call_action('package_revise_many', chunk_size=2,
+                                     revisions=[
+            {'match': {'id': changed['id']}, 'update': {'notes': 'New'}},
+            {'match': {'name': same['name']}, 'update': {'notes': 'Same'}},
+            {'match__id': 'missing', 'update__notes': 'New'},
+        ])
+
+        assert [(r['id'], r['status']) for r in result['results']] == [
+            (changed['id'], 'updated'), (same['id'], 'no change'),
+            (None, 'error')]
+        assert model.Package.get(changed['id']).notes == 'New'
+        found = helpers.call_action('package_search',
+                                    fq='id:%s' % changed['id'])
+        assert found['results'][0]['notes'] == 'New'
+
+    def test_invalid_revision_does_not_stop_the_others(self):
+        invalid = factories.Dataset()
+        valid = factories.Dataset(notes='Old')
+
+        result = helpers.call_action('package_revise_many', revisions=[
+            {'match': {'id': invalid['id']}, 'update': {'name': 'Not Valid!'}},
+            {'match': {'id': valid['id']}, 'update': {'notes': 'New'}},
+        ])
+
+        first, second = result['results']
+        assert first['status'] == 'error'
+        assert 'name' in first['errors']
+        assert second['status'] == 'updated'
+        assert model.Package.get(invalid['id']).name == invalid['name']
+        assert model.Package.get(valid['id']).notes == 'New'
+
+    def test_revisions_must_be_a_list(self):
+        with pytest.raises(logic.ValidationError):
+            helpers.call_action('package_revise_many', revisions={})
+
+
+class _RecordingResourceController(object):
+    '''Stands in for an IResourceController plugin'''
+
+    def __init__(self):
+        self.calls = []
+
+    def before_update(self, context, current, resource):
+        self.calls.append(('before_update', current['id'], resource['id']))
+
+    def after_update(self, context, resource):
+        self.calls.append(('after_update', resource['id']))
+
+    def before_show(self, resource):
+        return resource
+
+
+class _ValidatingDatasetForm(object):
+    '''A dataset type plugin that validates the whole dataset itself'''
+
+    def __init__(self, plugin):
+        self._plugin = plugin
+        self.actions = []
+
+    def __getattr__(self, name):
+        return getattr(self._plugin, name)
+
+    def validate(self, context, data_dict, schema, action):
+        self.actions.append(action)
+        return dfunc.validate(data_dict, schema, context)
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.usefixtures("clean_db", "clean_index", "with_plugins")
+class TestResourceUpdateInPlace(object):
+
+    def _dataset(self, **resource):
+        resource.setdefault('url', 'http://example.com/target.csv')
+        return factories.Dataset(resources=[
+            {'url': 'http://example.com/before.csv', 'name': 'before'},
+            dict(resource, name='target'),
+            {'url': 'http://example.com/after.csv', 'name': 'after'},
+        ])
+
+    def _update(self, **data):
+        return helpers.call_action('resource_update',
+                                   context={'in_place': True}, **data)
+
+    def test_writes_only_the_target_resource(self):
+        dataset = self._dataset()
+        target = dataset['resources'][1]
+        ids = []
+
+        def record(mapper, connection, resource):
+            ids.append(resource.id)
+        event.listen(model.Resource, 'before_update', record)
+        try:
+            resource = self._update(id=target['id'], url=target['url'],
+                                    name='renamed')
+        finally:
+            event.remove(model.Resource, 'before_update', record)
+
+        assert set(ids) == {target['id']}
+        assert resource['name'] == 'renamed'
+        shown = helpers.call_action('package_show', id=dataset['id'])
+        assert [(res['id'], res['name'], res['position'])
+                for res in shown['resources']] == [
+            (dataset['resources'][0]['id'], 'before', 0),
+            (target['id'], 'renamed', 1),
+            (dataset['resources'][2]['id'], 'after', 2)]
+        for old, new in zip(dataset['resources'][::2], shown['resources'][::2]):
+            assert old == new
+
+    def test_extras_not_given_are_removed(self):
+        dataset = self._dataset(custom='value', other='value')
+        target = dataset['resources'][1]
+
+        resource = self._update(id=target['id'], url=target['url'],
+                                other='changed')
+
+        assert 'custom' not in resource
+        assert resource['other'] == 'changed'
+        shown = helpers.call_action('resource_show', id=target['id'])
+        assert 'custom' not in shown
+        assert shown['other'] == 'changed'
+
+    def test_keeps_datastore_active(self):
+        dataset = self._dataset(datastore_active=True)
+        target = dataset['resources'][1]
+
+        resource = self._update(id=target['id'], url=target['url'],
+                                description='New')
+
+        assert resource['datastore_active'] is True
+        shown = helpers.call_action('resource_show', id=target['id'])
+        assert shown['datastore_active'] is True
+
+    def test_runs_the_resource_controller_hooks(self, monkeypatch):
+        dataset = self._dataset()
+        target = dataset['resources'][1]
+        recorder = _RecordingResourceController()
+        implementations = update.plugins.PluginImplementations
+
+        def plugin_implementations(interface):
+            if interface is update.plugins.IResourceController:
+                return [recorder]
+            return implementations(interface)
+        monkeypatch.setattr(update.plugins, 'PluginImplementations',
+                            plugin_implementations)
+
+        self._update(id=target['id'], url=target['url'], name='renamed')
+
+        assert recorder.calls == [
+            ('before_update', target['id'], target['id']),
+            ('after_update', target['id'])]
+
+    def test_validating_dataset_types_take_the_full_path(self, monkeypatch):
+        dataset = self._dataset()
+        target = dataset['resources'][1]
+        form = _ValidatingDatasetForm(
+            update.lib_plugins.lookup_package_plugin(dataset['type']))
+        monkeypatch.setattr(update.lib_plugins, 'lookup_package_plugin',
+                            lambda package_type=None: form)
+
+        resource = self._update(id=target['id'], url=target['url'],
+                                name='renamed')
+
+        assert 'package_update' in form.actions
+        assert resource['name'] == 'renamed'
+
+
+def _activity_count(package_id):
+    return model.Session.query(model.Activity) \
+        .filter(model.Activity.object_id == package_id).count()
+
+
+def _comparable_package(pkg_dict):
+    pkg_dict = dict((key, value) for key, value in pkg_dict.items()
+                    if key not in ('id', 'name', 'metadata_created',
+                                   'metadata_modified'))
+    pkg_dict['resources'] = [
+        dict((key, value) for key, value in resource.items()
+             if key not in ('id', 'package_id', 'created',
+                            'metadata_modified'))
+        for resource in pkg_dict['resources']]
+    return pkg_dict
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.usefixtures("clean_db", "clean_index", "with_plugins")
+class TestPackageRevise(object):
+
+    def _dataset(self):
+        return factories.Dataset(title='Revised', notes='Notes', resources=[
+            {'url': 'http://example.com/1.csv', 'name': 'first'},
+            {'url': 'http://example.com/2.csv', 'name': 'second'}])
+
+    def test_unchanged_dataset_is_not_written(self):
+        dataset = self._dataset()
+        activities = _activity_count(dataset['id'])
+        modified = model.Package.get(dataset['id']).metadata_modified
+
+        result = helpers.call_action(
+            'package_revise', match={'id': dataset['id']},
+            update={'notes': 'Notes'})
+
+        assert result['status'] == 'no change'
+        assert result['package']['notes'] == 'Notes'
+        assert _activity_count(dataset['id']) == activities
+        model.Session.expire_all()
+        assert model.Package.get(dataset['id']).metadata_modified == modified
+
+    def test_repeated_revision_is_no_change(self):
+        dataset = self._dataset()
+        revision = {'match': {'id': dataset['id']},
+                    'update': {'notes': 'New notes'}}
+
+        first = helpers.call_action('package_revise', **revision)
+        activities = _activity_count(dataset['id'])
+        modified = model.Package.get(dataset['id']).metadata_modified
+        second = helpers.call_action('package_revise', **revision)
+
+        assert first['status'] == 'updated'
+        assert second['status'] == 'no change'
+        assert _activity_count(dataset['id']) == activities
+        model.Session.expire_all()
+        assert model.Package.get(dataset['id']).metadata_modified == modified
+
+    def test_single_resource_edit_is_saved_in_place(self, monkeypatch):
+        in_place, full = self._dataset(), self._dataset()
+        calls = []
+        resource_update = update.resource_update
+
+        def recording_resource_update(context, data_dict):
+            calls.append((data_dict['id'], context.get('in_place')))
+            return resource_update(context, data_dict)
+        monkeypatch.setattr(update, 'resource_update',
+                            recording_resource_update)
+
+        revised = helpers.call_action(
+            'package_revise', match={'id': in_place['id']},
+            update__resources__1={'description': 'Changed'})
+
+        assert revised['status'] == 'updated'
+        assert calls == [(in_place['resources'][1]['id'], True)]
+
+        # The same edit through package_update
+        monkeypatch.setattr(update, '_single_changed_resource',
+                            lambda before, after: None)
+        expected = helpers.call_action(
+            'package_revise', match={'id': full['id']},
+            update__resources__1={'description': 'Changed'})
+
+        assert len(calls) == 1
+        assert revised['package']['resources'][1]['description'] == 'Changed'
+        assert _comparable_package(revised['package']) == \
+            _comparable_package(expected['package'])
+        assert _activity_count(in_place['id']) == \
+            _activity_count(full['id'])
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi")
+@pytest.mark.usefixtures("clean_db", "clean_index", "with_plugins")
+class TestPackageResourceReorder(object):
+
+    def _dataset(self):
+        dataset = factories.Dataset(resources=[
+            {'url': 'http://example.com/%s.csv' % name, 'name': name}
+            for name in ('a', 'b', 'c', 'd')])
+        return dataset, [resource['id'] for resource in dataset['resources']]
+
+    def _names(self, pkg_dict):
+        return [resource['name'] for resource in pkg_dict['resources']]
+
+    def test_partial_order_comes_first(self):
+        dataset, (a, b, c, d) = self._dataset()
+
+        result = helpers.call_action('package_resource_reorder',
+                                     id=dataset['name'], order=[d, b])
+
+        assert result['order'] == [d, b, a, c]
+        shown = helpers.call_action('package_show', id=dataset['id'])
+        assert self._names(shown) == ['d', 'b', 'a', 'c']
+        assert [resource['position'] for resource in shown['resources']] == \
+            [0, 1, 2, 3]
+        found = helpers.call_action('package_search',
+                                    fq='id:%s' % dataset['id'])
+        assert self._names(found['results'][0]) == ['d', 'b', 'a', 'c']
+
+    def test_records_a_changed_activity(self):
+        dataset, (a, b, c, d) = self._dataset()
+        activities = _activity_count(dataset['id'])
+
+        helpers.call_action('package_resource_reorder', id=dataset['id'],
+                            order=[b])
+
+        assert _activity_count(dataset['id']) == activities + 1
+
+    def test_already_sorted_order_writes_nothing(self):
+        dataset, ids = self._dataset()
+        activities = _activity_count(dataset['id'])
+        modified = model.Package.get(dataset['id']).metadata_modified
+
+        result = helpers.call_action('package_resource_reorder',
+                                     id=dataset['id'], order=ids[:2])
+
+        assert result['order'] == ids
+        assert _activity_count(dataset['id']) == activities
+        model.Session.expire_all()
+        assert model.Package.get(dataset['id']).metadata_modified == modified
+
+    def test_unknown_resource(self):
+        dataset, (a, b, c, d) = self._dataset()
+
+        with pytest.raises(logic.ValidationError) as e:
+            helpers.call_action('package_resource_reorder', id=dataset['id'],
+                                order=[b, 'missing'])
+
+        assert 'missing' in e.value.error_dict['order']
+        shown = helpers.call_action('package_show', id=dataset['id'])
+        assert self._names(shown) == ['a', 'b', 'c', 'd']
+
+    def test_duplicate_resource(self):
+        dataset, (a, b, c, d) = self._dataset()
+
+        with pytest.raises(logic.ValidationError):
+            helpers.call_action('package_resource_reorder', id=dataset['id'],
+                                order=[b, a, b])
+
+        shown = helpers.call_action('package_show', id=dataset['id'])
+        assert self._names(shown) == ['a', 'b', 'c', 'd']
+
+    def test_unknown_dataset(self):
+        with pytest.raises(logic.NotFound):
+            helpers.call_action('package_resource_reorder', id='missing',
+                                order=[])
@@ -0,0 +1,74 @@
+"""Tests for view_order.py and the resource view actions using it."""
+import pytest
+
+import ckan.logic as logic
+import ckan.model as model
+import ckan.tests.factories as factories
+import ckan.tests.helpers as helpers
+
+
+def _create_view(resource_id, title):
+    return helpers.call_action('resource_view_create',
+                               resource_id=resource_id, title=title,
+                               view_type='image_view',
+                               image_url='http://example.org/a.png')
+
+
+def _orders(resource_id):
+    return [(view.title, view.order) for view in
+            model.Session.query(model.ResourceView)
+            .filter_by(resource_id=resource_id)
+            .order_by(model.ResourceView.order)]
+
+
+@pytest.mark.ckan_config("ckan.plugins", "sdbi image_view")
+@pytest.mark.ckan_config("ckan.views.default_views", "")
+@pytest.mark.usefixtures("clean_db", "with_plugins")
+class TestViewOrder(object):
+
+    def test_create_appends_views(self):
+        resource = factories.Resource()
+        for title in ('a', 'b', 'c'):
+            _create_view(resource['id'], title)
+
+        assert _orders(resource['id']) == [('a', 0), ('b', 1), ('c', 2)]
+
+    def test_reorder_puts_the_given_views_first(self):
+        resource = factories.Resource()
+        a, b, c = [_create_view(resource['id'], title)
+                   for title in ('a', 'b', 'c')]
+
+        result = helpers.call_action('resource_view_reorder',
+                                     id=resource['id'], order=[c['id']])
+
+        assert result == {'id': resource['id'],
+                          'order': [c['id'], a['id'], b['id']]}
+        assert _orders(resource['id']) == [('c', 1), ('a', 2), ('b', 3)]
+
+    def test_create_after_reorder(self):
+        resource = factories.Resource()
+        a = _create_view(resource['id'], 'a')
+        helpers.call_action('resource_view_reorder', id=resource['id'],
+                            order=[a['id']])
+
+        _create_view(resource['id'], 'b')
+
+        assert _orders(resource['id']) == [('a', 1), ('b', 2)]
+
+    def test_reorder_unknown_view(self):
+        resource = factories.Resource()
+        _create_view(resource['id'], 'a')
+
+        with pytest.raises(logic.ValidationError):
+            helpers.call_action('resource_view_reorder', id=resource['id'],
+                                order=['not-a-view'])
+
+        assert _orders(resource['id']) == [('a', 0)]
+
+    def test_reorder_duplicates(self):
+        resource = factories.Resource()
+        a = _create_view(resource['id'], 'a')
+
+        with pytest.raises(logic.ValidationError):
+            helpers.call_action('resource_view_reorder', id=resource['id'],
+                                order=[a['id'], a['id']])
@@ -0,0 +1,121 @@
+'''Sampled logging and in-memory counters for the tracking endpoints.
+
+Per-hit log lines are only written for a configurable sample of hits
+(``ckanext.sdbi.tracking.log_sample_rate``, default ``0``: none), while every
+hit updates counters that are written as one summary line every
+``ckanext.sdbi.tracking.log_summary_interval`` seconds (default ``60``, ``0``
+disables the summary)::
+
+    tracking_summary interval=60.0s hits=5230 hits_per_sec=87.17 rows=5391
+    errors=0 flush_avg_ms=1.84 flush_max_ms=23.10
+
+The summary is written by the first hit after the interval has passed, so no
+background thread is needed.
+'''
+
+import logging
+import random
+import threading
+import time
+
+from ckanext.sdbi import metrics
+
+log = logging.getLogger(__name__)
+
+
+class TrackingStats(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configured = False
+        self.sample_rate = 0.0
+        self.summary_interval = 60.0
+        self._reset(time.time())
+
+    def _configure(self):
+        from ckan.common import config
+        try:
+            self.sample_rate = float(
+                config.get('ckanext.sdbi.tracking.log_sample_rate', 0))
+        except ValueError:
+            self.sample_rate = 0.0
+        try:
+            self.summary_interval = float(
+                config.get('ckanext.sdbi.tracking.log_summary_interval', 60))
+        except ValueError:
+            self.summary_interval = 60.0
+        self._configured = True
+
+    def _reset(self, now):
+        self.started = now
+        self.hits = 0
+        self.rows = 0
+        self.errors = 0
+        self.flush_total = 0.0
+        self.flush_max = 0.0
+        self.flushes = 0
+
+    def hit(self, endpoint, url, tracking_type, rows=1, flush_seconds=None):
+        """Count a saved tracking request and maybe log it"""
+        if not self._configured:
+            self._configure()
+        with self._lock:
+            self.hits += 1
+            self.rows += rows
+            if flush_seconds is not None:
+                self.flushes += 1
+                self.flush_total += flush_seconds
+                if flush_seconds > self.flush_max:
+                    self.flush_max = flush_seconds
+        metrics.inc('sdbi_tracking_rows_total', (('endpoint', endpoint),),
+                    rows)
+        if self.sample_rate and random.random() < self.sample_rate:
+            log.info('tracking_hit endpoint=%s type=%s rows=%d url=%s',
+                     endpoint, tracking_type, rows, url)
+        self._maybe_summarize()
+
+    def error(self, endpoint, exc):
+        """Count a failed tracking request; errors are always logged"""
+        if not self._configured:
+            self._configure()
+        with self._lock:
+            self.errors += 1
+        metrics.inc('sdbi_tracking_errors_total', (('endpoint', endpoint),))
+        log.error('tracking_error endpoint=%s error=%s', endpoint, exc)
+        self._maybe_summarize()
+
+    def snapshot(self):
+        """Current counters since the last summary"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'rows': self.rows,
+                'errors': self.errors,
+                'flushes': self.flushes,
+                'flush_total': self.flush_total,
+                'flush_max': self.flush_max,
+                'started': self.started,
+            }
+
+    def _maybe_summarize(self):
+        if not self.summary_interval:
+            return
+        now = time.time()
+        if now - self.started < self.summary_interval:
+            return
+        with self._lock:
+            elapsed = now - self.started
+            if elapsed < self.summary_interval:
+                return
+            hits, rows, errors = self.hits, self.rows, self.errors
+            flushes, flush_total = self.flushes, self.flush_total
+            flush_max = self.flush_max
+            self._reset(now)
+        log.info('tracking_summary interval=%.1fs hits=%d hits_per_sec=%.2f '
+                 'rows=%d errors=%d flush_avg_ms=%.2f flush_max_ms=%.2f',
+                 elapsed, hits, hits / elapsed, rows, errors,
+                 flush_total / flushes * 1000 if flushes else 0.0,
+                 flush_max * 1000)
+
+
+stats = TrackingStats()
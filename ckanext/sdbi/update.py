@@ -2,10 +2,14 @@
 
 '''API functions for updating existing data in CKAN.'''
 
+import copy
 import logging
 import datetime
 import time
-import json
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import case, or_
+from sqlalchemy.dialects import postgresql
 
 from ckan.common import config
 import ckan.common as converters
@@ -27,10 +31,17 @@ import ckan.lib.search as search
 import ckan.lib.uploader as uploader
 import ckan.lib.datapreview
 import ckan.lib.app_globals as app_globals
+from ckan.model.types import make_uuid
 
 
 from ckan.common import _, request
 
+from ckanext.sdbi import activity
+from ckanext.sdbi import bulk
+from ckanext.sdbi import bulk_jobs
+from ckanext.sdbi import responses
+from ckanext.sdbi import view_order
+
 log = logging.getLogger(__name__)
 
 # Define some shortcuts
@@ -40,9 +51,12 @@ _validate = dfunc.validate
 _get_action = logic.get_action
 _check_access = logic.check_access
 NotFound = logic.NotFound
+NotAuthorized = logic.NotAuthorized
 ValidationError = logic.ValidationError
 _get_or_bust = logic.get_or_bust
 
+_missing = object()
+
 
 def resource_update(context, data_dict):
     '''Update a resource.
@@ -81,6 +95,9 @@ def resource_update(context, data_dict):
     _check_access('resource_update', context, data_dict)
     del context["resource"]
 
+    if _use_in_place_update(context, resource.package):
+        return _resource_update_in_place(context, data_dict, resource)
+
     package_id = resource.package.id
     pkg_dict = _get_action('package_show')(dict(context, return_type='dict'),
         {'id': package_id})
@@ -126,6 +143,110 @@ def resource_update(context, data_dict):
     return resource
 
 
+def _use_in_place_update(context, pkg):
+    '''Whether :py:func:`resource_update` can save just the one resource
+
+    Enabled with ``ckanext.sdbi.resource_update.in_place`` or ``in_place``
+    in the context. Dataset types whose plugin validates the whole dataset
+    itself (e.g. ckanext-scheming) always take the full path.
+    '''
+    enabled = context.get('in_place')
+    if enabled is None:
+        enabled = converters.asbool(
+            config.get('ckanext.sdbi.resource_update.in_place', False))
+    if not enabled:
+        return False
+    package_plugin = lib_plugins.lookup_package_plugin(pkg.type)
+    return not hasattr(package_plugin, 'validate')
+
+
+def _resource_update_in_place(context, data_dict, resource):
+    '''Validate and save only the given resource and its extras
+
+    The other resources of the dataset are neither revalidated nor
+    rewritten, and the response is built by dictizing just this resource.
+    The dataset is only read in full when IPackageController plugins are
+    loaded (they get the dataset dict in ``after_update``) or when the
+    format changed and default views may have to be created.
+    '''
+    model = context['model']
+    session = context['session']
+    pkg = resource.package
+    old_resource_format = resource.format
+
+    # Persist the datastore_active extra if already present and not provided
+    if ('datastore_active' in resource.extras and
+            'datastore_active' not in data_dict):
+        data_dict['datastore_active'] = resource.extras['datastore_active']
+
+    old_resource_dict = model_dictize.resource_dictize(resource, context)
+    for plugin in plugins.PluginImplementations(plugins.IResourceController):
+        plugin.before_update(context, old_resource_dict, data_dict)
+
+    upload = uploader.get_resource_uploader(data_dict)
+
+    if 'mimetype' not in data_dict:
+        if hasattr(upload, 'mimetype'):
+            data_dict['mimetype'] = upload.mimetype
+
+    if 'size' not in data_dict and 'url_type' in data_dict:
+        if hasattr(upload, 'filesize'):
+            data_dict['size'] = upload.filesize
+
+    package_plugin = lib_plugins.lookup_package_plugin(pkg.type)
+    schema = context.get('schema') or package_plugin.update_package_schema()
+    data, errors = _validate(data_dict, schema['resources'], context)
+    if errors:
+        session.rollback()
+        raise ValidationError(errors)
+    data['id'] = resource.id
+
+    resource_obj = model_save.resource_dict_save(data, context)
+
+    #avoid revisioning by updating directly
+    session.query(model.Package).filter_by(id=pkg.id).update(
+        {"metadata_modified": datetime.datetime.utcnow()})
+    session.flush()
+    session.refresh(pkg)
+
+    package_plugins = list(
+        plugins.PluginImplementations(plugins.IPackageController))
+    pkg_dict = None
+    if package_plugins:
+        pkg_dict = _get_action('package_show')(
+            dict(context, use_cache=False, for_view=False), {'id': pkg.id})
+    for item in package_plugins:
+        item.edit(pkg)
+
+        item.after_update(context, pkg_dict)
+
+    activity.add_package_activity(context, pkg, 'changed')
+
+    upload.upload(resource_obj.id, uploader.get_max_resource_size())
+
+    if not context.get('defer_commit'):
+        model.repo.commit()
+
+    resource_dict = model_dictize.resource_dictize(resource_obj, context)
+    for plugin in plugins.PluginImplementations(plugins.IResourceController):
+        plugin.before_show(resource_dict)
+
+    if old_resource_format != resource_dict['format']:
+        if pkg_dict is None:
+            pkg_dict = _get_action('package_show')(
+                dict(context, use_cache=False), {'id': pkg.id})
+        _get_action('resource_create_default_resource_views')(
+            {'model': context['model'], 'user': context['user'],
+             'ignore_auth': True},
+            {'package': pkg_dict,
+             'resource': resource_dict})
+
+    for plugin in plugins.PluginImplementations(plugins.IResourceController):
+        plugin.after_update(context, resource_dict)
+
+    return resource_dict
+
+
 def resource_view_update(context, data_dict):
     '''Update a resource view.
 
@@ -194,23 +315,7 @@ def resource_view_reorder(context, data_dict):
 
     _check_access('resource_view_reorder', context, data_dict)
 
-    q = model.Session.query(model.ResourceView.id).filter_by(resource_id=id)
-    existing_views = [res[0] for res in
-                      q.order_by(model.ResourceView.order).all()]
-    ordered_views = []
-    for view in order:
-        try:
-            existing_views.remove(view)
-            ordered_views.append(view)
-        except ValueError:
-            raise ValidationError(
-                {"order": "View {view} does not exist".format(view=view)}
-            )
-    new_order = ordered_views + existing_views
-
-    for num, view in enumerate(new_order):
-        model.Session.query(model.ResourceView).\
-            filter_by(id=view).update({"order": num + 1})
+    new_order = view_order.reorder(model, id, order)
     model.Session.commit()
     return {'id': id, 'order': new_order}
 
@@ -238,6 +343,10 @@ def package_update(context, data_dict):
 
     :param id: the name or id of the dataset to update
     :type id: string
+    :param return_mode: what to return, ``'show'``, ``'id'``, ``'saved'`` or
+        ``'changed'``, see :py:mod:`ckanext.sdbi.responses` (optional,
+        default: ``'show'``)
+    :type return_mode: string
 
     :returns: the updated dataset (if ``'return_package_dict'`` is ``True`` in
               the context, which is the default. Otherwise returns just the
@@ -246,7 +355,7 @@ def package_update(context, data_dict):
 
     '''
     model = context['model']
-    session = context['session']
+    return_mode = responses.get_return_mode(context, data_dict)
     name_or_id = data_dict.get('id') or data_dict.get('name')
     if name_or_id is None:
         raise ValidationError({'id': _('Missing value')})
@@ -262,7 +371,6 @@ def package_update(context, data_dict):
 
     _check_access('package_update', context, data_dict)
 
-    user = context['user']
     # get the schema
     package_plugin = lib_plugins.lookup_package_plugin(pkg.type)
     if 'schema' in context:
@@ -313,15 +421,17 @@ def package_update(context, data_dict):
     model.Session.query(model.Package).filter_by(id=pkg.id).update(
         {"metadata_modified": datetime.datetime.utcnow()})
     model.Session.refresh(pkg)
+    before = responses.package_columns(pkg) if return_mode == 'changed' \
+        else None
 
     pkg = model_save.package_dict_save(data, context)
 
     context_org_update = context.copy()
     context_org_update['ignore_auth'] = True
     context_org_update['defer_commit'] = True
-    _get_action('package_owner_org_update')(context_org_update,
-                                            {'id': pkg.id,
-                                             'organization_id': pkg.owner_org})
+    package_owner_org_update(context_org_update,
+                             {'id': pkg.id,
+                              'organization_id': pkg.owner_org})
 
     # Needed to let extensions know the new resources ids
     model.Session.flush()
@@ -337,39 +447,24 @@ def package_update(context, data_dict):
         item.after_update(context, data)
 
     # Create activity
-    if not pkg.private:
-        user_obj = model.User.by_name(user)
-        if user_obj:
-            user_id = user_obj.id
-        else:
-            user_id = 'not logged in'
-
-        activity = pkg.activity_stream_item('changed', user_id)
-        session.add(activity)
-
-    if pkg.private:
-        user_obj = model.User.by_name(user)
-        if user_obj:
-            user_id = user_obj.id
-        else:
-            user_id = 'not logged in'
-
-        activity = pkg.activity_stream_item('changed', user_id)
-        session.add(activity)
+    activity.add_package_activity(context, pkg, 'changed')
 
     if not context.get('defer_commit'):
         model.repo.commit()
 
     log.debug('Updated object %s' % pkg.name)
 
-    return_id_only = context.get('return_id_only', False)
-
     # Make sure that a user provided schema is not used on package_show
     context.pop('schema', None)
 
+    if return_mode == 'saved':
+        return responses.saved_package_dict(pkg, data)
+    if return_mode == 'changed':
+        return responses.changed_package_dict(pkg, data, before, data_dict)
+
     # we could update the dataset so we should still be able to read it.
     context['ignore_auth'] = True
-    output = data_dict['id'] if return_id_only \
+    output = data_dict['id'] if return_mode == 'id' \
             else _get_action('package_show')(context, {'id': data_dict['id']})
 
     return output
@@ -457,7 +552,14 @@ def package_revise(context, data_dict):
         update__resources__1492a={"name": "edits here", "url": "http://example.com"}
 
 
-    :returns: a dict containing 'package':the updated dataset with fields filtered by include parameter
+    When the filter and update leave the dataset as it was, nothing is
+    written, no activity is recorded and the dataset is not reindexed.
+    When only one existing resource changed, just that resource is saved
+    (see :py:func:`resource_update`).
+
+    :returns: a dict containing 'package':the updated dataset with fields
+        filtered by include parameter and 'status': ``"updated"`` or
+        ``"no change"``
     :rtype: dictionary
 
     '''
@@ -469,11 +571,7 @@ def package_revise(context, data_dict):
         model.Session.rollback()
         raise ValidationError(errors)
 
-    name_or_id = (
-        data['match__'].get('id') or
-        data.get('match', {}).get('id') or
-        data['match__'].get('name') or
-        data.get('match', {}).get('name'))
+    name_or_id = _revise_name_or_id(data)
     if name_or_id is None:
         raise ValidationError({'match__id': _('Missing value')})
 
@@ -486,7 +584,71 @@ def package_revise(context, data_dict):
         {'id': name_or_id})
 
     pkg = package_show_context['package']  # side-effect of package_show
+    before = copy.deepcopy(orig)
+
+    try:
+        _revise_dict(orig, data)
+    except ValidationError:
+        model.Session.rollback()
+        raise
+
+    _check_access('package_revise', context, {"update": orig})
+
+    changed = _changed_keys(before, orig)
+    if not changed:
+        # Release the row lock taken by package_show
+        model.Session.rollback()
+        rval = {'package': orig}
+        status = 'no change'
+    else:
+        resource = None
+        if changed == ['resources'] and _use_in_place_update(
+                dict(context, in_place=True), pkg):
+            resource = _single_changed_resource(
+                before['resources'], orig['resources'])
+        if resource is not None:
+            resource_update(dict(context, in_place=True), resource)
+            package = _get_action('package_show')(
+                dict(context, use_cache=False), {'id': pkg.id})
+        else:
+            package = _get_action('package_update')(
+                dict(context, package=pkg), orig)
+        rval = {'package': package}
+        status = 'updated'
+
+    if 'include' in data_dict:
+        dfunc.filter_glob_match(rval, data_dict['include'])
+    rval['status'] = status
+    return rval
 
+
+def _changed_keys(before, after):
+    '''Top level keys of a dataset dict whose value differs'''
+    return sorted(key for key in set(before) | set(after)
+                  if before.get(key, _missing) != after.get(key, _missing))
+
+
+def _single_changed_resource(before, after):
+    '''The only modified resource, or None
+
+    None unless both lists hold the same resources in the same order and
+    exactly one of them changed.
+    '''
+    if [r.get('id') for r in before] != [r.get('id') for r in after]:
+        return None
+    changed = [new for old, new in zip(before, after) if old != new]
+    if len(changed) != 1 or not changed[0].get('id'):
+        return None
+    return changed[0]
+
+
+def _revise_dict(orig, data):
+    '''Check the match and apply the filter and update of a validated
+    :py:func:`package_revise` data dict to ``orig`` in place
+
+    Raises ValidationError if the dataset does not match or the update
+    cannot be applied.
+    '''
     unmatched = []
     if 'match' in data:
         unmatched.extend(dfunc.check_dict(orig, data['match']))
@@ -495,7 +657,6 @@ def package_revise(context, data_dict):
         unmatched.extend(dfunc.check_string_key(orig, k, v))
 
     if unmatched:
-        model.Session.rollback()
         raise ValidationError([{'match': [
             '__'.join(str(p) for p in unm)
             for unm in unmatched
@@ -510,7 +671,6 @@ def package_revise(context, data_dict):
         try:
             dfunc.update_merge_dict(orig, data['update'])
         except dfunc.DataError as de:
-            model.Session.rollback()
             raise ValidationError([{'update': [de.error]}])
 
     # update __extend keys before __#__* so that files may be
@@ -521,21 +681,168 @@ def package_revise(context, data_dict):
                 key=lambda s: s[0][-6] if s[0].endswith('extend') else s[0]):
             dfunc.update_merge_string_key(orig, k, v)
     except dfunc.DataError as de:
-        model.Session.rollback()
         raise ValidationError([{k: [de.error]}])
 
-    _check_access('package_revise', context, {"update": orig})
 
-    # future-proof return dict by putting package data under
-    # "package". We will want to return activity info
-    # on update or "nothing changed" status once possible
-    rval = {
-        'package': _get_action('package_update')(
-            dict(context, package=pkg),
-            orig)}
-    if 'include' in data_dict:
-        dfunc.filter_glob_match(rval, data_dict['include'])
-    return rval
+def _revise_name_or_id(data):
+    '''The dataset id or name a validated revise data dict matches on'''
+    return (
+        data['match__'].get('id') or
+        data.get('match', {}).get('id') or
+        data['match__'].get('name') or
+        data.get('match', {}).get('name'))
+
+
+def package_revise_many(context, data_dict):
+    '''Revise many datasets at once, e.g. for ETL jobs.
+
+    Each revision takes the same ``match``, ``filter`` and ``update``
+    parameters (or flattened keys) as :py:func:`package_revise`. The
+    datasets of a chunk are loaded and locked with one query, revisions that
+    leave their dataset as it was are skipped, the others are saved with
+    :py:func:`package_update` in one transaction per chunk and the search
+    index is updated with a single commit at the end.
+
+    A revision that does not match or fails validation does not stop the
+    others; every revision runs in its own savepoint.
+
+    :param revisions: the revisions to apply
+    :type revisions: list of dictionaries
+    :param chunk_size: how many revisions to save per transaction
+        (optional, default: ``ckanext.sdbi.bulk.chunk_size`` or 200)
+    :type chunk_size: int
+
+    :returns: ``results``, one dictionary per revision in the order they
+        were given, with the dataset ``id`` (``None`` if it was not found)
+        and the ``status``: ``"updated"``, ``"no change"`` or ``"error"``,
+        in which case ``errors`` holds the validation errors
+    :rtype: dictionary
+
+    '''
+    model = context['model']
+
+    revisions = _get_or_bust(data_dict, 'revisions')
+    if not isinstance(revisions, list):
+        raise ValidationError({'revisions': [_('Must be a list')]})
+
+    # Looked up once and shared by the copies of the context
+    activity.acting_user(context)
+
+    results = [None] * len(revisions)
+    for chunk in bulk.chunks(list(enumerate(revisions)),
+                             bulk.chunk_size(data_dict)):
+        try:
+            chunk_results = _package_revise_chunk(context, chunk)
+        except Exception as e:
+            model.Session.rollback()
+            if len(chunk) == 1:
+                log.error(f"Error revising dataset {chunk[0][0]}: {str(e)}")
+                chunk_results = [(chunk[0][0], {
+                    'id': None, 'status': 'error',
+                    'errors': {'message': str(e)}})]
+            else:
+                log.warning(
+                    f"Error saving chunk, retrying one by one: {str(e)}")
+                chunk_results = []
+                for item in chunk:
+                    try:
+                        chunk_results.extend(
+                            _package_revise_chunk(context, [item]))
+                    except Exception as e:
+                        model.Session.rollback()
+                        log.error(
+                            f"Error revising dataset {item[0]}: {str(e)}")
+                        chunk_results.append((item[0], {
+                            'id': None, 'status': 'error',
+                            'errors': {'message': str(e)}}))
+
+        for index, result in chunk_results:
+            results[index] = result
+
+    bulk.index_packages([result['id'] for result in results
+                         if result['status'] == 'updated'])
+
+    return {'results': results}
+
+
+def _package_revise_chunk(context, chunk):
+    '''Apply and save one chunk of :py:func:`package_revise_many`
+
+    Returns the (index, result) of each revision; raises if committing the
+    chunk fails.
+    '''
+    model = context['model']
+    session = context['session']
+    schema = schema_.package_revise_schema()
+
+    validated = []
+    for index, revision in chunk:
+        data, errors = _validate(revision, schema, context)
+        if not errors and _revise_name_or_id(data) is None:
+            errors = {'match__id': [_('Missing value')]}
+        validated.append((index, data, errors))
+
+    # Load and lock all the datasets of the chunk at once
+    keys = set(_revise_name_or_id(data) for index, data, errors in validated
+               if not errors)
+    packages = {}
+    if keys:
+        for pkg in session.query(model.Package).filter(or_(
+                model.Package.id.in_(keys),
+                model.Package.name.in_(keys))).with_for_update():
+            packages[pkg.id] = pkg
+            packages[pkg.name] = pkg
+
+    results = []
+    for index, data, errors in validated:
+        if errors:
+            results.append((index, {'id': None, 'status': 'error',
+                                    'errors': errors}))
+            continue
+        pkg = packages.get(_revise_name_or_id(data))
+        if pkg is None:
+            results.append((index, {
+                'id': None, 'status': 'error',
+                'errors': {'match': [_('Package was not found.')]}}))
+            continue
+
+        savepoint = session.begin_nested()
+        try:
+            # The package is in the identity map, so it is not queried again
+            orig = _get_action('package_show')(
+                dict(context, return_type='dict', use_cache=False),
+                {'id': pkg.id})
+            before = copy.deepcopy(orig)
+            _revise_dict(orig, data)
+            _check_access('package_revise', context, {"update": orig})
+
+            if not _changed_keys(before, orig):
+                savepoint.rollback()
+                results.append((index, {'id': pkg.id,
+                                        'status': 'no change'}))
+                continue
+
+            package_update(dict(context, package=pkg, defer_commit=True,
+                                return_mode='id'), orig)
+            savepoint.commit()
+        except (ValidationError, NotAuthorized) as e:
+            # package_update already rolled back the savepoint on
+            # validation errors
+            if savepoint.is_active:
+                savepoint.rollback()
+            errors = e.error_dict if isinstance(e, ValidationError) \
+                else {'message': [str(e) or _('Not authorized')]}
+            results.append((index, {'id': pkg.id, 'status': 'error',
+                                    'errors': errors}))
+            continue
+        except Exception:
+            if savepoint.is_active:
+                savepoint.rollback()
+            raise
+        results.append((index, {'id': pkg.id, 'status': 'updated'}))
+
+    bulk.commit_deferring_search(session)
+    return results
 
 
 def package_resource_reorder(context, data_dict):
@@ -547,8 +854,14 @@ def package_resource_reorder(context, data_dict):
     :type id: string
     :param order: a list of resource ids in the order needed
     :type order: list
+
+    Only the positions of the resources that moved are updated, in a single
+    statement, and the dataset is reindexed once.
     '''
 
+    model = context['model']
+    session = context['session']
+
     id = _get_or_bust(data_dict, "id")
     order = _get_or_bust(data_dict, "order")
     if not isinstance(order, list):
@@ -557,29 +870,69 @@ def package_resource_reorder(context, data_dict):
     if len(set(order)) != len(order):
         raise ValidationError({'order': 'Must supply unique resource_ids'})
 
-    package_dict = _get_action('package_show')(context, {'id': id})
-    existing_resources = package_dict.get('resources', [])
-    ordered_resources = []
+    pkg = model.Package.get(id)
+    if pkg is None:
+        raise NotFound(_('Package was not found.'))
+
+    _check_access('package_resource_reorder', context,
+                  {'id': pkg.id, 'order': order})
+
+    # Lock the dataset so concurrent reorders and appends do not interleave
+    session.query(model.Package.id).filter_by(id=pkg.id) \
+        .with_for_update().first()
+    current = session.query(model.Resource.id, model.Resource.position) \
+        .filter(model.Resource.package_id == pkg.id) \
+        .filter(model.Resource.state == 'active') \
+        .order_by(model.Resource.position).all()
+    positions = dict(current)
 
     for resource_id in order:
-        for i in range(0, len(existing_resources)):
-            if existing_resources[i]['id'] == resource_id:
-                resource = existing_resources.pop(i)
-                ordered_resources.append(resource)
-                break
-        else:
+        if resource_id not in positions:
             raise ValidationError(
                 {'order':
                  'resource_id {id} can not be found'.format(id=resource_id)}
             )
+    requested = set(order)
+    new_order = list(order) + [resource_id for resource_id, position
+                               in current if resource_id not in requested]
+
+    # Only the resources that moved are written
+    changes = dict((resource_id, num) for num, resource_id
+                   in enumerate(new_order) if positions[resource_id] != num)
+    if changes:
+        session.query(model.Resource) \
+            .filter(model.Resource.id.in_(list(changes))) \
+            .update({model.Resource.position: case(
+                changes, value=model.Resource.id)},
+                synchronize_session=False)
+
+        #avoid revisioning by updating directly
+        session.query(model.Package).filter_by(id=pkg.id).update(
+            {"metadata_modified": datetime.datetime.utcnow()})
+        session.flush()
+        session.refresh(pkg)
+        session.expire(pkg, ['resources_all'])
+
+        package_plugins = list(
+            plugins.PluginImplementations(plugins.IPackageController))
+        if package_plugins:
+            pkg_dict = _get_action('package_show')(
+                dict(context, use_cache=False, for_view=False),
+                {'id': pkg.id})
+        for item in package_plugins:
+            item.edit(pkg)
+
+            item.after_update(context, pkg_dict)
+
+        activity.add_package_activity(context, pkg, 'changed')
+        model.repo.commit()
 
-    new_resources = ordered_resources + existing_resources
-    package_dict['resources'] = new_resources
-
-    _check_access('package_resource_reorder', context, package_dict)
-    _get_action('package_update')(context, package_dict)
+        # The updates above bypass the ORM, so nothing triggers a reindex
+        bulk.index_packages([pkg.id])
+    else:
+        session.commit()
 
-    return {'id': id, 'order': [resource['id'] for resource in new_resources]}
+    return {'id': id, 'order': new_order}
 
 
 def _update_package_relationship(relationship, comment, context):
@@ -722,7 +1075,7 @@ def _group_or_org_update(context, data_dict, is_org=False):
         activity_type = 'changed group'
 
     activity_dict = {
-            'user_id': model.User.by_name(six.ensure_text(user)).id,
+            'user_id': activity.acting_user(context).id,
             'object_id': group.id,
             'activity_type': activity_type,
             }
@@ -977,32 +1330,82 @@ def task_status_update(context, data_dict):
 
     task_status = model_save.task_status_dict_save(data, context)
 
-    session.commit()
-    session.close()
+    if not context.get('defer_commit'):
+        session.commit()
+        session.close()
     return model_dictize.task_status_dictize(task_status, context)
 
 def task_status_update_many(context, data_dict):
     '''Update many task statuses at once.
 
+    All the task statuses are validated first; they are then written with
+    one ``INSERT ... ON CONFLICT (entity_id, task_type, key) DO UPDATE``
+    per chunk and committed once. A task status with the same
+    ``entity_id``, ``task_type`` and ``key`` as an existing one updates it,
+    whatever its ``id``.
+
     :param data: the task_status dictionaries to update, for the format of task
         status dictionaries see
         :py:func:`~task_status_update`
     :type data: list of dictionaries
+    :param chunk_size: how many task statuses to write per statement
+        (optional, default: ``ckanext.sdbi.bulk.chunk_size`` or 200)
+    :type chunk_size: int
 
     :returns: the updated task statuses
     :rtype: list of dictionaries
 
     '''
-    results = []
     model = context['model']
-    deferred = context.get('defer_commit')
-    context['defer_commit'] = True
-    for data in data_dict['data']:
-        results.append(_get_action('task_status_update')(context, data))
-    if not deferred:
-        context.pop('defer_commit')
+    session = context['session']
+
+    items = _get_or_bust(data_dict, 'data')
+    if not isinstance(items, list):
+        raise ValidationError({'data': [_('Must be a list')]})
+
+    _check_access('task_status_update', context, data_dict)
+
+    schema = context.get('schema') or schema_.default_task_status_schema()
+    rows = []
+    errors = []
+    for item in items:
+        data, item_errors = _validate(item, schema, context)
+        errors.append(item_errors)
+        rows.append(data)
+    if any(errors):
+        session.rollback()
+        raise ValidationError({'data': errors})
+
+    # A statement cannot update the same row twice, the last one wins
+    latest = {}
+    for data in rows:
+        latest[(data['entity_id'], data['task_type'], data['key'])] = data
+    rows = list(latest.values())
+
+    table = model.task_status_table
+    results = []
+    for chunk in bulk.chunks(rows, bulk.chunk_size(data_dict)):
+        # Only the fields given are set on conflict, so group the rows
+        # by the fields they have
+        groups = {}
+        for data in chunk:
+            values = dict((column.name, data[column.name])
+                          for column in table.c if column.name in data)
+            values['id'] = values.get('id') or make_uuid()
+            groups.setdefault(tuple(sorted(values)), []).append(values)
+
+        for columns, values in groups.items():
+            statement = postgresql.insert(table).values(values)
+            statement = statement.on_conflict_do_update(
+                index_elements=['entity_id', 'task_type', 'key'],
+                set_=dict((name, statement.excluded[name])
+                          for name in columns if name != 'id'))
+            for row in session.execute(statement.returning(*table.c)):
+                results.append(
+                    model_dictize.task_status_dictize(row, context))
+
     if not context.get('defer_commit'):
-        model.Session.commit()
+        session.commit()
     return {'results': results}
 
 def term_translation_update(context, data_dict):
@@ -1202,32 +1605,73 @@ def package_owner_org_update(context, data_dict):
         org = None
         pkg.owner_org = None
 
-    members = model.Session.query(model.Member) \
-        .filter(model.Member.table_id == pkg.id) \
-        .filter(model.Member.capacity == 'organization')
-
-    need_update = True
-    for member_obj in members:
-        if org and member_obj.group_id == org.id:
-            need_update = False
-        else:
-            member_obj.state = 'deleted'
-            member_obj.save()
-
-    # add the organization to member table
-    if org and need_update:
-        member_obj = model.Member(table_id=pkg.id,
-                                  table_name='package',
-                                  group=org,
-                                  capacity='organization',
-                                  group_id=org.id,
-                                  state='active')
-        model.Session.add(member_obj)
+    _reconcile_owner_org_members(context, [pkg.id], org.id if org else None)
 
     if not context.get('defer_commit'):
         model.Session.commit()
 
 
+def _reconcile_owner_org_members(context, package_ids, org_id):
+    '''Make ``org_id`` the only active organization membership of packages
+
+    Stale memberships are marked deleted with one UPDATE and the missing
+    ones added with one multi-row INSERT, instead of saving member rows one
+    by one. Nothing is committed.
+    '''
+    model = context['model']
+    session = model.Session
+    if not package_ids:
+        return
+
+    current = set()
+    if org_id:
+        current = set(table_id for (table_id,) in
+                      session.query(model.Member.table_id)
+                      .filter(model.Member.table_id.in_(package_ids))
+                      .filter(model.Member.capacity == 'organization')
+                      .filter(model.Member.group_id == org_id)
+                      .filter(model.Member.state == 'active'))
+
+    stale = session.query(model.Member) \
+        .filter(model.Member.table_id.in_(package_ids)) \
+        .filter(model.Member.capacity == 'organization') \
+        .filter(model.Member.state != 'deleted')
+    if org_id:
+        stale = stale.filter(model.Member.group_id != org_id)
+    stale.update({'state': 'deleted'}, synchronize_session=False)
+
+    if org_id:
+        new_rows = [{'id': make_uuid(), 'table_id': package_id,
+                     'table_name': 'package', 'group_id': org_id,
+                     'capacity': 'organization', 'state': 'active'}
+                    for package_id in package_ids
+                    if package_id not in current]
+        if new_rows:
+            session.execute(model.member_table.insert().values(new_rows))
+
+
+def _package_owner_org_update_many(context, package_ids, org_id):
+    '''Move many datasets to one organization in a single transaction
+
+    Sets ``owner_org`` with one UPDATE and reconciles the memberships with
+    :py:func:`_reconcile_owner_org_members`; ``org_id`` may be None to
+    remove the datasets from their organization. Commits unless
+    ``defer_commit`` is set in the context; the datasets are not reindexed.
+    '''
+    model = context['model']
+    session = model.Session
+
+    session.query(model.Package) \
+        .filter(model.Package.id.in_(package_ids)) \
+        .update({'owner_org': org_id,
+                 'metadata_modified': datetime.datetime.utcnow()},
+                synchronize_session='fetch')
+    _reconcile_owner_org_members(context, package_ids, org_id)
+
+    if not context.get('defer_commit'):
+        bulk.commit_deferring_search(session)
+
+
 def _bulk_update_dataset(context, data_dict, update_dict):
     ''' Bulk update shared code for organizations'''
 
@@ -1241,54 +1685,54 @@ def _bulk_update_dataset(context, data_dict, update_dict):
         .update(update_dict, synchronize_session=False)
 
     # Handle Activity Stream for Bulk Operations
-    user = context['user']
-    user_obj = model.User.by_name(user)
-    if user_obj:
-        user_id = user_obj.id
-    else:
-        user_id = 'not logged in'
     for dataset in datasets:
         entity = model.Package.get(dataset)
-        activity = entity.activity_stream_item('changed', user_id)
-        model.Session.add(activity)
+        activity.add_package_activity(context, entity, 'changed')
     model.Session.commit()
 
     # solr update here
     psi = search.PackageSearchIndex()
 
     # update the solr index in batches
-    BATCH_SIZE = 50
+    batch_size = bulk.index_batch_size()
+    started = time.time()
+    indexed = 0
 
-    def process_solr(q):
-        # update the solr index for the query
+    def fetch_solr(ids):
+        # fetch the stored documents of one batch from solr
         query = search.PackageSearchQuery()
         q = {
-            'q': q,
+            'q': ' OR '.join('id:"%s"' % id for id in ids),
             'fl': 'data_dict',
             'wt': 'json',
             'fq': 'site_id:"%s"' % config.get('ckan.site_id'),
-            'rows': BATCH_SIZE
+            'rows': len(ids)
         }
-
-        for result in query.run(q)['results']:
-            data_dict = json.loads(result['data_dict'])
-            if data_dict['owner_org'] == org_id:
-                data_dict.update(update_dict)
-                psi.index_package(data_dict, defer_commit=True)
-
-    count = 0
-    q = []
-    for id in datasets:
-        q.append('id:"%s"' % (id))
-        count += 1
-        if count % BATCH_SIZE == 0:
-            process_solr(' OR '.join(q))
-            q = []
-    if len(q):
-        process_solr(' OR '.join(q))
+        return query.run(q)['results']
+
+    # fetch batch N+1 while batch N is being indexed
+    batches = list(bulk.chunks(list(datasets), batch_size))
+    with ThreadPoolExecutor(max_workers=1,
+                            thread_name_prefix='sdbi-solr') as executor:
+        pending = executor.submit(fetch_solr, batches[0]) if batches else None
+        for number in range(len(batches)):
+            results = pending.result()
+            if number + 1 < len(batches):
+                pending = executor.submit(fetch_solr, batches[number + 1])
+
+            for result in results:
+                data_dict = bulk.json_loads(result['data_dict'])
+                if data_dict['owner_org'] == org_id:
+                    data_dict.update(update_dict)
+                    psi.index_package(data_dict, defer_commit=True)
+                    indexed += 1
     # finally commit the changes
     psi.commit()
 
+    elapsed = time.time() - started
+    log.info(f"Bulk update reindexed {indexed} of {len(datasets)} datasets "
+             f"in {elapsed:.2f}s "
+             f"({indexed / elapsed if elapsed else 0:.1f} datasets/s)")
 
 def bulk_update_private(context, data_dict):
     ''' Make a list of datasets private
@@ -1298,9 +1742,20 @@ def bulk_update_private(context, data_dict):
 
     :param org_id: id of the owning organization
     :type org_id: int
+
+    :param background: run as a background job and return its id, see
+        :py:mod:`ckanext.sdbi.bulk_jobs` (optional, default:
+        ``ckanext.sdbi.bulk.background`` or ``False``)
+    :type background: bool
+
+    :returns: the ``job_id`` of the queued job when run in the background
+    :rtype: dictionary
     '''
 
     _check_access('bulk_update_private', context, data_dict)
+    if bulk_jobs.in_background(data_dict):
+        return bulk_jobs.enqueue(context, data_dict, 'private',
+                                 {'private': True})
     _bulk_update_dataset(context, data_dict, {'private': True})
 
 def bulk_update_public(context, data_dict):
@@ -1311,9 +1766,20 @@ def bulk_update_public(context, data_dict):
 
     :param org_id: id of the owning organization
     :type org_id: int
+
+    :param background: run as a background job and return its id, see
+        :py:mod:`ckanext.sdbi.bulk_jobs` (optional, default:
+        ``ckanext.sdbi.bulk.background`` or ``False``)
+    :type background: bool
+
+    :returns: the ``job_id`` of the queued job when run in the background
+    :rtype: dictionary
     '''
 
     _check_access('bulk_update_public', context, data_dict)
+    if bulk_jobs.in_background(data_dict):
+        return bulk_jobs.enqueue(context, data_dict, 'public',
+                                 {'private': False})
     _bulk_update_dataset(context, data_dict, {'private': False})
 
 def bulk_update_delete(context, data_dict):
@@ -1324,12 +1790,124 @@ def bulk_update_delete(context, data_dict):
 
     :param org_id: id of the owning organization
     :type org_id: int
+
+    :param background: run as a background job and return its id, see
+        :py:mod:`ckanext.sdbi.bulk_jobs` (optional, default:
+        ``ckanext.sdbi.bulk.background`` or ``False``)
+    :type background: bool
+
+    :returns: the ``job_id`` of the queued job when run in the background
+    :rtype: dictionary
     '''
 
     _check_access('bulk_update_delete', context, data_dict)
+    if bulk_jobs.in_background(data_dict):
+        return bulk_jobs.enqueue(context, data_dict, 'delete',
+                                 {'state': 'deleted'})
     _bulk_update_dataset(context, data_dict, {'state': 'deleted'})
 
 
+@logic.side_effect_free
+def bulk_update_status(context, data_dict):
+    ''' Progress of a bulk update running as a background job
+
+    :param id: the job id returned by ``bulk_update_private``,
+        ``bulk_update_public`` or ``bulk_update_delete``
+    :type id: string
+
+    :returns: the ``state`` of the job (``queued``, ``running``, ``done`` or
+        ``error``), the ``done`` and ``total`` number of datasets, the
+        ``rate`` in datasets per second and the ``eta`` in seconds
+    :rtype: dictionary
+    '''
+    job_id = _get_or_bust(data_dict, 'id')
+    status = bulk_jobs.status(job_id)
+    if status is None:
+        raise NotFound(_('Job was not found.'))
+    _check_access('bulk_update_public', context, {'org_id': status['org_id']})
+    return status
+
+
+def bulk_update_resume(context, data_dict):
+    ''' Queue an interrupted or failed bulk update job again
+
+    The job carries on after the last chunk it finished.
+
+    :param id: the job id returned by ``bulk_update_private``,
+        ``bulk_update_public`` or ``bulk_update_delete``
+    :type id: string
+
+    :returns: the progress of the job, as returned by ``bulk_update_status``
+    :rtype: dictionary
+    '''
+    job_id = _get_or_bust(data_dict, 'id')
+    status = bulk_jobs.status(job_id)
+    if status is None:
+        raise NotFound(_('Job was not found.'))
+    _check_access('bulk_update_public', context, {'org_id': status['org_id']})
+    if status['state'] == 'done':
+        raise ValidationError({'id': [_('Job has already finished.')]})
+    bulk_jobs.resume(job_id)
+    return bulk_jobs.status(job_id)
+
+
+def bulk_update_owner_org(context, data_dict):
+    ''' Move a list of datasets to another organization
+
+    ``owner_org`` and the organization memberships are updated set-wise in
+    one transaction, the activities are inserted in bulk and the moved
+    datasets are reindexed in parallel batches, logging the progress.
+
+    :param datasets: list of ids of the datasets to move
+    :type datasets: list of strings
+
+    :param org_id: id of the current owning organization
+    :type org_id: string
+
+    :param new_org_id: id or name of the organization to move them to
+    :type new_org_id: string
+
+    :returns: ``datasets``, the ids of the datasets that were moved (those
+        of ``datasets`` owned by ``org_id``), and ``index_errors``, the ids
+        of the moved datasets that could not be reindexed
+    :rtype: dictionary
+    '''
+    model = context['model']
+    session = context['session']
+
+    datasets, org_id, new_org_id = \
+        _get_or_bust(data_dict, ['datasets', 'org_id', 'new_org_id'])
+
+    new_org = model.Group.get(new_org_id)
+    if new_org is None or not new_org.is_organization:
+        raise NotFound(_('Organization was not found.'))
+
+    # Moving datasets takes bulk update rights on both organizations
+    _check_access('bulk_update_public', context, {'org_id': org_id})
+    _check_access('bulk_update_public', context, {'org_id': new_org.id})
+
+    packages = session.query(model.Package) \
+        .filter(model.Package.id.in_(datasets)) \
+        .filter(model.Package.owner_org == org_id).all()
+    package_ids = [pkg.id for pkg in packages]
+    if not package_ids or new_org.id == org_id:
+        return {'datasets': [], 'index_errors': []}
+
+    _package_owner_org_update_many(
+        dict(context, defer_commit=True), package_ids, new_org.id)
+
+    # Handle Activity Stream for Bulk Operations
+    user_id = activity.acting_user_id(context)
+    activities = [item for item in
+                  (pkg.activity_stream_item('changed', user_id)
+                   for pkg in packages) if item is not None]
+    session.bulk_save_objects(activities)
+    bulk.commit_deferring_search(session)
+
+    failed = bulk.index_packages_parallel(package_ids)
+    return {'datasets': package_ids, 'index_errors': failed}
+
+
 def config_option_update(context, data_dict):
     '''
 
@@ -0,0 +1,150 @@
+'''Streaming resource uploads.
+
+With ``ckanext.sdbi.upload.streaming = true``, files uploaded to
+``resource_create`` (and always for ``resource_create_many``) are written to
+the local resource storage before the database transaction starts. The
+files are copied in 1 MB chunks on a thread pool
+(``ckanext.sdbi.upload.workers``, default ``4``), hashing as they go, so
+``size`` and ``hash`` (the sha256 hex digest) are filled in automatically and
+several files of one request are written in parallel. The resources get
+pre-generated ids so the files can land at their final path; if the
+database work then fails, the files are removed again.
+
+Only CKAN's own local uploader is streamed; with an IUploader plugin
+(e.g. cloud storage) uploads go through that plugin as usual.
+'''
+
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import ckan.lib.uploader as uploader
+import ckan.logic as logic
+import ckan.plugins as plugins
+from ckan.common import _, asbool, config
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 2 ** 20
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def is_enabled():
+    return asbool(config.get('ckanext.sdbi.upload.streaming', False))
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            try:
+                workers = int(config.get('ckanext.sdbi.upload.workers', 4))
+            except ValueError:
+                workers = 4
+            _executor = ThreadPoolExecutor(max_workers=max(workers, 1),
+                                           thread_name_prefix='sdbi-upload')
+        return _executor
+
+
+def can_stream(resource):
+    """Whether the resource dict carries a file the local uploader stores"""
+    if not isinstance(resource.get('upload'), uploader.ALLOWED_UPLOAD_TYPES):
+        return False
+    if not uploader.get_storage_path():
+        return False
+    return not list(plugins.PluginImplementations(plugins.IUploader))
+
+
+def _write(upload, resource_id, max_size):
+    """Copy an upload to its storage path, returning (size, sha256)"""
+    directory = upload.get_directory(resource_id)
+    filepath = upload.get_path(resource_id)
+    os.makedirs(directory, exist_ok=True)
+
+    tmp_filepath = filepath + '~'
+    digest = hashlib.sha256()
+    size = 0
+    limit = max_size * 1024 * 1024
+    try:
+        with open(tmp_filepath, 'wb') as output_file:
+            upload.upload_file.seek(0)
+            while True:
+                data = upload.upload_file.read(CHUNK_SIZE)
+                if not data:
+                    break
+                size += len(data)
+                if size > limit:
+                    raise logic.ValidationError(
+                        {'upload': [_('File upload too large')]})
+                digest.update(data)
+                output_file.write(data)
+        os.replace(tmp_filepath, filepath)
+    except Exception:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
+    return size, digest.hexdigest()
+
+
+def store(resources):
+    """Write the uploaded files of resource dicts before any DB work
+
+    Resources that carry a streamable file get an id (unless they have one),
+    ``url``, ``url_type``, ``size``, ``hash`` and ``mimetype`` set and their
+    ``upload`` removed. Returns the paths written, for :py:func:`remove`.
+    Raises ValidationError, after removing what was written, if any file is
+    too large.
+    """
+    pending = []
+    for resource in resources:
+        if not can_stream(resource):
+            continue
+        # Takes the file out of the dict and sets url and url_type
+        upload = uploader.ResourceUpload(resource)
+        if not upload.filename:
+            continue
+        if not resource.get('id'):
+            resource['id'] = str(uuid.uuid4())
+        pending.append((resource, upload))
+
+    if not pending:
+        return []
+
+    executor = _get_executor()
+    max_size = uploader.get_max_resource_size()
+    futures = [(resource, upload,
+                executor.submit(_write, upload, resource['id'], max_size))
+               for resource, upload in pending]
+
+    written = []
+    error = None
+    for resource, upload, future in futures:
+        try:
+            size, digest = future.result()
+        except Exception as e:
+            error = error or e
+            continue
+        written.append(upload.get_path(resource['id']))
+        resource['size'] = size
+        resource['hash'] = digest
+        if not resource.get('mimetype') and upload.mimetype:
+            resource['mimetype'] = upload.mimetype
+
+    if error is not None:
+        remove(written)
+        raise error
+    return written
+
+
+def remove(paths):
+    """Remove files written by :py:func:`store` after a failed create"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError as e:
+            log.warning(f"Could not remove upload {path}: {str(e)}")
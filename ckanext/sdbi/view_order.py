@@ -0,0 +1,59 @@
+'''Ordering of resource views.
+
+``resource_view_create`` and ``resource_view_reorder`` both lock the
+resource row before reading the current orders, so concurrent creates
+cannot pick the same order and a reorder cannot interleave with a create.
+'''
+
+from sqlalchemy import case, func
+
+import ckan.logic as logic
+
+
+def lock_resource(model, resource_id):
+    """Lock a resource row until the end of the transaction"""
+    model.Session.query(model.Resource.id) \
+        .filter(model.Resource.id == resource_id) \
+        .with_for_update().first()
+
+
+def next_order(model, resource_id):
+    """Order for a new view of the resource, after the existing ones"""
+    lock_resource(model, resource_id)
+    max_order = model.Session.query(
+        func.max(model.ResourceView.order)
+    ).filter_by(resource_id=resource_id).scalar()
+    return 0 if max_order is None else max_order + 1
+
+
+def reorder(model, resource_id, order):
+    """Put the views in ``order`` first, the others after them
+
+    Only the views whose order changes are updated, in a single UPDATE.
+    Returns the new order of all the views.
+    """
+    lock_resource(model, resource_id)
+    current = model.Session.query(
+        model.ResourceView.id, model.ResourceView.order) \
+        .filter_by(resource_id=resource_id) \
+        .order_by(model.ResourceView.order).all()
+    current_order = dict(current)
+
+    for view in order:
+        if view not in current_order:
+            raise logic.ValidationError(
+                {"order": "View {view} does not exist".format(view=view)}
+            )
+    requested = set(order)
+    new_order = list(order) + [view for view, _ in current
+                               if view not in requested]
+
+    changes = dict((view, num + 1) for num, view in enumerate(new_order)
+                   if current_order[view] != num + 1)
+    if changes:
+        model.Session.query(model.ResourceView) \
+            .filter(model.ResourceView.id.in_(list(changes))) \
+            .update({model.ResourceView.order: case(
+                changes, value=model.ResourceView.id)},
+                synchronize_session=False)
+    return new_order